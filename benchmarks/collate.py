@@ -0,0 +1,70 @@
+"""
+Compares the time to collate a batch of variable length float32 signals
+with `padertorch.data.utils.pad_batch` against padding each signal with
+`np.pad` and stacking with `np.array`, for several batch sizes and signal
+lengths.
+
+Usage:
+    python benchmarks/collate.py [--channels 1] [--number 10]
+"""
+import argparse
+import timeit
+
+import numpy as np
+import torch
+
+from padertorch.data.utils import pad_batch
+
+
+def pad_and_stack(arrays):
+    target_length = max(array.shape[-1] for array in arrays)
+    arrays = [
+        np.pad(array, [(0, 0), (0, target_length - array.shape[-1])])
+        for array in arrays
+    ]
+    return np.array(arrays).astype(arrays[0].dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--number', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+
+    def timeit_ms(fn):
+        return min(timeit.repeat(
+            fn, number=args.number, repeat=3)) / args.number * 1000
+
+    candidates = {
+        'np.pad [ms]': pad_and_stack,
+        'pad_batch [ms]': pad_batch,
+        'tensor [ms]': lambda arrays: pad_batch(arrays, to_tensor=True),
+    }
+    if torch.cuda.is_available():
+        candidates['pinned [ms]'] = lambda arrays: pad_batch(
+            arrays, pin_memory=True)
+
+    print(
+        f'{"batch":>5} {"length":>7} '
+        + ' '.join(f'{name:>{len(name)}}' for name in candidates)
+    )
+    for batch_size in [4, 16, 64]:
+        for length in [16000, 64000, 160000]:
+            arrays = [
+                rng.randn(args.channels, n).astype(np.float32)
+                for n in rng.randint(length // 2, length + 1, size=batch_size)
+            ]
+            np.testing.assert_equal(pad_and_stack(arrays), pad_batch(arrays)[0])
+            print(
+                f'{batch_size:>5} {length:>7} '
+                + ' '.join(
+                    f'{timeit_ms(lambda: fn(arrays)):>{len(name)}.2f}'
+                    for name, fn in candidates.items()
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the real-time factor and the latency per chunk of the streaming mode
+of a causal `padertorch.modules.convnet.ConvNet` on the CPU and compares it
+with re-running the offline forward on a sliding window, that covers the
+receptive field and the new chunk. Because the sliding window is slow, it is
+only measured for `--window-chunks` chunks after the window is full.
+
+The real-time factor is the processing time of a chunk divided by the
+duration of the chunk, e.g. with 1000 frames per second for the Conv-TasNet
+encoder (8 kHz, shift of 8 samples).
+
+Usage:
+    python benchmarks/convnet_streaming.py [--frames 2000]
+        [--chunk-sizes 1 10 100] [--frames-per-second 1000]
+        [--batch-size 1] [--num-threads 1] [--window-chunks 10]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from padertorch.modules.convnet import ConvNet
+
+
+def get_context(convnet):
+    return sum(s.shape[-1] for s in convnet.init_state())
+
+
+def stream_with_state(convnet, x, chunk_size, latencies):
+    state = convnet.init_state(batch_size=x.shape[0])
+    for t in range(0, x.shape[1], chunk_size):
+        start = time.perf_counter()
+        _, state = convnet(x[:, t:t + chunk_size], state=state)
+        latencies.append(time.perf_counter() - start)
+
+
+def stream_sliding_window(convnet, x, chunk_size, latencies, num_chunks):
+    context = get_context(convnet)
+    for t in range(context, context + num_chunks * chunk_size, chunk_size):
+        start = time.perf_counter()
+        _ = convnet(x[:, t - context:t + chunk_size])[:, -chunk_size:]
+        latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument(
+        '--chunk-sizes', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--frames-per-second', type=float, default=1000)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--num-threads', type=int, default=1)
+    parser.add_argument('--window-chunks', type=int, default=10)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    convnet = ConvNet(norm='cLN', causal=True).eval()
+    context = get_context(convnet)
+    x = torch.randn(args.batch_size, args.frames, convnet.hidden_size)
+    x_window = torch.randn(
+        args.batch_size, context + args.window_chunks * max(args.chunk_sizes),
+        convnet.hidden_size,
+    )
+
+    with torch.no_grad():
+        offline = convnet(x[:, :200])
+        chunks = []
+        state = convnet.init_state(batch_size=args.batch_size)
+        for t in range(0, 200, 10):
+            y, state = convnet(x[:, t:t + 10], state=state)
+            chunks.append(y)
+        torch.testing.assert_close(
+            torch.cat(chunks, dim=1), offline, atol=1e-4, rtol=1e-4)
+
+    print(
+        f'B={args.batch_size}, T={args.frames}, threads={args.num_threads}, '
+        f'receptive field={1 + context} frames, '
+        f'{args.frames_per_second:g} frames/s',
+        flush=True,
+    )
+    candidates = {
+        'state': lambda chunk_size, latencies: stream_with_state(
+            convnet, x, chunk_size, latencies),
+        'sliding window': lambda chunk_size, latencies: stream_sliding_window(
+            convnet, x_window, chunk_size, latencies, args.window_chunks),
+    }
+    for chunk_size in args.chunk_sizes:
+        for name, fn in candidates.items():
+            with torch.no_grad():
+                fn(chunk_size, [])  # warmup
+                latencies = []
+                fn(chunk_size, latencies)
+            latencies = np.array(latencies) * 1000
+            rtf = latencies.mean() / (1000 * chunk_size / args.frames_per_second)
+            print(
+                f'chunk {chunk_size:4d}, {name:>14}: RTF {rtf:8.3f}, '
+                f'latency per chunk {latencies.mean():8.2f} ms '
+                f'(p95 {np.percentile(latencies, 95):8.2f} ms)',
+                flush=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares the loop based `overlap_add` and the `pb.array.segment_axis` based
+`segment` with the vectorized versions in `padertorch.modules.dual_path_rnn`
+for signal lengths from 1 s to 10 min.
+
+The lengths are given in seconds of audio and converted to encoder frames
+with the default TasNet encoder (8 kHz, hop size of 8 samples).
+
+Usage:
+    python benchmarks/dprnn_segment.py [--feature-size 64] [--window-size 100] [--hop-size 50]
+"""
+import argparse
+import timeit
+
+import torch
+import torch.nn.functional as F
+
+import paderbox as pb
+from padertorch.modules.dual_path_rnn import segment, overlap_add
+
+
+def loop_segment(signal, hop_size, window_size):
+    padding = window_size - hop_size
+    signal = F.pad(signal, [0, 0, padding, padding])
+    segmented = pb.array.segment_axis(
+        signal, window_size, hop_size, axis=-2, end='pad')
+    return segmented.permute(0, 3, 2, 1)
+
+
+def loop_overlap_add(signal, hop_size):
+    B, N, K, S = signal.shape
+    out = signal.new_zeros(B, S * hop_size + K - hop_size, N)
+    signal = signal.permute(0, 2, 1, 3)
+    for i in range(S):
+        out[:, i * hop_size:i * hop_size + K, :] += signal[..., :, :, i]
+    return out[..., K - hop_size:- (K - hop_size), :]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--feature-size', type=int, default=64)
+    parser.add_argument('--window-size', type=int, default=100)
+    parser.add_argument('--hop-size', type=int, default=50)
+    parser.add_argument('--frames-per-second', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    K, P = args.window_size, args.hop_size
+
+    def timeit_ms(fn):
+        return timeit.timeit(fn, number=args.number) / args.number * 1000
+
+    print(
+        f'{"length":>7} {"S":>6} '
+        f'{"segment loop [ms]":>18} {"segment [ms]":>13} '
+        f'{"overlap_add loop [ms]":>22} {"overlap_add [ms]":>17}'
+    )
+    for seconds in [1, 10, 60, 600]:
+        signal = torch.randn(
+            1, seconds * args.frames_per_second, args.feature_size)
+        segmented, _ = segment(signal, P, K)
+
+        t_segment_loop = timeit_ms(lambda: loop_segment(signal, P, K))
+        t_segment = timeit_ms(lambda: segment(signal, P, K))
+        t_overlap_add_loop = timeit_ms(lambda: loop_overlap_add(segmented, P))
+        t_overlap_add = timeit_ms(lambda: overlap_add(segmented, P))
+        print(
+            f'{seconds:>6}s {segmented.shape[-1]:>6} '
+            f'{t_segment_loop:>18.2f} {t_segment:>13.2f} '
+            f'{t_overlap_add_loop:>22.2f} {t_overlap_add:>17.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
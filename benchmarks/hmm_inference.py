@@ -0,0 +1,156 @@
+"""
+Compares the time of the batched torch forward-backward and Viterbi of
+`padertorch.contrib.je.modules.hmm_torch` (with dense and with left to right
+transitions) against hmmlearn, which is run for each example in a thread
+pool as in `padertorch.contrib.je.modules.hmm_utils`.
+
+Usage:
+    python benchmarks/hmm_inference.py [--device cpu] [--units 30]
+        [--states-per-unit 3] [--batch-size 16] [--frames 500] [--number 3]
+"""
+import argparse
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from padertorch.contrib.je.modules.hmm_torch import (
+    LeftToRightTransitions, batch_forward_backward, batch_viterbi
+)
+
+
+def hmmlearn_forward_backward(log_startprob, log_transmat, framelogprob):
+    from hmmlearn import _hmmc
+    if hasattr(_hmmc, '_forward'):
+        # hmmlearn < 0.2.8, which is used by hmm_utils
+        from padertorch.contrib.je.modules import hmm_utils
+        return hmm_utils.batch_forward_backward(
+            log_startprob, log_transmat, framelogprob)
+
+    startprob = np.exp(log_startprob)
+    transmat = np.exp(log_transmat)
+
+    def fwd_bwd(framelogprob):
+        log_prob, alpha = _hmmc.forward_log(startprob, transmat, framelogprob)
+        beta = _hmmc.backward_log(startprob, transmat, framelogprob)
+        log_gamma = alpha + beta
+        log_gamma -= np.logaddexp.reduce(log_gamma, axis=1, keepdims=True)
+        log_xi_sum = _hmmc.compute_log_xi_sum(
+            alpha, transmat, beta, framelogprob)
+        return np.exp(log_gamma), np.exp(log_xi_sum)
+
+    with ThreadPoolExecutor(8) as executor:
+        posteriors, transitions = zip(*executor.map(fwd_bwd, framelogprob))
+    return np.stack(posteriors), np.stack(transitions)
+
+
+def hmmlearn_viterbi(log_startprob, log_transmat, framelogprob):
+    from hmmlearn import _hmmc
+    if hasattr(_hmmc, '_viterbi'):
+        from padertorch.contrib.je.modules import hmm_utils
+        return hmm_utils.batch_viterbi(
+            log_startprob, log_transmat, framelogprob)
+
+    startprob = np.exp(log_startprob)
+    transmat = np.exp(log_transmat)
+
+    def vit(framelogprob):
+        return _hmmc.viterbi(startprob, transmat, framelogprob)[1]
+
+    with ThreadPoolExecutor(8) as executor:
+        return np.stack(list(executor.map(vit, framelogprob)))
+
+
+def get_transitions(num_units, states_per_unit, rng):
+    """Transitions with the structure of `HMM.log_transition_mat`"""
+    K = num_units * states_per_unit
+    states = np.arange(K)
+    first = states % states_per_unit == 0
+    last = states % states_per_unit == states_per_unit - 1
+    log_unit_probs = np.log(rng.dirichlet(np.ones(num_units)))
+    with np.errstate(divide='ignore'):
+        log_half = np.full(K, np.log(.5))
+        return LeftToRightTransitions(
+            log_self=torch.tensor(log_half),
+            log_next=torch.tensor(np.where(first, -np.inf, log_half)),
+            log_exit=torch.tensor(np.where(last, log_half, -np.inf)),
+            log_entry=torch.tensor(np.where(
+                first, np.repeat(log_unit_probs, states_per_unit), -np.inf)),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--units', type=int, default=30)
+    parser.add_argument('--states-per-unit', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    transitions = get_transitions(args.units, args.states_per_unit, rng)
+    K = transitions.log_self.shape[-1]
+    log_startprob = transitions.log_entry
+    framelogprob = torch.tensor(
+        rng.randn(args.batch_size, args.frames, K) * 10)
+
+    device = torch.device(args.device)
+    transitions_device = LeftToRightTransitions(
+        *[field.to(device) for field in transitions])
+    dense_device = transitions_device.dense()
+    log_startprob_device = log_startprob.to(device)
+    framelogprob_device = framelogprob.to(device)
+
+    def timeit_ms(fn):
+        def run():
+            fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+        return min(timeit.repeat(
+            run, number=args.number, repeat=3)) / args.number * 1000
+
+    print(
+        f'B={args.batch_size}, T={args.frames}, K={K}, '
+        f'device={args.device}, float64'
+    )
+    candidates = {
+        'hmmlearn': (
+            lambda: hmmlearn_forward_backward(
+                log_startprob.numpy(), dense_device.cpu().numpy(),
+                framelogprob_device.cpu().numpy()),
+            lambda: hmmlearn_viterbi(
+                log_startprob.numpy(), dense_device.cpu().numpy(),
+                framelogprob_device.cpu().numpy()),
+        ),
+        'torch dense': (
+            lambda: batch_forward_backward(
+                log_startprob_device, dense_device, framelogprob_device),
+            lambda: batch_viterbi(
+                log_startprob_device, dense_device, framelogprob_device),
+        ),
+        'torch left to right': (
+            lambda: batch_forward_backward(
+                log_startprob_device, transitions_device, framelogprob_device),
+            lambda: batch_viterbi(
+                log_startprob_device, transitions_device, framelogprob_device),
+        ),
+    }
+
+    posteriors, _ = candidates['hmmlearn'][0]()
+    for name in ['torch dense', 'torch left to right']:
+        np.testing.assert_allclose(
+            candidates[name][0]()[0].cpu().numpy(), posteriors, atol=1e-6)
+
+    print(f'{"":>20} {"fwd-bwd [ms]":>13} {"viterbi [ms]":>13}')
+    for name, (fwd_bwd, viterbi) in candidates.items():
+        print(
+            f'{name:>20} {timeit_ms(fwd_bwd):13.1f} '
+            f'{timeit_ms(viterbi):13.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
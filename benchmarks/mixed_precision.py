@@ -0,0 +1,119 @@
+"""
+Compares the training step (forward, backward and optimizer step) of
+float32 and bfloat16 autocast (see the `mixed_precision` argument of
+`pt.Trainer`) for matmul heavy models on the CPU: a BLSTM acoustic model and
+a transformer stack. The activation memory is the size of the tensors, that
+are saved for the backward.
+
+Usage:
+    python benchmarks/mixed_precision.py [--device cpu] [--batch-size 16]
+        [--frames 200] [--number 5]
+
+Note: bfloat16 is only faster on CPUs with native bfloat16 support
+(e.g. AVX512-BF16 or AMX), otherwise it can be slower than float32.
+"""
+import argparse
+import contextlib
+import timeit
+
+import torch
+
+import padertorch as pt
+from padertorch.contrib.je.modules.transformer import TransformerStack
+
+
+class BLSTM(torch.nn.Module):
+    def __init__(self, input_size=80, hidden_size=512, num_layers=3,
+                 output_size=500):
+        super().__init__()
+        self.lstm = torch.nn.LSTM(
+            input_size, hidden_size, num_layers, bidirectional=True,
+            batch_first=True,
+        )
+        self.out = torch.nn.Linear(2 * hidden_size, output_size)
+
+    def forward(self, x):
+        return self.out(self.lstm(x)[0])
+
+
+class Transformer(torch.nn.Module):
+    def __init__(self, input_size=80, hidden_size=512, output_size=500):
+        super().__init__()
+        self.stack = TransformerStack(
+            input_size, hidden_size, num_layers=6, output_size=output_size,
+            num_heads=8, bidirectional=True,
+        )
+
+    def forward(self, x):
+        return self.stack(x)[0]
+
+
+def activation_bytes(model, x, autocast):
+    nbytes = 0
+
+    def pack(tensor):
+        nonlocal nbytes
+        nbytes += tensor.numel() * tensor.element_size()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        with autocast():
+            model(x).float().pow(2).mean()
+    return nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    x = torch.randn(args.batch_size, args.frames, 80, device=device)
+
+    print(
+        f'B={args.batch_size}, T={args.frames}, device={args.device}, '
+        f'threads={torch.get_num_threads()}'
+    )
+    print(
+        f'{"":>12} {"dtype":>9} {"step [ms]":>10} {"frames/s":>9} '
+        f'{"activations [MB]":>17}'
+    )
+    for name, model_cls in [('BLSTM', BLSTM), ('Transformer', Transformer)]:
+        torch.manual_seed(0)
+        model = model_cls().to(device)
+        optimizer = pt.optimizer.Adam()
+        optimizer.set_parameters(model.parameters())
+
+        for dtype in [None, torch.bfloat16]:
+            if dtype is None:
+                autocast = contextlib.nullcontext
+            else:
+                def autocast():
+                    return torch.autocast(device.type, dtype=dtype)
+
+            def step():
+                with autocast():
+                    loss = model(x).float().pow(2).mean()
+                loss.backward()
+                optimizer.clip_grad()
+                optimizer.step()
+                optimizer.zero_grad()
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+
+            step()  # warmup
+            ms = min(timeit.repeat(
+                step, number=args.number, repeat=3)) / args.number * 1000
+            mb = activation_bytes(model, x, autocast) / 2 ** 20
+            print(
+                f'{name:>12} {str(dtype or torch.float32)[6:]:>9} {ms:10.1f} '
+                f'{args.batch_size * args.frames / ms * 1000:9.0f} '
+                f'{mb:17.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
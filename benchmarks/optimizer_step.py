@@ -0,0 +1,100 @@
+"""
+Compares the time of the gradient clipping and the optimizer step of
+`pt.optimizer.Optimizer` (foreach norms and clipping without host
+synchronization, fused optimizer) against the previous path
+(`clip_grad_norm_`, a host synchronization for the finite check and the
+histogram and the default torch optimizer) for models with many small
+parameters.
+
+Usage:
+    python benchmarks/optimizer_step.py [--device cpu] [--number 50]
+        [--optimizer adam]
+"""
+import argparse
+import timeit
+
+import numpy as np
+import torch
+
+import padertorch as pt
+from padertorch.modules.convnet import ConvNet
+from padertorch.modules.dual_path_rnn import DPRNN
+
+OPTIMIZERS = {
+    'adam': pt.optimizer.Adam,
+    'sgd': pt.optimizer.SGD,
+}
+
+
+def get_models():
+    return {
+        'DPRNN': DPRNN(64, 128, 100, 50, num_blocks=6),
+        'ConvNet': ConvNet(),
+    }
+
+
+def previous_step(parameters, optimizer, gradient_clipping):
+    grad_norm = torch.nn.utils.clip_grad_norm_(parameters, gradient_clipping)
+    assert np.isfinite(grad_norm.item())
+    torch.Tensor([grad_norm])
+    optimizer.step()
+
+
+def fused_step(optimizer):
+    grad_norm = optimizer.clip_grad()
+    grad_norm.detach().reshape(1)
+    optimizer.step()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--number', type=int, default=50)
+    parser.add_argument('--optimizer', default='adam', choices=OPTIMIZERS)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    optimizer_factory = OPTIMIZERS[args.optimizer]
+
+    def timeit_ms(fn):
+        def run():
+            fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+        return min(timeit.repeat(
+            run, number=args.number, repeat=3)) / args.number * 1000
+
+    print(f'optimizer={args.optimizer}, device={args.device}')
+    print(
+        f'{"":>10} {"#params":>8} {"#tensors":>9} '
+        f'{"previous [ms]":>14} {"fused [ms]":>11}'
+    )
+    for name, model in get_models().items():
+        model.to(device)
+        parameters = tuple(model.parameters())
+        for p in parameters:
+            p.grad = torch.randn_like(p)
+
+        optimizer = optimizer_factory(gradient_clipping=1., fused=True)
+        optimizer.set_parameters(parameters)
+        previous = optimizer_factory.optimizer_cls(
+            parameters, **{
+                k: v for k, v in optimizer.optimizer_kwargs.items()
+                if k != 'fused'
+            }
+        )
+
+        # Only the time of the step is measured, the gradients stay the same.
+        # Because they are clipped in place, they are at the clipping
+        # threshold after the first iteration.
+        previous_ms = timeit_ms(
+            lambda: previous_step(parameters, previous, 1.))
+        fused_ms = timeit_ms(lambda: fused_step(optimizer))
+        print(
+            f'{name:>10} {sum(p.numel() for p in parameters):8d} '
+            f'{len(parameters):9d} {previous_ms:14.2f} {fused_ms:11.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the time of `padertorch.ops.sequence_reduction` over the time axis
+of a `PackedSequence` (segment reductions) against a Python loop over the
+sequences, and the time of the vectorized
+`packed_batch_sizes_to_sequence_lengths` against the previous loop, for
+several batch sizes.
+
+Usage:
+    python benchmarks/packed_reduction.py [--features 64] [--number 20]
+"""
+import argparse
+import timeit
+
+import numpy as np
+import torch
+
+import padertorch as pt
+
+
+def loop_sequence_lengths(batch_sizes):
+    # The previous implementation of packed_batch_sizes_to_sequence_lengths
+    lengths = []
+    last_batch_size = 0
+    for length, batch_size in reversed(list(enumerate(batch_sizes, 1))):
+        if batch_size > last_batch_size:
+            lengths.extend((int(batch_size) - last_batch_size) * [length])
+            last_batch_size = int(batch_size)
+    return lengths
+
+
+def loop_reduction(function, packed):
+    return torch.stack([
+        function(sequence, dim=[0])
+        for sequence in pt.ops.unpack_sequence(packed)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--features', type=int, default=64)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+
+    def timeit_ms(fn):
+        return min(timeit.repeat(
+            fn, number=args.number, repeat=3)) / args.number * 1000
+
+    print(
+        f'{"batch":>6} {"function":>9} {"loop [ms]":>10} '
+        f'{"segment [ms]":>13} {"speedup":>8}'
+    )
+    for batch_size in [8, 64, 256]:
+        lengths = rng.randint(50, 500, size=batch_size)
+        packed = torch.nn.utils.rnn.pack_sequence(
+            [torch.randn(int(l), args.features) for l in lengths],
+            enforce_sorted=False,
+        )
+        for function in [torch.sum, torch.mean, torch.amax]:
+            expected = loop_reduction(function, packed)
+            actual = pt.ops.sequence_reduction(function, packed, axis=0)
+            np.testing.assert_allclose(
+                actual.numpy(), expected.numpy(), rtol=1e-4, atol=1e-4)
+
+            loop = timeit_ms(lambda: loop_reduction(function, packed))
+            segment = timeit_ms(
+                lambda: pt.ops.sequence_reduction(function, packed, axis=0))
+            print(
+                f'{batch_size:6d} {function.__name__:>9} {loop:10.3f} '
+                f'{segment:13.3f} {loop / segment:7.1f}x'
+            )
+
+        batch_sizes = packed.batch_sizes
+        assert loop_sequence_lengths(batch_sizes) == \
+            pt.ops.packed_batch_sizes_to_sequence_lengths(batch_sizes)
+        loop = timeit_ms(lambda: loop_sequence_lengths(batch_sizes))
+        vectorized = timeit_ms(
+            lambda: pt.ops.packed_batch_sizes_to_sequence_lengths(batch_sizes))
+        print(
+            f'{batch_size:6d} {"lengths":>9} {loop:10.3f} '
+            f'{vectorized:13.3f} {loop / vectorized:7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
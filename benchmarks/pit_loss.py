@@ -0,0 +1,57 @@
+"""
+Compares the per example `pt.ops.losses.pit_loss` loop with
+`pt.ops.losses.batched_pit_loss` for different numbers of speakers.
+
+Usage:
+    python benchmarks/pit_loss.py [--batch-size 8] [--num-samples 16000]
+"""
+import argparse
+import timeit
+
+import torch
+
+import padertorch as pt
+
+
+def loop_pit_loss(estimate, target, sequence_lengths, loss_fn):
+    return torch.mean(torch.stack([
+        pt.ops.losses.pit_loss(
+            e[..., :l], t[..., :l], axis=0, loss_fn=loss_fn)
+        for e, t, l in zip(estimate, target, sequence_lengths)
+    ]))
+
+
+def batched_pit_loss(estimate, target, sequence_lengths, loss_fn):
+    return pt.ops.losses.batched_pit_loss(
+        estimate, target, loss_fn=loss_fn, sequence_lengths=sequence_lengths)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--num-samples', type=int, default=16000)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    B, T = args.batch_size, args.num_samples
+    sequence_lengths = torch.linspace(T // 2, T, B).long().tolist()
+
+    print(f'{"loss":>12} {"K":>2} {"loop [ms]":>10} {"batched [ms]":>13}')
+    for loss_fn in [pt.ops.losses.si_sdr_loss, pt.ops.losses.log_mse_loss]:
+        for K in [2, 3, 4, 5]:
+            estimate = torch.randn(B, K, T, requires_grad=True)
+            target = torch.randn(B, K, T)
+            times = []
+            for fn in [loop_pit_loss, batched_pit_loss]:
+                def run():
+                    fn(estimate, target, sequence_lengths, loss_fn).backward()
+                times.append(min(timeit.repeat(
+                    run, number=args.number, repeat=3)) / args.number)
+            print(
+                f'{loss_fn.__name__:>12} {K:>2} '
+                f'{times[0] * 1000:10.1f} {times[1] * 1000:13.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares the throughput (examples/s) of the thread based
+`Dataset.prefetch` and `padertorch.data.ProcessPrefetch` for a
+preprocessing that is dominated by Python code (STFT of a frame-wise
+resampled signal), as the number of workers grows.
+
+Usage:
+    python benchmarks/process_prefetch.py [--num-examples 256]
+        [--num-samples 64000]
+"""
+import os
+
+# The thread backend of lazy_dataset requires single threaded numerics
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import argparse
+import time
+
+import numpy as np
+import lazy_dataset
+from paderbox.transform import stft
+
+from padertorch.data import ProcessPrefetch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-examples', type=int, default=256)
+    parser.add_argument('--num-samples', type=int, default=64000)
+    args = parser.parse_args()
+
+    def transform(index):
+        rng = np.random.RandomState(index)
+        signal = rng.randn(args.num_samples).astype(np.float32)
+        # Python level loop as in many resampling and augmentation steps
+        for _ in range(4):
+            signal = np.concatenate([
+                frame * rng.uniform(0.9, 1.1)
+                for frame in np.split(signal, args.num_samples // 400)
+            ])
+        return {
+            'index': index,
+            'stft': np.abs(stft(signal, 512, 128)).astype(np.float32),
+        }
+
+    dataset = lazy_dataset.new(list(range(args.num_examples))).map(transform)
+
+    def examples_per_second(prefetched):
+        start = time.perf_counter()
+        for _ in prefetched:
+            pass
+        return args.num_examples / (time.perf_counter() - start)
+
+    print(f'{"workers":>7} {"threads [ex/s]":>15} {"processes [ex/s]":>17}')
+    for num_workers in [1, 2, 4, 8, 16, 32, 64]:
+        if num_workers > os.cpu_count():
+            break
+        buffer_size = 2 * num_workers
+        threads = examples_per_second(dataset.prefetch(
+            num_workers, buffer_size))
+        processes = examples_per_second(dataset.apply(ProcessPrefetch(
+            num_workers, buffer_size)))
+        print(f'{num_workers:>7} {threads:>15.1f} {processes:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()
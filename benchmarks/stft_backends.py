@@ -0,0 +1,61 @@
+"""
+Compares the conv and the fft backend of `padertorch.ops.STFT` (forward and
+inverse) for common FFT sizes and the time to construct the kernels.
+
+Usage:
+    python benchmarks/stft_backends.py [--batch-size 8] [--num-samples 64000]
+"""
+import argparse
+import timeit
+
+import torch
+
+from padertorch.ops import STFT
+from padertorch.ops._stft import _get_kernels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--num-samples', type=int, default=64000)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    signal = torch.randn(args.batch_size, args.num_samples)
+
+    def timeit_ms(fn):
+        return min(timeit.repeat(
+            fn, number=args.number, repeat=3)) / args.number * 1000
+
+    print(
+        f'{"size":>5} {"kernel [ms]":>12} '
+        f'{"conv [ms]":>10} {"fft [ms]":>9} '
+        f'{"conv inv [ms]":>14} {"fft inv [ms]":>13}'
+    )
+    for size in [256, 512, 1024, 2048, 4096]:
+        shift = size // 4
+
+        def build_kernels():
+            _get_kernels.cache_clear()
+            STFT(size, shift, complex_representation='concat')
+
+        t_kernel = timeit_ms(build_kernels)
+
+        times = []
+        for backend in ['conv', 'fft']:
+            stft = STFT(
+                size, shift, complex_representation='concat', backend=backend)
+            X = stft(signal)
+            times.append((
+                timeit_ms(lambda: stft(signal)),
+                timeit_ms(lambda: stft.inverse(X)),
+            ))
+        print(
+            f'{size:>5} {t_kernel:>12.1f} '
+            f'{times[0][0]:>10.1f} {times[1][0]:>9.1f} '
+            f'{times[0][1]:>14.1f} {times[1][1]:>13.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
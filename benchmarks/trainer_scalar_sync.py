@@ -0,0 +1,84 @@
+"""
+Compares the training speed of `pt.Trainer` with and without deferred scalar
+synchronization (see `pt.Trainer.defer_scalar_sync`).
+
+Usage:
+    python benchmarks/trainer_scalar_sync.py [--device cpu] [--iterations 2000]
+
+On a GPU the difference is usually larger than on the CPU, because each
+`.item()` waits until all queued kernels are finished.
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+import padertorch as pt
+
+
+class SmallModel(pt.Model):
+    def __init__(self, size=64, layers=3):
+        super().__init__()
+        self.net = torch.nn.Sequential(*[
+            torch.nn.Sequential(torch.nn.Linear(size, size), torch.nn.ReLU())
+            for _ in range(layers)
+        ])
+
+    def forward(self, example):
+        return self.net(example['x'])
+
+    def review(self, example, output):
+        return {
+            'losses': {
+                'mse': torch.nn.functional.mse_loss(output, example['y']),
+                'l1': torch.nn.functional.l1_loss(output, example['y']),
+            },
+        }
+
+
+def run(defer_scalar_sync, iterations, device, batch_size=16, size=64):
+    rng = np.random.RandomState(0)
+    dataset = [
+        {
+            'x': rng.randn(batch_size, size).astype(np.float32),
+            'y': rng.randn(batch_size, size).astype(np.float32),
+        }
+        for _ in range(iterations)
+    ]
+    torch.manual_seed(0)
+    model = SmallModel(size)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trainer = pt.Trainer(
+            model, tmp_dir, pt.optimizer.Adam(),
+            loss_weights={'mse': 1., 'l1': 0.5},
+            summary_trigger=(100, 'iteration'),
+            checkpoint_trigger=(1000000, 'iteration'),
+            stop_trigger=(iterations, 'iteration'),
+            defer_scalar_sync=defer_scalar_sync,
+        )
+        start = time.perf_counter()
+        trainer.train(dataset, progress_bar=False, device=device)
+        return iterations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    device = args.device if args.device == 'cpu' else int(args.device)
+
+    print(f'{"defer_scalar_sync":>18} {"it/s":>10}')
+    for defer_scalar_sync in [False, True]:
+        speed = max(
+            run(defer_scalar_sync, args.iterations, device)
+            for _ in range(args.repeats)
+        )
+        print(f'{str(defer_scalar_sync):>18} {speed:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the frame by frame decoding of the je `TransformerStack` with the
+`KVCache` state against the previous state of the past inputs, where the
+keys and values of the whole history are projected again in each step.
+
+Usage:
+    python benchmarks/transformer_decoding.py [--device cpu] [--frames 500]
+        [--batch-size 8] [--size 256] [--layers 4] [--heads 4]
+        [--max-context 128]
+"""
+import argparse
+import time
+
+import torch
+
+from padertorch.contrib.je.modules.transformer import TransformerStack
+
+
+def decode_past_inputs(stack, x):
+    inputs = [x[:, :0]] + [
+        x.new_zeros((x.shape[0], 0, layer.hidden.in_features))
+        for layer in stack.stack[1:]
+    ]
+    for t in range(x.shape[1]):
+        h = x[:, t:t + 1]
+        for i, layer in enumerate(stack.stack):
+            state = inputs[i]
+            inputs[i] = torch.cat([state, h], dim=1)
+            h, _ = layer(h, state=state)
+    return h
+
+
+def decode_kv_cache(stack, x, max_context=None):
+    state = stack.init_state(max_context=max_context)
+    for t in range(x.shape[1]):
+        y, state = stack(x[:, t:t + 1], state=state)
+    return y
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--heads', type=int, default=4)
+    parser.add_argument('--max-context', type=int, default=128)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    stack = TransformerStack(
+        args.size, args.size, args.layers, num_heads=args.heads,
+        norm='batch',
+    ).to(device).eval()
+    x = torch.randn(args.batch_size, args.frames, args.size, device=device)
+
+    def time_ms(fn):
+        with torch.no_grad():
+            fn()  # warmup
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+        return (time.perf_counter() - start) * 1000
+
+    with torch.no_grad():
+        torch.testing.assert_close(
+            decode_past_inputs(stack, x[:, :20]),
+            decode_kv_cache(stack, x[:, :20]),
+            atol=1e-4, rtol=1e-4,
+        )
+
+    print(
+        f'B={args.batch_size}, T={args.frames}, D={args.size}, '
+        f'layers={args.layers}, heads={args.heads}, device={args.device}'
+    )
+    candidates = {
+        'past inputs': lambda: decode_past_inputs(stack, x),
+        'kv cache': lambda: decode_kv_cache(stack, x),
+        f'kv cache (max_context={args.max_context})': lambda: decode_kv_cache(
+            stack, x, args.max_context),
+    }
+    for name, fn in candidates.items():
+        ms = time_ms(fn)
+        print(f'{name:>32}: {ms:9.1f} ms ({ms / args.frames:.3f} ms/frame)')
+
+
+if __name__ == '__main__':
+    main()
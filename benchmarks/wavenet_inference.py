@@ -0,0 +1,82 @@
+"""
+Measures the CPU throughput (generated samples per second) of the
+autoregressive `WaveNet` inference. `FastWaveNet` (per layer dilation queues)
+is compared with naive generation, that re-runs the network on the full
+receptive field for each sample.
+
+Usage:
+    python benchmarks/wavenet_inference.py [--num-samples 2000] [--naive-samples 100]
+"""
+import argparse
+import time
+
+import torch
+
+from padertorch.modules.wavenet import WaveNet
+from padertorch.modules.wavenet.fast_wavenet import FastWaveNet
+
+
+def naive_infer(wavenet, cond_input):
+    """Recomputes the receptive field of every generated sample."""
+    receptive_field = sum(
+        layer.dilation for layer in wavenet.dilate_layers) + 1
+    cond_acts = cond_input.permute(1, 2, 0, 3)
+    batch_size, _, _, sample_count = cond_acts.shape
+    quantized = torch.full(
+        (batch_size, 1), wavenet.n_out_channels // 2, dtype=torch.long)
+    for t in range(sample_count):
+        onset = max(0, t + 1 - receptive_field)
+        logits = wavenet._logits(
+            quantized[:, onset:], cond_acts[..., onset:t + 1])[..., -1]
+        sample = torch.multinomial(torch.softmax(logits, dim=-1), 1)
+        quantized = torch.cat([quantized, sample], dim=1)
+    return quantized[:, 1:]
+
+
+def fast_infer(wavenet, cond_input):
+    return FastWaveNet(**wavenet.export_weights()).infer(cond_input)
+
+
+def samples_per_second(fn, wavenet, cond_input):
+    start = time.perf_counter()
+    samples = fn(wavenet, cond_input)
+    elapsed = time.perf_counter() - start
+    return samples.numel() / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-samples', type=int, default=2000)
+    parser.add_argument('--naive-samples', type=int, default=100)
+    parser.add_argument('--n-layers', type=int, default=16)
+    parser.add_argument('--max-dilation', type=int, default=128)
+    args = parser.parse_args()
+
+    n_cond_channels = 80
+    wavenet = WaveNet(
+        n_cond_channels=n_cond_channels, upsamp_window=1024,
+        upsamp_stride=256, n_layers=args.n_layers,
+        max_dilation=args.max_dilation,
+    ).eval()
+
+    def get_cond_input(batch_size, num_samples):
+        num_frames = num_samples // 256 + 4
+        with torch.no_grad():
+            cond_input = wavenet.get_cond_input(
+                torch.randn(batch_size, n_cond_channels, num_frames))
+        return cond_input[..., :num_samples]
+
+    print(f'{"batch":>5} {"naive [samples/s]":>18} {"fast [samples/s]":>17}')
+    with torch.no_grad():
+        for batch_size in [1, 4, 16]:
+            naive = samples_per_second(
+                naive_infer, wavenet,
+                get_cond_input(batch_size, args.naive_samples))
+            fast = samples_per_second(
+                fast_infer, wavenet,
+                get_cond_input(batch_size, args.num_samples))
+            print(f'{batch_size:>5} {naive:>18.0f} {fast:>17.0f}')
+
+
+if __name__ == '__main__':
+    main()
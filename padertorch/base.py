@@ -98,6 +98,11 @@ class Module(nn.Module, Configurable, abc.ABC):
     ) -> 'Module':
         """Update the module parameters from the given checkpoint.
 
+        The checkpoint can be a `torch.save` file or a checkpoint written by
+        `padertorch.io.save_mmap_checkpoint` (e.g. by a `Trainer` with
+        `checkpoint_format='mmap'`). For the latter only the tensors of the
+        module are read from the file.
+
         Args:
             checkpoint_path:
             in_checkpoint_path:
@@ -115,29 +120,57 @@ class Module(nn.Module, Configurable, abc.ABC):
 
         assert checkpoint_path.is_file(), checkpoint_path
 
+        from padertorch.io import (
+            is_mmap_checkpoint, read_mmap_checkpoint_index,
+            load_mmap_checkpoint,
+        )
+
         # Load weights
         if consider_mpi:
             import dlp_mpi
             if dlp_mpi.IS_MASTER:
-                checkpoint_path_content = Path(checkpoint_path).read_bytes()
+                if is_mmap_checkpoint(checkpoint_path):
+                    # Each process maps the tensors from the file, only the
+                    # index has to be broadcast.
+                    checkpoint_path_content = (
+                        'mmap', read_mmap_checkpoint_index(checkpoint_path))
+                else:
+                    checkpoint_path_content = (
+                        'torch', Path(checkpoint_path).read_bytes())
             else:
                 checkpoint_path_content = None
-            checkpoint_path_content = dlp_mpi.bcast(checkpoint_path_content)
+            checkpoint_format, checkpoint_path_content = dlp_mpi.bcast(
+                checkpoint_path_content)
+        elif is_mmap_checkpoint(checkpoint_path):
+            checkpoint_format, checkpoint_path_content = 'mmap', None
+        else:
+            checkpoint_format, checkpoint_path_content = 'torch', None
 
-            checkpoint = torch.load(
-                io.BytesIO(checkpoint_path_content),
+        if checkpoint_format == 'mmap':
+            # Loads only the tensors below in_checkpoint_path.
+            checkpoint = load_mmap_checkpoint(
+                checkpoint_path,
+                in_checkpoint_path=in_checkpoint_path,
                 map_location=map_location,
+                index=checkpoint_path_content,
             )
         else:
-            checkpoint = torch.load(checkpoint_path, map_location=map_location)
-
-        if in_checkpoint_path:
-            for part in in_checkpoint_path.split('.'):
-                try:
-                    checkpoint = deflatten(checkpoint, maxdepth=1)
-                    checkpoint = checkpoint[part]
-                except KeyError:
-                    raise ValueError(part, in_checkpoint_path, checkpoint)
+            if checkpoint_path_content is not None:
+                checkpoint = torch.load(
+                    io.BytesIO(checkpoint_path_content),
+                    map_location=map_location,
+                )
+            else:
+                checkpoint = torch.load(
+                    checkpoint_path, map_location=map_location)
+
+            if in_checkpoint_path:
+                for part in in_checkpoint_path.split('.'):
+                    try:
+                        checkpoint = deflatten(checkpoint, maxdepth=1)
+                        checkpoint = checkpoint[part]
+                    except KeyError:
+                        raise ValueError(part, in_checkpoint_path, checkpoint)
         self.load_state_dict(checkpoint)
 
         return self
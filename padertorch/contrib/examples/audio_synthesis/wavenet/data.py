@@ -1,10 +1,12 @@
 import numpy as np
+import padertorch as pt
 from padertorch.contrib.je.data.transforms import AudioReader, STFT, \
     fragment_signal, Collate
 
 
 def prepare_dataset(
-        dataset, audio_reader, stft, max_length=1., batch_size=3, shuffle=False
+        dataset, audio_reader, stft, max_length=1., batch_size=3, shuffle=False,
+        max_total_size=None,
 ):
 
     def prepare_example(example):
@@ -61,8 +63,8 @@ def prepare_dataset(
         dataset = dataset.shuffle(
             reshuffle=True, buffer_size=10*batch_size
         )
-    return dataset.batch_dynamic_time_series_bucket(
+    return dataset.apply(pt.data.batch.TimeSeriesBucketBatcher(
         batch_size=batch_size, len_key='seq_len', max_padding_rate=0.05,
-        expiration=1000*batch_size, drop_incomplete=shuffle,
-        sort_key='seq_len', reverse_sort=True
-    ).map(Collate())
+        max_total_size=max_total_size, expiration=1000*batch_size,
+        drop_incomplete=shuffle, sort_key='seq_len',
+    )).map(Collate())
@@ -143,7 +143,7 @@ def config():
 def train(
         _run,
         audio_reader, stft,
-        num_workers, batch_size, max_padding_rate,
+        num_workers, batch_size, max_padding_rate, max_total_size,
         trainer, resume,
 ):
 
@@ -155,6 +155,7 @@ def train(
         num_workers=num_workers,
         batch_size=batch_size,
         max_padding_rate=max_padding_rate,
+        max_total_size=max_total_size,
         storage_dir=trainer.storage_dir
     )
     trainer.test_run(train_iter, validation_iter)
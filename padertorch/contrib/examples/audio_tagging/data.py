@@ -1,4 +1,5 @@
 import numpy as np
+import padertorch as pt
 from padercontrib.database.audio_set import AudioSet
 from padertorch.contrib.je.data.transforms import (
     AudioReader, STFT, MultiHotLabelEncoder, Collate
@@ -10,7 +11,7 @@ from padertorch.contrib.je.modules.augment import LogTruncNormalSampler
 def get_datasets(
         audio_reader, stft,
         num_workers, batch_size, max_padding_rate,
-        storage_dir
+        storage_dir, max_total_size=None,
 ):
 
     db = AudioSet()
@@ -24,7 +25,7 @@ def get_datasets(
     kwargs = dict(
         audio_reader=audio_reader, stft=stft, event_encoder=event_encoder,
         num_workers=num_workers, batch_size=batch_size,
-        max_padding_rate=max_padding_rate,
+        max_padding_rate=max_padding_rate, max_total_size=max_total_size,
     )
 
     return (
@@ -37,7 +38,7 @@ def prepare_dataset(
         dataset,
         audio_reader, stft, event_encoder,
         num_workers, batch_size, max_padding_rate,
-        training=False,
+        training=False, max_total_size=None,
 ):
 
     dataset = dataset.filter(lambda ex: 10.1 > ex['audio_length'] > 1.3, lazy=False)
@@ -83,8 +84,9 @@ def prepare_dataset(
         dataset = dataset.shuffle(
             reshuffle=True, buffer_size=min(100 * batch_size, 1000)
         )
-    return dataset.batch_dynamic_time_series_bucket(
+    return dataset.apply(pt.data.batch.TimeSeriesBucketBatcher(
         batch_size=batch_size, len_key="seq_len",
-        max_padding_rate=max_padding_rate, expiration=1000*batch_size,
-        drop_incomplete=training, sort_key="seq_len", reverse_sort=True
-    ).map(Collate())
+        max_padding_rate=max_padding_rate, max_total_size=max_total_size,
+        expiration=1000*batch_size, drop_incomplete=training,
+        sort_key="seq_len",
+    )).map(Collate())
@@ -148,21 +148,26 @@ def main(_run, datasets, debug, experiment_dir, dump_audio,
     with torch.no_grad():
         results = defaultdict(dict)
         for dataset in datasets:
+            iterator_slice = slice(
+                dlp_mpi.RANK, 20 if debug else None, dlp_mpi.SIZE)
             iterable = prepare_iterable(
                 db, dataset, 1,
                 chunk_size=-1,
                 prefetch=False,
                 shuffle=False,
-                iterator_slice=slice(dlp_mpi.RANK, 20 if debug else None,
-                                     dlp_mpi.SIZE),
+                iterator_slice=iterator_slice,
             )
+            # The batched iterable has no length, but each batch has a
+            # single example
+            num_examples = len(db.get_dataset(dataset)[iterator_slice])
 
             if dump_audio:
                 (experiment_dir / 'audio' / dataset).mkdir(
                     parents=True, exist_ok=True)
 
             for batch in tqdm(
-                    iterable, total=len(iterable), disable=not dlp_mpi.IS_MASTER,
+                    iterable, total=num_examples,
+                    disable=not dlp_mpi.IS_MASTER,
                     desc=dataset,
             ):
                 example_id = batch['example_id'][0]
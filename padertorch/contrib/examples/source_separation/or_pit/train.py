@@ -8,7 +8,6 @@ python -m padertorch.contrib.examples.source_separation.or_pit.train with databa
 """
 import copy
 
-import lazy_dataset
 import torch
 from paderbox.io import load_audio
 
@@ -42,6 +41,8 @@ def config():
     debug = False
     batch_size = 4  # Runs on 4GB GPU mem. Can safely be set to 12 on 12 GB (e.g., GTX1080)
     chunk_size = 32000  # 4s chunks @8kHz
+    max_padding_rate = 0.1  # Only relevant without chunking (chunk_size=-1)
+    max_total_size = None  # Maximum number of samples in a padded batch
 
     train_datasets = ["mix_2_spk_min_tr", "mix_3_spk_min_tr"]
     validate_datasets = ["mix_2_spk_min_cv", "mix_3_spk_min_cv"]
@@ -172,7 +173,8 @@ def pre_batch_transform(inputs):
 
 def prepare_iterable(
         db, datasets: List[str], batch_size, chunk_size, prefetch=True,
-        iterator_slice=None, shuffle=True
+        iterator_slice=None, shuffle=True, max_padding_rate=0.1,
+        max_total_size=None,
 ):
     """
     This is re-used in the evaluate script
@@ -187,30 +189,13 @@ def prepare_iterable(
     if iterator_slice is not None:
         iterator = iterator[iterator_slice]
 
-    # Determine the number of speakers in each example
-    def add_num_speakers(example):
-        example.update(num_speakers=len(example['speaker_id']))
-        return example
-
-    iterator = iterator.map(add_num_speakers)
-
-    # Group iterators by number of speakers so that all examples in a batch
-    # have the same number of speakers
-    iterators = list(iterator.groupby(lambda x: x['num_speakers']).values())
-
     chunker = RandomChunkSingle(chunk_size, chunk_keys=('y', 's'), axis=-1)
-    iterators = [
+    iterator = (
         iterator
             .map(pre_batch_transform)
             .map(chunker)
             .shuffle(reshuffle=shuffle)
-            .batch(batch_size)
-            .map(pt.data.batch.Sorter('num_samples'))
-            .map(pt.data.utils.collate_fn)
-        for iterator in iterators
-    ]
-
-    iterator = lazy_dataset.concatenate(*iterators).shuffle(reshuffle=shuffle)
+    )
 
     # FilterExceptions are only raised inside the chunking code if the
     # example is too short. If min_length <= 0 or chunk_size == -1, no filter
@@ -218,20 +203,33 @@ def prepare_iterable(
     catch_exception = chunker.chunk_size != -1 and chunker.min_length > 0
     if prefetch:
         iterator = iterator.prefetch(
-            8, 16, catch_filter_exception=catch_exception)
+            8, 16 * batch_size, catch_filter_exception=catch_exception)
     elif catch_exception:
         iterator = iterator.catch()
 
-    return iterator
+    # Group examples by number of speakers so that all examples in a batch
+    # have the same number of speakers, and by length to reduce the padding
+    return (
+        iterator
+            .apply(pt.data.batch.TimeSeriesBucketBatcher(
+                batch_size=batch_size, len_key='num_samples',
+                max_padding_rate=max_padding_rate,
+                max_total_size=max_total_size, group_key='num_speakers',
+                expiration=1000 * batch_size, sort_key='num_samples',
+            ))
+            .map(pt.data.utils.collate_fn)
+    )
 
 
 @ex.capture
 def prepare_iterable_captured(
-        database_obj, dataset, batch_size, debug, chunk_size
+        database_obj, dataset, batch_size, debug, chunk_size,
+        max_padding_rate, max_total_size,
 ):
     return prepare_iterable(
         database_obj, dataset, batch_size, chunk_size,
         prefetch=not debug,
+        max_padding_rate=max_padding_rate, max_total_size=max_total_size,
         iterator_slice=slice(0, 100, 1) if debug else None
     )
 
@@ -10,28 +10,55 @@ from paderbox.transform import stft
 
 def prepare_iterable(
         db, dataset: str, batch_size, return_keys=None, prefetch=True,
+        cache_dir=None, max_padding_rate=0.1, max_total_size=None,
+        stft_size=512, stft_shift=128,
 ):
+    """
+    If `cache_dir` is given, the features are computed only in the first
+    epoch and read from the disk in later epochs.
+
+    If `max_total_size` is given, a batch has at most `max_total_size`
+    frames including the padding.
+    """
     audio_keys = ['observation', 'speech_source']
     iterator = db.get_dataset(dataset)
 
+    def transform(example):
+        example = read_audio(example, audio_keys=audio_keys)
+        return pre_batch_transform(
+            example, return_keys=return_keys,
+            stft_size=stft_size, stft_shift=stft_shift,
+        )
+
+    if cache_dir is not None:
+        transform = pt.data.FeatureCache(transform, cache_dir, config={
+            'audio_keys': audio_keys,
+            'return_keys': return_keys,
+            'stft': {'size': stft_size, 'shift': stft_shift},
+        })
+
     iterator = (
         iterator
-        .map(partial(read_audio, audio_keys=audio_keys))
-        .map(partial(pre_batch_transform, return_keys=return_keys))
+        .map(transform)
         .shuffle(reshuffle=True)
-        .batch(batch_size)
-        .map(lambda batch: sorted(      # sorts batch in increasing lengths, needed for torch PackedSequence
-            batch,
-            key=lambda example: example["num_frames"],
-            reverse=True,
+    )
+
+    if prefetch:
+        iterator = iterator.prefetch(4, 8 * batch_size)
+
+    iterator = (
+        iterator
+        # groups examples with similar lengths and sorts each batch in
+        # decreasing lengths, needed for torch PackedSequence
+        .apply(pt.data.batch.TimeSeriesBucketBatcher(
+            batch_size=batch_size, len_key='num_frames',
+            max_padding_rate=max_padding_rate, max_total_size=max_total_size,
+            expiration=1000 * batch_size, sort_key='num_frames',
         ))
         .map(pt.data.utils.collate_fn)
         .map(post_batch_transform)
     )
 
-    if prefetch:
-        iterator = iterator.prefetch(4, 8)
-
     return iterator
 
 
@@ -46,11 +73,13 @@ def read_audio(example, src_key="audio_path", audio_keys=None):
     return example
 
 
-def pre_batch_transform(inputs, return_keys=None):
+def pre_batch_transform(
+        inputs, return_keys=None, stft_size=512, stft_shift=128,
+):
     s = inputs['audio_data']['speech_source']
     y = inputs['audio_data']['observation']
-    S = stft(s, 512, 128)
-    Y = stft(y, 512, 128)
+    S = stft(s, stft_size, stft_shift)
+    Y = stft(y, stft_size, stft_shift)
     Y = einops.rearrange(Y, 't f -> t f')
     S = einops.rearrange(S, 'k t f -> t k f')
     X = S  # Same for WSJ0_2MIX database
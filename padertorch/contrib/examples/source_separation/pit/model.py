@@ -1,6 +1,6 @@
 import einops
 import torch
-from torch.nn.utils.rnn import PackedSequence
+from torch.nn.utils.rnn import PackedSequence, pad_sequence
 
 import padertorch as pt
 from padertorch.ops.mappings import ACTIVATION_FN_MAP
@@ -109,35 +109,37 @@ class PermutationInvariantTrainingModel(pt.Model):
         return pt.ops.unpack_sequence(mask)
 
     def review(self, batch, model_out):
+        # Pad the examples to (B, K, T, F) to compute the loss for the
+        # whole batch at once.
+        sequence_lengths = [mask.shape[0] for mask in model_out]
 
-        pit_mse_loss = list()
-        for mask, observation, target in zip(
-                model_out,
-                batch['Y_abs'],
-                batch['X_abs']
-        ):
-            pit_mse_loss.append(pt.ops.losses.pit_loss(
-                mask * observation[:, None, :],
-                target,
-                axis=-2
-            ))
+        def pad(signals):
+            return pad_sequence(signals, batch_first=True)
+
+        estimate = einops.rearrange(
+            pad(model_out) * pad(batch['Y_abs'])[:, :, None, :],
+            'b t k f -> b k t f'
+        )
+        target = einops.rearrange(
+            pad(batch['X_abs']), 'b t k f -> b k t f')
+        cos_phase_diff = einops.rearrange(
+            pad(batch['cos_phase_difference']), 'b t k f -> b k t f')
+
+        pit_mse_loss = pt.ops.losses.batched_pit_loss(
+            estimate, target,
+            loss_fn=torch.nn.functional.mse_loss,
+            sequence_lengths=sequence_lengths,
+        )
         # Ideal Phase Sensitive loss
-        pit_ips_loss = list()
-        for mask, observation, target, cos_phase_diff in zip(
-            model_out,
-            batch['Y_abs'],
-            batch['X_abs'],
-            batch['cos_phase_difference']
-        ):
-            pit_ips_loss.append(pt.ops.losses.pit_loss(
-                mask * observation[:, None, :],
-                target * cos_phase_diff,
-                axis=-2
-            ))
+        pit_ips_loss = pt.ops.losses.batched_pit_loss(
+            estimate, target * cos_phase_diff,
+            loss_fn=torch.nn.functional.mse_loss,
+            sequence_lengths=sequence_lengths,
+        )
 
         losses = {
-                'pit_mse_loss': torch.mean(torch.stack(pit_mse_loss)),
-                'pit_ips_loss': torch.mean(torch.stack(pit_ips_loss)),
+                'pit_mse_loss': pit_mse_loss,
+                'pit_ips_loss': pit_ips_loss,
         }
 
         b = 0   # only print image of first example in a batch
@@ -147,6 +149,11 @@ class PermutationInvariantTrainingModel(pt.Model):
             images[f'mask_{i}'] = mask_to_image(model_out[b][:, i, :])
             images[f'estimation_{i}'] = stft_to_image(batch['X_abs'][b][:, 0, :])
 
+        scalars = {
+            'padding_rate': pt.data.batch.padding_rate(sequence_lengths),
+        }
+
         return dict(losses=losses,
+                    scalars=scalars,
                     images=images
                     )
@@ -48,6 +48,7 @@ def config():
                                  'database_json')
     train_dataset = "mix_2_spk_min_tr"
     validate_dataset = "mix_2_spk_min_cv"
+    feature_cache_dir = None  # Optional dir to cache the features on disk
 
     # Dict describing the model parameters, to allow changing the parameters from the command line.
     # Configurable automatically inserts the default values of not mentioned parameters to the config.json
@@ -81,12 +82,13 @@ def config():
 
 @ex.capture
 def prepare_iterable_captured(
-        database, dataset, batch_size, debug
+        database, dataset, batch_size, debug, feature_cache_dir
 ):
     return_keys = 'X_abs Y_abs cos_phase_difference num_frames'.split()
     return prepare_iterable(
         database, dataset, batch_size, return_keys,
         prefetch=not debug,
+        cache_dir=feature_cache_dir,
     )
 
 
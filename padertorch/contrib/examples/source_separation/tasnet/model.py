@@ -71,8 +71,7 @@ class TasNet(pt.Model):
         Separates the time-signal in `sequence` into `self.num_speakers`
         separated audio streams.
 
-        Now supports sequence lengths, but runs quite slow when used with
-        sequence lengths.
+        Supports sequence lengths.
         """
         sequence = pad_sequence(batch['y'], batch_first=True)
         sequence_lengths = batch['num_samples']
@@ -156,24 +155,24 @@ class TasNet(pt.Model):
         sequence_lengths = inputs['num_samples']
         x = outputs['out']
 
+        if not torch.is_tensor(s):
+            # Targets with different lengths, pad to shape (B, K, T)
+            s = pad_sequence(
+                [s_.transpose(0, 1) for s_ in s], batch_first=True
+            ).transpose(1, 2)
+
         loss_functions = {
             'si-sdr': si_sdr_loss,
             'log-mse': log_mse_loss,
             'log1p-mse': log1p_mse_loss,
         }
-        losses = {k: [] for k in loss_functions.keys()}
-
-        for seq_len, estimated, target in zip(sequence_lengths, x, s):
-            for k, loss_fn in loss_functions.items():
-                losses[k].append(
-                    pt.ops.losses.pit_loss(
-                        estimated[..., :seq_len],
-                        target[..., :seq_len],
-                        axis=0, loss_fn=loss_fn,
-                    )
-                )
-
-        return {k: torch.mean(torch.stack(v)) for k, v in losses.items()}
+
+        return {
+            k: pt.ops.losses.batched_pit_loss(
+                x, s, loss_fn=loss_fn, sequence_lengths=sequence_lengths,
+            )
+            for k, loss_fn in loss_functions.items()
+        }
 
     def review(self, inputs: dict, outputs: dict) -> dict:
         # Report audios
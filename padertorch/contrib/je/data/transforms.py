@@ -8,8 +8,8 @@ import torch
 from paderbox.transform.module_fbank import MelTransform as BaseMelTransform
 from paderbox.transform.module_stft import STFT as BaseSTFT
 from paderbox.utils.nested import nested_op
+from padertorch.data.moments import compute_moments
 from padertorch.utils import to_list
-from tqdm import tqdm
 from lazy_dataset import FilterException
 
 
@@ -103,13 +103,24 @@ class Normalizer:
         example[self.key] = self.normalize(example[self.key])
         return example
 
-    def initialize_moments(self, dataset=None, verbose=False):
+    def initialize_moments(
+            self, dataset=None, verbose=False, num_workers=1, chunk_size=100
+    ):
         """
         Loads or computes the global mean (center) and scale over a dataset.
 
+        The moments are computed in a single pass with
+        `padertorch.data.compute_moments`, i.e., with float64 Welford
+        statistics and optionally in `num_workers` processes. If a
+        storage_dir is given, the moments of finished chunks are stored in a
+        state file, so that an interrupted computation can be resumed.
+
         Args:
-            dataset: lazy dataset providing example dicts
+            dataset: indexable lazy dataset providing example dicts
             verbose:
+            num_workers: number of worker processes
+            chunk_size: number of examples that are processed at once by a
+                worker
 
         Returns:
 
@@ -124,37 +135,38 @@ class Normalizer:
                 print(f'Restored moments from {filepath}')
         else:
             assert dataset is not None
-            mean = 0.
-            mean_count = 0
-            energy = 0.
-            energy_count = 0
-            for example in tqdm(dataset, disable=not verbose):
-                x = example[self.key]
-                if self.center_axis is not None:
-                    if not mean_count:
-                        mean = np.sum(x, axis=self.center_axis, keepdims=True)
-                    else:
-                        mean += np.sum(x, axis=self.center_axis, keepdims=True)
-                    mean_count += np.prod(
-                        np.array(x.shape)[np.array(self.center_axis)]
-                    )
-                if self.scale_axis is not None:
-                    if not energy_count:
-                        energy = np.sum(x**2, axis=self.scale_axis, keepdims=True)
-                    else:
-                        energy += np.sum(x**2, axis=self.scale_axis, keepdims=True)
-                    energy_count += np.prod(
-                        np.array(x.shape)[np.array(self.scale_axis)]
-                    )
+            # The moments are computed over the common axes and the
+            # remaining axes are reduced afterwards.
+            center_axis = set(self.center_axis or ())
+            scale_axis = set(self.scale_axis or ())
+            if self.center_axis is not None and self.scale_axis is not None:
+                axis = center_axis & scale_axis
+            else:
+                axis = center_axis | scale_axis
+            state_file = None if filepath is None \
+                else filepath.with_suffix('.state.pkl')
+            moments = compute_moments(
+                dataset, self.key, axis=tuple(sorted(axis)),
+                num_workers=num_workers, chunk_size=chunk_size,
+                state_file=state_file, verbose=verbose,
+            )
             if self.center_axis is not None:
-                mean /= mean_count
+                center_moments = moments.reduce(sorted(center_axis - axis))
+                mean = center_moments.mean
+            else:
+                mean = 0.
             if self.scale_axis is not None:
-                energy /= energy_count
+                scale_moments = moments.reduce(sorted(scale_axis - axis))
+                # energy - mean ** 2 without cancellation
+                var = scale_moments.var + (
+                    (scale_moments.mean - mean) * (scale_moments.mean + mean)
+                )
                 scale = np.sqrt(np.mean(
-                    energy - mean ** 2, axis=self.scale_axis, keepdims=True
+                    var, axis=self.scale_axis, keepdims=True
                 ))
             else:
                 scale = np.array(1.)
+            mean = np.array(mean)
 
             if filepath is not None:
                 with filepath.open('w') as fid:
@@ -162,6 +174,8 @@ class Normalizer:
                         (mean.tolist(), scale.tolist()), fid,
                         sort_keys=True, indent=4
                     )
+                if state_file.exists():
+                    state_file.unlink()
                 if verbose:
                     print(f'Saved moments to {filepath}')
         self.moments = np.array(mean), np.array(scale)
@@ -308,19 +322,19 @@ class Collate:
                 target_shape = np.min(shapes, axis=0)
             else:
                 target_shape = np.max(shapes, axis=0)
+            # write each array with a single copy into a preallocated batch
+            out = np.zeros((len(batch), *target_shape), dtype=batch[0].dtype)
             for i, array in enumerate(batch):
                 diff = target_shape - array.shape
                 assert np.argwhere(diff != 0).size <= 1, (
                     'arrays are only allowed to differ in one dim',
                     array.shape, target_shape,
                 )
-                if np.any(diff > 0):
-                    pad = [(0, n) for n in diff]
-                    batch[i] = np.pad(array, pad_width=pad, mode='constant')
-                elif np.any(diff < 0):
-                    sliceing = [slice(None) if n >= 0 else slice(n) for n in diff]
-                    batch[i] = array[tuple(sliceing)]
-            batch = np.array(batch).astype(batch[0].dtype)
+                sliceing = tuple(
+                    slice(min(n, m)) for n, m in zip(array.shape, target_shape)
+                )
+                out[i][sliceing] = array[sliceing]
+            batch = out
             if self.to_tensor:
                 batch = torch.from_numpy(batch)
         return batch
@@ -4,7 +4,9 @@ from padertorch.contrib.je.modules.gmm import GMM
 from padertorch.ops.losses import gaussian_kl_divergence
 from torch import nn
 
-from padertorch.contrib.je.modules.hmm_utils import batch_forward_backward, batch_viterbi, squeeze_sequence
+from padertorch.contrib.je.modules.hmm_torch import (
+    LeftToRightTransitions, batch_forward_backward, batch_viterbi
+)
 from padertorch.utils import to_list
 
 
@@ -63,70 +65,122 @@ class HMM(GMM):
         )
         return log_transition_mat
 
+    @property
+    def log_transitions(self):
+        """
+        The transitions of `log_transition_mat` as `LeftToRightTransitions`,
+        which allow inference in O(num_classes) per frame. With a single
+        state per unit, the self transitions and the transitions between
+        units overlap and the dense `log_transition_mat` is returned.
+        """
+        if self.states_per_unit == 1:
+            return self.log_transition_mat
+        num_states = self.num_classes
+        states = torch.arange(num_states, device=self.log_weights.device)
+        first_states = states % self.states_per_unit == 0
+        last_states = states % self.states_per_unit == self.states_per_unit - 1
+        log_half = torch.full(
+            (num_states,), np.log(0.5), device=self.log_weights.device)
+        return LeftToRightTransitions(
+            log_self=log_half,
+            log_next=log_half.masked_fill(first_states, -np.inf),
+            log_exit=log_half.masked_fill(~last_states, -np.inf),
+            log_entry=torch.max(
+                self.log_class_probs, -100 * torch.ones_like(self.log_class_probs)
+            ).masked_fill(~first_states, -np.inf),
+        )
+
     def forward(
             self, qz, seq_len=None, unit_sequence=None,
             no_onset=False, no_offset=False
     ):
-        log_rho = -kl_divergence(qz, self.gaussians)
+        log_rho = -gaussian_kl_divergence(qz, self.gaussians)
+        b, t, k = log_rho.shape
+        if seq_len is None:
+            seq_len = b * [t]
 
-        no_onset = to_list(no_onset, log_rho.shape[0])
-        no_offset = to_list(no_offset, log_rho.shape[0])
-        log_startprob = np.array([
-            -np.ones(self.num_classes)*np.log(self.num_classes) if non
-            else self.log_class_probs.detach().cpu().numpy().astype(np.float)
-            for non in no_onset
-        ])
-        log_transmat = self.log_transition_mat.detach().cpu().numpy().astype(np.float)
-        framelogprob = log_rho.detach().cpu().numpy().astype(np.float)
+        # The inference runs on the device of log_rho without gradients and
+        # in double precision, because log_rho may be in the order of -1e3.
+        with torch.no_grad():
+            no_onset = to_list(no_onset, b)
+            no_offset = to_list(no_offset, b)
+            log_class_probs = self.log_class_probs.double()
+            log_startprob = torch.where(
+                torch.tensor(no_onset, device=log_rho.device)[:, None],
+                -np.log(k) * torch.ones_like(log_class_probs),
+                log_class_probs,
+            )
+            log_transitions = self.log_transitions
+            if isinstance(log_transitions, LeftToRightTransitions):
+                log_transitions = LeftToRightTransitions(
+                    *[field.double() for field in log_transitions])
+            else:
+                log_transitions = log_transitions.double()
+            framelogprob = log_rho.double()
 
-        initial_state = [None if non else self.initial_state for non in no_onset]
-        final_state = [None if noff else self.final_state for noff in no_offset]
-        for i, noff in enumerate(no_offset):
-            if not noff and self.final_state is None:
-                mask = np.zeros(self.num_classes)
+            initial_state = [None if non else self.initial_state for non in no_onset]
+            final_state = [None if noff else self.final_state for noff in no_offset]
+            # Without a final state, the last frame has to be the last state
+            # of a unit, if the sequence has an offset.
+            end_in_unit = torch.tensor([
+                not noff and self.final_state is None for noff in no_offset
+            ], device=log_rho.device)
+            if end_in_unit.any():
+                mask = framelogprob.new_zeros(k)
                 mask[self.states_per_unit - 1::self.states_per_unit] = 1.
-                framelogprob[i, -1] += np.log(mask)
+                last = torch.as_tensor(seq_len, device=log_rho.device) - 1
+                framelogprob[torch.arange(b), last] += torch.where(
+                    end_in_unit[:, None], torch.log(mask), 0.
+                )
 
-        if unit_sequence is not None:
-            states_per_unit = self.hmm.states_per_unit
-            state_sequence = [
-                state_sequence_from_unit_sequence(seq, states_per_unit)
-                for seq in unit_sequence
-            ]
-        else:
-            state_sequence = None
+            if unit_sequence is not None:
+                state_sequence = [
+                    state_sequence_from_unit_sequence(seq, self.states_per_unit)
+                    for seq in unit_sequence
+                ]
+            else:
+                state_sequence = None
 
-        if not self.training or self.viterbi_training:
-            b, t, k = framelogprob.shape
-            state_alignment = batch_viterbi(
-                log_startprob, log_transmat, framelogprob, seq_len=seq_len,
-                state_sequence=state_sequence,
-                initial_state=initial_state, final_state=final_state
-            )
-            state_alignment = state_alignment.astype(np.int)
-            class_posteriors = np.zeros_like(framelogprob)
-            state_transitions = np.zeros((b, k, k))
-            class_posteriors[np.arange(b)[:, None], np.arange(t), state_alignment] = 1.
-            src_idx = state_alignment[:, :-1]
-            dst_idx = state_alignment[:, 1:]
-            np.add.at(state_transitions, (np.arange(b)[:, None], src_idx, dst_idx), 1)
-        else:
-            class_posteriors, state_transitions = batch_forward_backward(
-                log_startprob, log_transmat, framelogprob, seq_len=seq_len,
-                state_sequence=state_sequence,
-                initial_state=initial_state, final_state=final_state
-            )
+            if not self.training or self.viterbi_training:
+                state_alignment = batch_viterbi(
+                    log_startprob, log_transitions, framelogprob,
+                    seq_len=seq_len, state_sequence=state_sequence,
+                    initial_state=initial_state, final_state=final_state
+                )
+                valid = (
+                    torch.arange(t, device=log_rho.device)
+                    < torch.as_tensor(seq_len, device=log_rho.device)[:, None]
+                )
+                class_posteriors = torch.nn.functional.one_hot(
+                    state_alignment, k
+                ) * valid[..., None]
+                state_transitions = state_alignment.new_zeros((b, k * k))
+                state_transitions.scatter_add_(
+                    1, state_alignment[:, :-1] * k + state_alignment[:, 1:],
+                    valid[:, 1:].long()
+                )
+                state_transitions = state_transitions.view(b, k, k)
+            else:
+                class_posteriors, state_transitions = batch_forward_backward(
+                    log_startprob, log_transitions, framelogprob,
+                    seq_len=seq_len, state_sequence=state_sequence,
+                    initial_state=initial_state, final_state=final_state
+                )
 
         return (
-            torch.Tensor(class_posteriors).to(log_rho.device),
-            torch.Tensor(state_transitions).to(log_rho.device),
+            class_posteriors.to(log_rho.dtype),
+            state_transitions.to(log_rho.dtype),
             log_rho
         )
 
 
 def state_sequence_from_unit_sequence(unit_sequence, states_per_unit):
+    unit_sequence = [
+        int(unit) for i, unit in enumerate(unit_sequence)
+        if i == 0 or unit != unit_sequence[i - 1]
+    ]
     return [
         unit * states_per_unit + i
-        for unit in squeeze_sequence(unit_sequence)
+        for unit in unit_sequence
         for i in range(states_per_unit)
     ]
@@ -0,0 +1,450 @@
+"""
+Batched forward-backward and Viterbi algorithms in the log domain for hidden
+Markov models in torch. In contrast to `hmm_utils`, which runs hmmlearn for
+each example on the CPU, all examples of a batch are processed at once on
+the device of the inputs.
+
+The transitions are either a dense matrix of log transition probabilities
+(O(K^2) per frame) or `LeftToRightTransitions` (O(K) per frame), which
+represent the sparse structure of a sequence of left to right unit HMMs.
+"""
+import typing
+
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+__all__ = [
+    'LeftToRightTransitions',
+    'batch_forward_backward',
+    'batch_viterbi',
+]
+
+
+class LeftToRightTransitions(typing.NamedTuple):
+    """
+    Log transition probabilities of left to right HMMs that are connected
+    by the transitions from exit to entry states. The probability of the
+    transition from state j to state k is the sum of
+     - `exp(log_self[k])`, if `j == k`,
+     - `exp(log_next[k])`, if `j == k - 1` and
+     - `exp(log_exit[j] + log_entry[k])`.
+
+    Each field has the shape (K,) or (B, K) for transitions that differ
+    between the examples. Forbidden transitions are `-inf`.
+
+    >>> transitions = LeftToRightTransitions(
+    ...     log_self=torch.log(torch.tensor([.5, .5, .5])),
+    ...     log_next=torch.log(torch.tensor([0., .5, 0.])),
+    ...     log_exit=torch.log(torch.tensor([0., .5, .5])),
+    ...     log_entry=torch.log(torch.tensor([1., 0., 0.])),
+    ... )
+    >>> torch.exp(transitions.dense())
+    tensor([[0.5000, 0.5000, 0.0000],
+            [0.5000, 0.5000, 0.0000],
+            [0.5000, 0.0000, 0.5000]])
+    """
+    log_self: torch.Tensor
+    log_next: torch.Tensor
+    log_exit: torch.Tensor
+    log_entry: torch.Tensor
+
+    def dense(self):
+        """Returns the log transition matrix with shape (K, K) or (B, K, K)."""
+        log_self, log_next, log_exit, log_entry = torch.broadcast_tensors(
+            *self)
+        log_transmat = log_exit[..., :, None] + log_entry[..., None, :]
+        diagonal = torch.diagonal(log_transmat, dim1=-2, dim2=-1)
+        diagonal.copy_(torch.logaddexp(diagonal, log_self))
+        diagonal = torch.diagonal(log_transmat, offset=1, dim1=-2, dim2=-1)
+        diagonal.copy_(torch.logaddexp(diagonal, log_next[..., 1:]))
+        return log_transmat
+
+    def expand(self, batch_size):
+        return LeftToRightTransitions(*[
+            field.expand(batch_size, field.shape[-1]) for field in self
+        ])
+
+
+def _shift_right(x):
+    """x[..., k-1] at position k, -inf at position 0"""
+    return F.pad(x[..., :-1], (1, 0), value=-np.inf)
+
+
+def _shift_left(x):
+    """x[..., k+1] at position k, -inf at position K-1"""
+    return F.pad(x[..., 1:], (0, 1), value=-np.inf)
+
+
+def _forward_step(log_alpha, transitions):
+    if isinstance(transitions, LeftToRightTransitions):
+        return torch.logsumexp(torch.stack([
+            log_alpha + transitions.log_self,
+            _shift_right(log_alpha) + transitions.log_next,
+            torch.logsumexp(log_alpha + transitions.log_exit, -1, keepdim=True)
+            + transitions.log_entry,
+        ]), dim=0)
+    return torch.logsumexp(log_alpha[..., :, None] + transitions, dim=-2)
+
+
+def _backward_step(log_beta_frame, transitions):
+    """log_beta_frame is the sum of log_beta and framelogprob of frame t+1"""
+    if isinstance(transitions, LeftToRightTransitions):
+        return torch.logsumexp(torch.stack([
+            log_beta_frame + transitions.log_self,
+            _shift_left(log_beta_frame + transitions.log_next),
+            transitions.log_exit + torch.logsumexp(
+                log_beta_frame + transitions.log_entry, -1, keepdim=True),
+        ]), dim=0)
+    return torch.logsumexp(transitions + log_beta_frame[..., None, :], dim=-1)
+
+
+def _viterbi_step(log_delta, transitions):
+    """Returns the best scores and the best predecessor of each state."""
+    if isinstance(transitions, LeftToRightTransitions):
+        log_exit, exit_state = torch.max(
+            log_delta + transitions.log_exit, -1, keepdim=True)
+        log_delta, choice = torch.max(torch.stack([
+            log_delta + transitions.log_self,
+            _shift_right(log_delta) + transitions.log_next,
+            log_exit + transitions.log_entry,
+        ]), dim=0)
+        states = torch.arange(log_delta.shape[-1], device=log_delta.device)
+        predecessor = torch.where(
+            choice == 0, states,
+            torch.where(choice == 1, states - 1, exit_state)
+        )
+        return log_delta, predecessor
+    return torch.max(log_delta[..., :, None] + transitions, dim=-2)
+
+
+def _to_index(states, batch_size, device):
+    """Converts a list with states or None to a tensor with -1 for None."""
+    if states is None:
+        states = batch_size * [None]
+    return torch.tensor(
+        [-1 if s is None else int(s) for s in states], device=device)
+
+
+def _log_one_hot(index, num_states, like):
+    """(B, num_states) with 0 at the index and -inf elsewhere"""
+    states = torch.arange(num_states, device=like.device)
+    return torch.where(
+        states == index[:, None],
+        torch.zeros((), dtype=like.dtype, device=like.device),
+        torch.full((), -np.inf, dtype=like.dtype, device=like.device),
+    )
+
+
+def _prepare(
+        log_startprob, transitions, framelogprob, seq_len,
+        initial_state, final_state,
+):
+    B, T, K = framelogprob.shape
+    device = framelogprob.device
+    if seq_len is None:
+        seq_len = torch.full((B,), T, device=device)
+    else:
+        seq_len = torch.as_tensor(seq_len, device=device)
+    valid = torch.arange(T, device=device) < seq_len[:, None]
+
+    log_startprob = log_startprob.expand(B, K)
+    initial_state = _to_index(initial_state, B, device)
+    log_startprob = torch.where(
+        (initial_state >= 0)[:, None],
+        _log_one_hot(initial_state, K, log_startprob),
+        log_startprob,
+    )
+    final_state = _to_index(final_state, B, device)
+    if (final_state >= 0).any():
+        batch = torch.arange(B, device=device)
+        last_frame = framelogprob[batch, seq_len - 1]
+        framelogprob = framelogprob.clone()
+        framelogprob[batch, seq_len - 1] = torch.where(
+            (final_state >= 0)[:, None],
+            _log_one_hot(final_state, K, framelogprob),
+            last_frame,
+        )
+    if isinstance(transitions, LeftToRightTransitions):
+        transitions = transitions.expand(B)
+    return log_startprob, transitions, framelogprob, seq_len, valid
+
+
+def _observe_state_sequence(
+        log_startprob, transitions, framelogprob, seq_len, state_sequence
+):
+    """
+    Transforms the HMM of each example into a left to right HMM along the
+    observed (squeezed) state sequence, see
+    `hmm_utils.prepare_obvserved_state_sequence`.
+
+    Returns the left to right HMM and the (B, S) state indices.
+    """
+    B, T, K = framelogprob.shape
+    device = framelogprob.device
+    state_sequence = [
+        [s for i, s in enumerate(seq) if i == 0 or s != seq[i - 1]]
+        for seq in state_sequence
+    ]
+    S = max(len(seq) for seq in state_sequence)
+    num_states = torch.tensor([len(seq) for seq in state_sequence], device=device)
+    index = torch.tensor(
+        [list(seq) + (S - len(seq)) * [0] for seq in state_sequence],
+        device=device,
+    )
+    padding = torch.arange(S, device=device) >= num_states[:, None]
+
+    if isinstance(transitions, LeftToRightTransitions):
+        transitions = transitions.dense()
+    transitions = transitions.expand(B, K, K)
+    batch = torch.arange(B, device=device)[:, None]
+    log_self = transitions[batch, index, index].masked_fill(padding, -np.inf)
+    log_next = F.pad(
+        transitions[batch, index[:, :-1], index[:, 1:]], (1, 0),
+        value=-np.inf,
+    ).masked_fill(padding, -np.inf)
+    no_transition = torch.full_like(log_self, -np.inf)
+    transitions = LeftToRightTransitions(
+        log_self, log_next, no_transition, no_transition)
+
+    log_startprob = log_startprob.expand(B, K).gather(1, index)
+    framelogprob = framelogprob.gather(2, index[:, None].expand(B, T, S))
+    framelogprob = framelogprob.masked_fill(padding[:, None], -np.inf)
+    # The first and the last frame are assigned to the first and last state
+    framelogprob[:, 0] = _log_one_hot(
+        torch.zeros_like(num_states), S, framelogprob)
+    framelogprob[batch[:, 0], seq_len - 1] = _log_one_hot(
+        num_states - 1, S, framelogprob)
+    return log_startprob, transitions, framelogprob, index
+
+
+def _forward_backward(log_startprob, transitions, framelogprob, valid):
+    B, T, K = framelogprob.shape
+    log_alpha = log_startprob + framelogprob[:, 0]
+    log_alphas = [log_alpha]
+    for t in range(1, T):
+        log_alpha = torch.where(
+            valid[:, t, None],
+            _forward_step(log_alpha, transitions) + framelogprob[:, t],
+            log_alpha,
+        )
+        log_alphas.append(log_alpha)
+    log_alphas = torch.stack(log_alphas, dim=1)
+    # log_alpha of the last frame is kept for the padding
+    log_prob = torch.logsumexp(log_alpha, dim=-1)
+
+    log_beta = torch.zeros_like(log_alpha)
+    log_betas = [log_beta]
+    for t in range(T - 2, -1, -1):
+        log_beta = torch.where(
+            valid[:, t + 1, None],
+            _backward_step(log_beta + framelogprob[:, t + 1], transitions),
+            log_beta,
+        )
+        log_betas.append(log_beta)
+    log_betas = torch.stack(log_betas[::-1], dim=1)
+
+    # Normalize each frame explicitly, see hmm_utils._compute_posteriors
+    posteriors = torch.softmax(log_alphas + log_betas, dim=-1)
+    posteriors = posteriors * valid[..., None]
+
+    if T < 2:
+        return posteriors, posteriors.new_zeros((B, K, K))
+    return posteriors, _expected_transitions(
+        log_alphas[:, :-1], log_betas[:, 1:] + framelogprob[:, 1:],
+        transitions, log_prob, valid[:, 1:],
+    )
+
+
+def _expected_transitions(log_alpha, log_c, transitions, log_prob, valid):
+    """
+    Sum over t of the posterior probabilities of the transitions
+        exp(log_alpha[t, j] + A[j, k] + log_c[t, k] - log_prob),
+    where log_c[t] is the sum of log_beta and framelogprob of frame t+1.
+    """
+    B, T, K = log_alpha.shape
+    log_prob = log_prob[:, None, None]
+    valid = valid[..., None]
+    if not isinstance(transitions, LeftToRightTransitions):
+        expected_transitions = log_alpha.new_zeros((B, K, K))
+        for t in range(T):
+            expected_transitions += torch.where(
+                valid[:, t, None],
+                torch.exp(
+                    log_alpha[:, t, :, None] + transitions
+                    + log_c[:, t, None, :] - log_prob
+                ),
+                0.,
+            )
+        return expected_transitions
+
+    log_self, log_next, log_exit, log_entry = [
+        field[:, None] for field in transitions
+    ]
+    xi_self = torch.where(
+        valid, torch.exp(log_alpha + log_self + log_c - log_prob), 0.
+    ).sum(1)
+    xi_next = torch.where(
+        valid,
+        torch.exp(_shift_right(log_alpha) + log_next + log_c - log_prob), 0.
+    ).sum(1)
+
+    # The transitions between units are separable, hence their sum over t is
+    # a matrix product. Each frame is scaled by the maxima of the exit and
+    # entry terms, which form an allowed transition, so that the scaled
+    # terms are at most one.
+    log_a = log_alpha + log_exit
+    log_c = log_c + log_entry
+    max_a = torch.max(log_a, -1, keepdim=True)[0]
+    max_c = torch.max(log_c, -1, keepdim=True)[0]
+    valid = valid & torch.isfinite(max_a) & torch.isfinite(max_c)
+    weights = torch.where(valid, torch.exp(max_a + max_c - log_prob), 0.)
+    a = torch.where(valid, torch.exp(log_a - max_a), 0.)
+    c = torch.where(valid, torch.exp(log_c - max_c), 0.)
+    xi_between = (a * weights).transpose(1, 2) @ c
+
+    return (
+        xi_between
+        + torch.diag_embed(xi_self)
+        + torch.diag_embed(xi_next[:, 1:], offset=1)
+    )
+
+
+def _viterbi(log_startprob, transitions, framelogprob, seq_len, valid):
+    B, T, K = framelogprob.shape
+    log_delta = log_startprob + framelogprob[:, 0]
+    predecessors = []
+    for t in range(1, T):
+        log_delta_, predecessor = _viterbi_step(log_delta, transitions)
+        log_delta = torch.where(
+            valid[:, t, None], log_delta_ + framelogprob[:, t], log_delta)
+        predecessors.append(predecessor)
+
+    # log_delta of the last frame is kept for the padding
+    state = torch.argmax(log_delta, dim=-1)
+    alignment = [state]
+    for t in range(T - 1, 0, -1):
+        state = torch.where(
+            t < seq_len,
+            predecessors[t - 1].gather(1, state[:, None])[:, 0],
+            state,
+        )
+        alignment.append(state)
+    alignment = torch.stack(alignment[::-1], dim=1)
+    return alignment * valid
+
+
+def batch_forward_backward(
+        log_startprob, log_transmat, framelogprob, seq_len=None,
+        state_sequence=None, initial_state=None, final_state=None,
+):
+    """
+    Batched forward-backward algorithm in the log domain.
+
+    >>> log_startprob = torch.log(torch.tensor([1., 0., 0.]))
+    >>> transitions = LeftToRightTransitions(
+    ...     log_self=torch.log(torch.tensor([.5, .5, .5])),
+    ...     log_next=torch.log(torch.tensor([0., .5, 0.])),
+    ...     log_exit=torch.log(torch.tensor([0., .5, .5])),
+    ...     log_entry=torch.log(torch.tensor([1., 0., 0.])),
+    ... )
+    >>> framelogprob = torch.zeros((2, 4, 3))
+    >>> posteriors, transitions = batch_forward_backward(
+    ...     log_startprob, transitions, framelogprob, seq_len=[4, 2],
+    ...     final_state=[1, None])
+    >>> posteriors
+    tensor([[[1.0000, 0.0000, 0.0000],
+             [0.5000, 0.5000, 0.0000],
+             [0.5000, 0.5000, 0.0000],
+             [0.0000, 1.0000, 0.0000]],
+    <BLANKLINE>
+            [[1.0000, 0.0000, 0.0000],
+             [0.5000, 0.5000, 0.0000],
+             [0.0000, 0.0000, 0.0000],
+             [0.0000, 0.0000, 0.0000]]])
+    >>> transitions.sum((1, 2))
+    tensor([3., 1.])
+
+    Args:
+        log_startprob: (K,) or (B, K)
+        log_transmat: (K, K) or (B, K, K) tensor or `LeftToRightTransitions`
+        framelogprob: (B, T, K)
+        seq_len: Optional sequence lengths (B,)
+        state_sequence: Optional list of observed state sequences. The
+            HMM is restricted to pass through these states in that order.
+            If given, `initial_state` and `final_state` are ignored.
+        initial_state: Optional list with the initial state or `None` for
+            each example.
+        final_state: Optional list with the final state or `None` for each
+            example.
+
+    Returns:
+        state posteriors (B, T, K), which are zero for padded frames, and
+        expected number of transitions (B, K, K)
+    """
+    B, T, K = framelogprob.shape
+    log_startprob, transitions, framelogprob, seq_len, valid = _prepare(
+        log_startprob, log_transmat, framelogprob, seq_len,
+        None if state_sequence is not None else initial_state,
+        None if state_sequence is not None else final_state,
+    )
+    if state_sequence is None:
+        return _forward_backward(
+            log_startprob, transitions, framelogprob, valid)
+
+    log_startprob, transitions, framelogprob, index = _observe_state_sequence(
+        log_startprob, transitions, framelogprob, seq_len, state_sequence)
+    posteriors_, transitions_ = _forward_backward(
+        log_startprob, transitions, framelogprob, valid)
+    S = index.shape[-1]
+    posteriors = posteriors_.new_zeros((B, T, K)).scatter_add_(
+        2, index[:, None].expand(B, T, S), posteriors_)
+    transitions = transitions_.new_zeros((B, K * K)).scatter_add_(
+        1, (index[:, :, None] * K + index[:, None, :]).flatten(1),
+        transitions_.flatten(1),
+    ).view(B, K, K)
+    return posteriors, transitions
+
+
+def batch_viterbi(
+        log_startprob, log_transmat, framelogprob, seq_len=None,
+        state_sequence=None, initial_state=None, final_state=None,
+):
+    """
+    Batched Viterbi algorithm.
+
+    >>> log_startprob = torch.log(torch.tensor([1., 0., 0.]))
+    >>> log_transmat = torch.log(torch.tensor(
+    ...     [[.5, .5, 0.], [.5, .5, 0.], [.5, 0., .5]]))
+    >>> framelogprob = torch.log(torch.tensor([
+    ...     [[.8, .1, .1], [.1, .8, .1], [.8, .1, .1], [.1, .1, .8]],
+    ...     [[.8, .1, .1], [.1, .8, .1], [.8, .1, .1], [.1, .1, .8]],
+    ... ]))
+    >>> batch_viterbi(log_startprob, log_transmat, framelogprob, seq_len=[4, 3])
+    tensor([[0, 1, 0, 0],
+            [0, 1, 0, 0]])
+    >>> batch_viterbi(
+    ...     log_startprob, log_transmat, framelogprob, final_state=[1, None])
+    tensor([[0, 1, 0, 1],
+            [0, 1, 0, 0]])
+
+    Args:
+        See `batch_forward_backward`
+
+    Returns:
+        state alignment (B, T), which is zero for padded frames
+    """
+    log_startprob, transitions, framelogprob, seq_len, valid = _prepare(
+        log_startprob, log_transmat, framelogprob, seq_len,
+        None if state_sequence is not None else initial_state,
+        None if state_sequence is not None else final_state,
+    )
+    if state_sequence is None:
+        return _viterbi(
+            log_startprob, transitions, framelogprob, seq_len, valid)
+
+    log_startprob, transitions, framelogprob, index = _observe_state_sequence(
+        log_startprob, transitions, framelogprob, seq_len, state_sequence)
+    alignment = _viterbi(
+        log_startprob, transitions, framelogprob, seq_len, valid)
+    return index.gather(1, alignment) * valid
@@ -1,7 +1,7 @@
 import numpy as np
 import torch
 from torch import nn
-from padertorch.ops.sequence.mask import compute_mask
+from padertorch.ops.sequence.mask import compute_sequence_mask
 
 
 class Sum(nn.Module):
@@ -16,10 +16,10 @@ class Sum(nn.Module):
         super().__init__()
 
     def __call__(self, x, seq_len=None):
-        if seq_len is None:
+        mask = compute_sequence_mask(x, seq_len, 0, self.axis)
+        if mask is None:
             x = x.sum(self.axis, keepdim=self.keepdims)
         else:
-            mask = compute_mask(x, seq_len, 0, self.axis)
             x = (x * mask).sum(dim=self.axis, keepdim=self.keepdims)
         return x
 
@@ -35,10 +35,10 @@ class Mean(Sum):
     >>> x.shape
     """
     def __call__(self, x, seq_len=None):
-        if seq_len is None:
+        mask = compute_sequence_mask(x, seq_len, 0, self.axis)
+        if mask is None:
             x = x.mean(self.axis, keepdim=self.keepdims)
         else:
-            mask = compute_mask(x, seq_len, 0, self.axis)
             x = (x * mask).sum(dim=self.axis, keepdim=self.keepdims) / (mask.sum(dim=self.axis, keepdim=self.keepdims) + 1e-6)
         return x
 
@@ -55,9 +55,9 @@ class Max(nn.Module):
         super().__init__()
 
     def __call__(self, x, seq_len=None):
-        if seq_len is not None:
-            mask = compute_mask(x, seq_len, 0, self.axis)
-            x = (x + torch.log(mask))
+        mask = compute_sequence_mask(x, seq_len, 0, self.axis)
+        if mask is not None:
+            x = x.masked_fill(~mask, -float('inf'))
         x = x.max(self.axis, keepdim=self.keepdims)
         return x
 
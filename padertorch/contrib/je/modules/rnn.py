@@ -1,7 +1,7 @@
 from torch import nn
 import torch
 from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
-from padertorch.ops.sequence.mask import compute_mask
+from padertorch.ops.sequence.mask import compute_sequence_mask
 
 
 class RNN(nn.Module):
@@ -64,5 +64,7 @@ def reverse_sequence(x, seq_len=None):
             ]),
             dim=0
         )
-        mask = compute_mask(x, seq_len)
-    return x * mask
+        mask = compute_sequence_mask(x, seq_len)
+        if mask is not None:
+            x = x * mask
+    return x
@@ -5,10 +5,12 @@ import numpy as np
 from padertorch.base import Module
 from padertorch.ops.mappings import ACTIVATION_FN_MAP
 from padertorch.modules.normalization import Normalization
-from padertorch.ops.sequence.mask import compute_mask
+from padertorch.ops.sequence.mask import compute_sequence_mask
 
 
-def scaled_dot_product_attention(q, k, v, seq_len=None, bidirectional=False):
+def scaled_dot_product_attention(
+        q, k, v, seq_len=None, bidirectional=False, mask=None
+):
     """
     >>> q = torch.zeros((2, 3, 4))
     >>> k = torch.zeros((2, 6, 4))
@@ -17,23 +19,137 @@ def scaled_dot_product_attention(q, k, v, seq_len=None, bidirectional=False):
     >>> x.shape
     torch.Size([2, 3, 8])
     >>> q = torch.zeros((2, 6, 4))
-    >>> x = scaled_dot_product_attention(q, k, v, causal=True)
+    >>> x = scaled_dot_product_attention(q, k, v)
     >>> (x[0,0] == v[0,0]).all()
-    tensor(1, dtype=torch.uint8)
+    tensor(True)
     >>> (torch.abs(x[0,-1] - v[0].mean(0)) < 1e-6).all()
-    tensor(1, dtype=torch.uint8)
-    >>> x = scaled_dot_product_attention(q, k, v, seq_len=[6,4])
+    tensor(True)
+    >>> x = scaled_dot_product_attention(q, k, v, seq_len=[6,4], bidirectional=True)
+
+    Args:
+        q: queries (..., Tq, D)
+        k: keys (..., Tk, D)
+        v: values (..., Tk, D')
+        seq_len: lengths of the keys, only used if bidirectional
+        bidirectional: if False, the last query is aligned with the last key
+            and a query attends only to keys that are not in its future.
+            A single query attends to all keys, so no mask is built.
+        mask: optional boolean mask that is broadcastable to (..., Tq, Tk),
+            where True marks the keys a query attends to. Replaces the causal
+            and the sequence mask.
+
+    Returns:
+        (..., Tq, D')
     """
     y = q@k.transpose(-2, -1)/np.sqrt(k.shape[-1])
-    if not bidirectional:
-        mask = get_causal_mask(y)
-        y = y + torch.log((mask > 0).float())
-    elif seq_len is not None:
-        mask = compute_mask(y, seq_len, sequence_axis=-1)
-        y = y + torch.log((mask > 0).float())
+    if mask is None:
+        if not bidirectional:
+            if y.shape[-2] > 1:
+                mask = get_causal_mask(y)
+        else:
+            mask = compute_sequence_mask(y, seq_len, sequence_axis=-1)
+    if mask is not None:
+        y = y.masked_fill(~mask, -float('inf'))
     return torch.softmax(y, dim=-1)@v
 
 
+class KVCache:
+    """
+    Projected keys and values of a `MultiHeadAttention` for incremental
+    decoding, i.e., the state of a `TransformerBlock`. The keys and values
+    are stored with shape (B, num_heads, capacity, D/num_heads) in a
+    preallocated buffer, that is updated in place.
+
+    Without `max_context` the buffer grows by doubling its capacity. With
+    `max_context` it is a ring buffer of `max_context` frames and a query
+    attends only to the last `max_context` frames (including itself), hence
+    the memory and the time of a decoding step are constant.
+
+    The updates are in place, hence a cache should not be used, when
+    gradients through previous steps are required.
+
+    >>> cache = KVCache(max_context=3)
+    >>> for t in range(5):
+    ...     cache.append(torch.full((1, 1, 1, 1), t), torch.zeros((1, 1, 1, 1)))
+    >>> len(cache), cache.length
+    (3, 5)
+    >>> cache.keys.flatten(), cache.positions
+    (tensor([3, 4, 2]), tensor([3, 4, 2]))
+    """
+    def __init__(self, max_context=None):
+        assert max_context is None or max_context > 0, max_context
+        self.max_context = max_context
+        self.key = None
+        self.value = None
+        self._positions = None
+        self.length = 0  # number of frames that have been appended
+
+    def __len__(self):
+        """Number of cached frames"""
+        if self.key is None:
+            return 0
+        return min(self.length, self.key.shape[-2])
+
+    @property
+    def keys(self):
+        return self.key[..., :len(self), :]
+
+    @property
+    def values(self):
+        return self.value[..., :len(self), :]
+
+    @property
+    def positions(self):
+        """Time index of each cached frame"""
+        if self.max_context is None:
+            return torch.arange(self.length, device=self.key.device)
+        return self._positions[:len(self)]
+
+    def append(self, key, value):
+        """
+        Args:
+            key: (B, num_heads, T, D/num_heads)
+            value: (B, num_heads, T, D/num_heads)
+        """
+        T = key.shape[-2]
+        if self.max_context is None:
+            if self.key is None:
+                # Store the tensors without a copy. They are never changed in
+                # place, because the next append has to grow the buffer.
+                self.key, self.value = key, value
+            else:
+                if self.length + T > self.key.shape[-2]:
+                    capacity = max(2 * self.key.shape[-2], self.length + T)
+                    self.key = self._grow(self.key, capacity)
+                    self.value = self._grow(self.value, capacity)
+                self.key[..., self.length:self.length + T, :] = key
+                self.value[..., self.length:self.length + T, :] = value
+        else:
+            if self.key is None:
+                shape = (*key.shape[:-2], self.max_context, key.shape[-1])
+                self.key = key.new_empty(shape)
+                self.value = value.new_empty(
+                    (*shape[:-1], value.shape[-1]))
+                self._positions = torch.empty(
+                    self.max_context, dtype=torch.long, device=key.device)
+            positions = torch.arange(
+                self.length, self.length + T, device=key.device)
+            if T > self.max_context:
+                key = key[..., -self.max_context:, :]
+                value = value[..., -self.max_context:, :]
+                positions = positions[-self.max_context:]
+            slots = positions % self.max_context
+            self.key.index_copy_(-2, slots, key)
+            self.value.index_copy_(-2, slots, value)
+            self._positions.index_copy_(0, slots, positions)
+        self.length += T
+
+    def _grow(self, x, capacity):
+        y = x.new_empty((*x.shape[:-2], capacity, x.shape[-1]))
+        y[..., :self.length, :] = x[..., :self.length, :]
+        return y
+
+
 class MultiHeadAttention(Module):
     """
     https://arxiv.org/abs/1706.03762
@@ -60,24 +176,89 @@ class MultiHeadAttention(Module):
         self.lin_value = torch.nn.Linear(input_size, output_size)
         self.out = torch.nn.Linear(output_size, output_size)
 
-    def forward(self, q, k, v, seq_len=None):
-        B, Tq, _ = q.shape
-        B, Tk, _ = k.shape
-        q = self.lin_queue(q).view(
-            B, Tq, self.num_heads, self.output_size//self.num_heads
-        ).transpose(1, 2)
-        k = self.lin_key(k).view(
-            B, Tk, self.num_heads, self.output_size//self.num_heads
-        ).transpose(1, 2)
-        v = self.lin_value(v).view(
-            B, Tk, self.num_heads, self.output_size//self.num_heads
+    def _split_heads(self, x):
+        B, T, _ = x.shape
+        return x.view(
+            B, T, self.num_heads, self.output_size//self.num_heads
         ).transpose(1, 2)
-        x = scaled_dot_product_attention(
-            q, k, v, seq_len=seq_len, bidirectional=self.bidirectional
-        )
+
+    def init_state(self, x=None, max_context=None):
+        """
+        Returns a `KVCache`, which is initialized with the keys and values of
+        the inputs `x` (B, T, D), if given.
+        """
+        state = KVCache(max_context)
+        if x is not None:
+            state.append(
+                self._split_heads(self.lin_key(x)),
+                self._split_heads(self.lin_value(x)),
+            )
+        return state
+
+    def forward(self, q, k, v, seq_len=None, state=None):
+        """
+
+        Args:
+            q: (B, Tq, D)
+            k: (B, Tk, D)
+            v: (B, Tk, D)
+            seq_len: lengths of the keys
+            state: optional `KVCache`. The projected keys and values are
+                appended to the cache (in place) and the queries attend to
+                all cached frames, i.e., q, k and v are the next frames of
+                a self attention.
+
+        Returns:
+            (B, Tq, output_size)
+        """
+        B, Tq, _ = q.shape
+        q = self._split_heads(self.lin_queue(q))
+        k = self._split_heads(self.lin_key(k))
+        v = self._split_heads(self.lin_value(v))
+        if state is None or (len(state) == 0 and state.max_context is None):
+            x = scaled_dot_product_attention(
+                q, k, v, seq_len=seq_len, bidirectional=self.bidirectional
+            )
+            if state is not None:
+                state.append(k, v)
+        else:
+            x = self._cached_attention(q, k, v, seq_len, state)
         x = x.transpose(1, 2).contiguous().view(B, Tq, self.output_size)
         return self.out(x)
 
+    def _cached_attention(self, q, k, v, seq_len, state):
+        assert seq_len is None, (
+            'Padding is not supported for the decoding with a KVCache.'
+        )
+        Tq = q.shape[-2]
+        if Tq == 1:
+            # Single step decoding: the query attends to all cached frames,
+            # which are within max_context, hence no mask is necessary.
+            state.append(k, v)
+            return scaled_dot_product_attention(
+                q, state.keys, state.values, bidirectional=True
+            )
+
+        positions = state.length + torch.arange(Tq, device=q.device)
+        key_positions = positions
+        if len(state) > 0:
+            k = torch.cat([state.keys, k], dim=-2)
+            v = torch.cat([state.values, v], dim=-2)
+            key_positions = torch.cat([state.positions, positions])
+        # The cat copied the history, so the cache can be updated before
+        # the attention.
+        state.append(k[..., -Tq:, :], v[..., -Tq:, :])
+
+        mask = None
+        if not self.bidirectional:
+            mask = key_positions <= positions[:, None]
+        if state.max_context is not None:
+            window = key_positions > positions[:, None] - state.max_context
+            mask = window if mask is None else (mask & window)
+        return scaled_dot_product_attention(
+            q, k, v, bidirectional=True, mask=mask
+        )
+
 
 class TransformerBlock(Module):
     """
@@ -121,23 +302,50 @@ class TransformerBlock(Module):
             )
             self.cross_attention_norm = Normalization(**norm_kwargs)
 
+    def init_state(self, x=None, max_context=None):
+        """
+        Returns the state for incremental decoding, see
+        `MultiHeadAttention.init_state`.
+        """
+        return self.multi_head_self_attention.init_state(x, max_context)
+
     def forward(self, x, v=None, seq_len_x=None, seq_len_v=None, state=None):
-        x_ = x if state is None else torch.cat([state, x], 1)
-        h = self.multi_head_self_attention(x, x_, x_, seq_len=seq_len_x)
+        """
+
+        Args:
+            x: (B, T, D)
+            v: (B, Tv, D) inputs of the cross attention
+            seq_len_x:
+            seq_len_v:
+            state: `KVCache` from `init_state` or a previous call, which is
+                updated in place, or a tensor (B, T', D) with the previous
+                inputs.
+
+        Returns:
+            output (B, T, hidden_size) and the `KVCache` of the self attention
+
+        """
+        if state is None:
+            state = KVCache()
+        elif torch.is_tensor(state):
+            state = self.init_state(state)
+        h = self.multi_head_self_attention(
+            x, x, x, seq_len=seq_len_x, state=state
+        )
         if h.shape == x.shape:
             h = h + x
-        h = self.self_attention_norm(h, seq_len=seq_len_x)
+        h = self.self_attention_norm(h, sequence_lengths=seq_len_x)
         if self.cross_attention:
             assert v is not None
             q = h
             h = self.multi_head_cross_attention(q, v, v, seq_len=seq_len_v)
             if h.shape == q.shape:
                 h = h + q
-            h = self.cross_attention_norm(h, seq_len=seq_len_x)
+            h = self.cross_attention_norm(h, sequence_lengths=seq_len_x)
         y = self.out(self.activation(self.hidden(h)))
         y = y + h
-        y = self.output_norm(y, seq_len=seq_len_x)
-        return y, x_
+        y = self.output_norm(y, sequence_lengths=seq_len_x)
+        return y, state
 
 
 class TransformerStack(Module):
@@ -176,6 +384,11 @@ class TransformerStack(Module):
         torch.Size([2, 3, 6])
         >>> attn(x, state=[torch.zeros((2, 6, 8)), torch.zeros((2, 6, 6))])[0].shape
         torch.Size([2, 3, 6])
+        >>> state = attn.init_state(max_context=4)
+        >>> for t in range(x.shape[1]):
+        ...     y, state = attn(x[:, t:t+1], state=state)
+        >>> y.shape, len(state[0]), state[0].length
+        (torch.Size([2, 1, 6]), 3, 3)
         """
         super().__init__()
         self.input_size = input_size
@@ -196,18 +409,42 @@ class TransformerStack(Module):
         else:
             self.output_layer = None
 
+    def init_state(self, max_context=None):
+        """
+        Returns the initial state for incremental decoding, i.e., a `KVCache`
+        for each layer. With `max_context`, each layer attends only to the
+        last `max_context` frames.
+
+        Note that the normalization with the default `norm='layer'` computes
+        the statistics over time and hence depends on future frames. Use
+        `norm='batch'` in eval mode (or `norm=None`) for causal decoding.
+        """
+        return [
+            layer.init_state(max_context=max_context) for layer in self.stack
+        ]
+
     def forward(self, x, v=None, seq_len_x=None, seq_len_v=None, state=None):
         new_state = []
         for i, layer in enumerate(self.stack):
-            x, x_ = layer(
+            x, layer_state = layer(
                 x, v=v, seq_len_x=seq_len_x, seq_len_v=seq_len_v,
                 state=None if state is None else state[i],
             )
-            new_state.append(x_)
+            new_state.append(layer_state)
         if self.output_layer is not None:
             x = self.output_layer(x)
         return x, new_state
 
 
 def get_causal_mask(x):
-    return torch.tril(torch.ones_like(x), diagonal=(x.shape[-1] - x.shape[-2]))
+    """
+    Boolean (Tq, Tk) mask, which is broadcastable to x (..., Tq, Tk), where
+    the last query is aligned with the last key.
+
+    >>> get_causal_mask(torch.zeros(2, 2, 3))
+    tensor([[ True,  True, False],
+            [ True,  True,  True]])
+    """
+    return torch.ones(
+        x.shape[-2:], dtype=torch.bool, device=x.device
+    ).tril(diagonal=(x.shape[-1] - x.shape[-2]))
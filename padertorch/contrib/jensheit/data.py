@@ -15,6 +15,7 @@ from padercontrib.database.keys import *
 from padertorch.contrib.jensheit import Parameterized, dict_func
 from padertorch.contrib.jensheit.batch import Padder
 from padertorch.contrib.jensheit.mask_estimator_example.modul import MaskKeys as M_K
+from padertorch.data.batch import TimeSeriesBucketBatcher
 from pb_bss.extraction.mask_module import biased_binary_mask
 from scipy import signal
 from collections import Generator
@@ -101,6 +102,8 @@ class SequenceProvider(Parameterized):
 
         backend: str = 't'
         drop_last: bool = False
+        max_padding_rate: float = 0.1
+        max_total_size: int = None
         time_segments: int = None
         time_segments_random_offset: bool = False
 
@@ -218,14 +221,18 @@ class SequenceProvider(Parameterized):
             )
         if unbatch:
             iterator = iterator.unbatch()
+        if batch_size is None:
+            batch_size = self.opts.batch_size
         if batch_size is not None:
-            iterator = iterator.batch(batch_size, self.opts.drop_last)
+            # groups examples with similar lengths, the collate sorts them
+            iterator = iterator.apply(TimeSeriesBucketBatcher(
+                batch_size, len_key=NUM_SAMPLES,
+                max_padding_rate=self.opts.max_padding_rate,
+                max_total_size=self.opts.max_total_size,
+                expiration=1000 * batch_size,
+                drop_incomplete=self.opts.drop_last,
+            ))
             iterator = iterator.map(self.collate)
-        else:
-            if self.opts.batch_size is not None:
-                iterator = iterator.batch(self.opts.batch_size,
-                                          self.opts.drop_last)
-                iterator = iterator.map(self.collate)
         return iterator
 
     def train(self):
@@ -1,4 +1,10 @@
 from . import batch
+from . import cache
+from . import moments
+from . import prefetch
 from . import utils
 
 from .batch import *
+from .cache import *
+from .moments import *
+from .prefetch import *
@@ -1,11 +1,15 @@
 import numpy as np
 import torch
+import lazy_dataset
 from typing import Union, Iterable
 
 __all__ = [
     'example_to_device',
     'example_to_numpy',
     'Sorter',
+    'TimeSeriesBucket',
+    'TimeSeriesBucketBatcher',
+    'padding_rate',
 ]
 
 
@@ -139,3 +143,199 @@ class Sorter:
             key=self.key,
             reverse=self.reverse,
         ))
+
+
+class TimeSeriesBucket(lazy_dataset.core.DynamicTimeSeriesBucket):
+    def __init__(
+            self,
+            init_example,
+            batch_size: int,
+            len_key: Union[str, callable],
+            max_padding_rate: float,
+            max_total_size: int = None,
+            group_key: Union[str, callable] = None,
+    ):
+        """
+        `lazy_dataset.core.DynamicTimeSeriesBucket` with a strict
+        `max_total_size`: An example is only appended, when the padded size
+        `len(bucket) * max_length_in_bucket` stays below `max_total_size`
+        with this example. `DynamicTimeSeriesBucket` only checks the budget
+        with the current maximum length, i.e., a longer example can exceed
+        it. An `init_example` that is longer than `max_total_size` forms a
+        bucket on its own.
+
+        Args:
+            init_example: First example in the bucket
+            batch_size: Maximum number of examples in a bucket
+            len_key: Key or callable to obtain the length of an example
+            max_padding_rate: The maximum padding that has to be added to an
+                example, see `DynamicTimeSeriesBucket`
+            max_total_size: If not `None`, the maximum padded size of a
+                bucket, e.g. the number of samples or frames of a batch.
+            group_key: If not `None`, key or callable to obtain a group of
+                an example. Only examples of the same group share a bucket,
+                e.g. the number of speakers.
+        """
+        super().__init__(
+            init_example, batch_size=batch_size, len_key=len_key,
+            max_padding_rate=max_padding_rate, max_total_size=max_total_size,
+        )
+        if group_key is None or callable(group_key):
+            self.group_key = group_key
+        else:
+            self.group_key = lambda example: example[group_key]
+        if self.group_key is not None:
+            self.group = self.group_key(init_example)
+
+    def assess(self, example):
+        if not super().assess(example):
+            return False
+        if self.group_key is not None \
+                and self.group_key(example) != self.group:
+            return False
+        if self.max_total_size is not None:
+            max_len = max(self.max_len, self.len_key(example))
+            return (len(self.data) + 1) * max_len <= self.max_total_size
+        return True
+
+
+class TimeSeriesBucketBatcher:
+    def __init__(
+            self,
+            batch_size: int,
+            len_key: Union[str, callable] = 'num_samples',
+            max_padding_rate: float = 0.1,
+            max_total_size: int = None,
+            group_key: Union[str, callable] = None,
+            expiration: int = None,
+            max_buffered_examples: int = None,
+            drop_incomplete: bool = False,
+            sort_key: Union[str, callable] = None,
+            reverse_sort: bool = True,
+    ):
+        """
+        Groups examples with similar lengths into batches. Meant to replace
+        `.batch(...)` and `.map(Sorter(...))` in a lazy dataset pipeline like
+        `dataset.shuffle(reshuffle=True).apply(TimeSeriesBucketBatcher(4))`
+        followed by `.map(collate_fn)`.
+        It wraps `Dataset.batch_dynamic_time_series_bucket` with the
+        `TimeSeriesBucket`, i.e., the padded size of a batch
+        `len(batch) * max_length_in_batch` never exceeds `max_total_size`.
+        The resulting dataset is not indexable, hence a `.prefetch(...)` with
+        multiple workers has to be applied before this stage.
+        Use `padding_rate` to report the achieved padding.
+
+        Examples:
+            >>> import lazy_dataset
+            >>> lengths = [5, 1, 9, 3, 2, 8, 7, 4]
+            >>> ds = lazy_dataset.new([{'num_samples': n} for n in lengths])
+            >>> for batch in ds.batch_dynamic_time_series_bucket(
+            ...         batch_size=3, len_key='num_samples',
+            ...         max_padding_rate=0.5, max_total_size=16,
+            ...         sort_key='num_samples', reverse_sort=True):
+            ...     print([example['num_samples'] for example in batch])
+            [9, 5]
+            [8, 7]
+            [2, 1]
+            [4, 3]
+            >>> batcher = TimeSeriesBucketBatcher(
+            ...     3, max_padding_rate=0.5, max_total_size=16,
+            ...     sort_key='num_samples')
+            >>> for batch in ds.apply(batcher):
+            ...     print([example['num_samples'] for example in batch])
+            [9]
+            [8, 7]
+            [5, 4, 3]
+            [2, 1]
+            >>> batcher = TimeSeriesBucketBatcher(
+            ...     3, max_padding_rate=0.5, sort_key='num_samples',
+            ...     group_key=lambda example: example['num_samples'] % 2)
+            >>> for batch in ds.apply(batcher):
+            ...     print([example['num_samples'] for example in batch])
+            [9, 7, 5]
+            [1]
+            [3]
+            [4, 2]
+            [8]
+
+        Args:
+            batch_size: Maximum number of examples in a batch
+            len_key: Key or callable to obtain the length of an example
+            max_padding_rate: The maximum padding that has to be added to an
+                example. E.g. if set to 0.2, an example of length 100 can
+                only be in a batch with examples of lengths between 80
+                and 125.
+            max_total_size: If not `None`, the maximum padded size of a
+                batch, see `TimeSeriesBucket`.
+            group_key: If not `None`, key or callable to obtain a group of
+                an example. Only examples of the same group are batched.
+            expiration: Maximum number of subsequent examples, before an
+                incomplete batch is emitted or dropped.
+            max_buffered_examples: Maximum number of buffered examples,
+                before the oldest incomplete batch is emitted or dropped.
+            drop_incomplete: If `True`, drops incomplete batches, else emits
+                them.
+            sort_key: If not `None`, key or callable to sort the examples in
+                a batch by.
+            reverse_sort: If `True`, sorts in reverse order. The default
+                `True` is required if sorting by length for
+                `PackedSequence`s.
+        """
+        self.batch_size = batch_size
+        self.len_key = len_key
+        self.max_padding_rate = max_padding_rate
+        self.max_total_size = max_total_size
+        self.group_key = group_key
+        self.expiration = expiration
+        self.max_buffered_examples = max_buffered_examples
+        self.drop_incomplete = drop_incomplete
+        self.sort_key = sort_key
+        self.reverse_sort = reverse_sort
+
+    def __call__(self, dataset: lazy_dataset.Dataset) -> lazy_dataset.Dataset:
+        return dataset.batch_dynamic_bucket(
+            bucket_cls=TimeSeriesBucket,
+            batch_size=self.batch_size,
+            len_key=self.len_key,
+            max_padding_rate=self.max_padding_rate,
+            max_total_size=self.max_total_size,
+            group_key=self.group_key,
+            expiration=self.expiration,
+            max_buffered_examples=self.max_buffered_examples,
+            drop_incomplete=self.drop_incomplete,
+            sort_key=self.sort_key,
+            reverse_sort=self.reverse_sort,
+        )
+
+
+def padding_rate(lengths) -> float:
+    """
+    Fraction of padding, when the examples of a batch with `lengths` are
+    padded to the maximum length, i.e.,
+    `1 - sum(lengths) / (len(lengths) * max(lengths))`.
+
+    Meant to report the padding of a batching stage, e.g. of
+    `dataset.apply(TimeSeriesBucketBatcher(...))` in a lazy dataset
+    pipeline, as a scalar in the review of a model.
+
+    Examples:
+        >>> import lazy_dataset
+        >>> lengths = [5, 1, 9, 3, 2, 8, 7, 4]
+        >>> ds = lazy_dataset.new([{'num_samples': n} for n in lengths])
+        >>> for batch in ds.batch_dynamic_time_series_bucket(
+        ...         batch_size=3, len_key='num_samples', max_padding_rate=0.3,
+        ...         sort_key='num_samples', reverse_sort=True):
+        ...     lengths = [example['num_samples'] for example in batch]
+        ...     print(lengths, round(padding_rate(lengths), 3))
+        [7, 5] 0.143
+        [1] 0.0
+        [9, 8] 0.056
+        [4, 3] 0.125
+        [2] 0.0
+        >>> round(padding_rate([5, 1, 9, 3]), 3)
+        0.5
+    """
+    lengths = np.asarray(lengths)
+    if lengths.size == 0 or lengths.max() == 0:
+        return 0.
+    return float(1 - lengths.sum() / (lengths.size * lengths.max()))
@@ -0,0 +1,235 @@
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+__all__ = [
+    'FeatureCache',
+]
+
+_MAGIC = b'PTCACHE1'
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _dump(obj, file):
+    """
+    Writes `obj` with pickle protocol 5, where the data of all contiguous
+    numpy arrays is stored out-of-band behind the pickle, each aligned to
+    64 bytes, so that `_load` can memory map it.
+
+    Layout:
+        _MAGIC, pickle size (uint64), number of buffers (uint64),
+        buffer sizes (uint64 each), pickle, padding, buffers
+    """
+    buffers = []
+    data = pickle.dumps(
+        obj, protocol=5, buffer_callback=buffers.append)
+    buffers = [buffer.raw() for buffer in buffers]
+    header = (
+        _MAGIC
+        + struct.pack('<QQ', len(data), len(buffers))
+        + struct.pack(f'<{len(buffers)}Q', *[b.nbytes for b in buffers])
+        + data
+    )
+    file.write(header)
+    position = len(header)
+    for buffer in buffers:
+        file.write(bytes(_align(position) - position))
+        file.write(buffer)
+        position = _align(position) + buffer.nbytes
+
+
+def _load(path):
+    """Loads a file written by `_dump` with memory mapped numpy arrays."""
+    with open(path, 'rb') as fd:
+        magic = fd.read(len(_MAGIC))
+        assert magic == _MAGIC, (magic, path)
+        size, num_buffers = struct.unpack('<QQ', fd.read(16))
+        sizes = struct.unpack(f'<{num_buffers}Q', fd.read(8 * num_buffers))
+        data = fd.read(size)
+        position = fd.tell()
+
+    buffers = []
+    if num_buffers > 0:
+        # copy on write: the arrays are writable, but the file is not changed
+        memmap = np.memmap(path, dtype=np.uint8, mode='c')
+        for nbytes in sizes:
+            position = _align(position)
+            buffers.append(memmap[position:position + nbytes])
+            position += nbytes
+    return pickle.loads(data, buffers=buffers)
+
+
+def _get_files(files):
+    if files is None:
+        return []
+    elif isinstance(files, (str, Path)):
+        return [files]
+    elif isinstance(files, dict):
+        return [f for k in sorted(files) for f in _get_files(files[k])]
+    elif isinstance(files, (tuple, list)):
+        return [f for file in files for f in _get_files(file)]
+    else:
+        raise TypeError(type(files), files)
+
+
+class FeatureCache:
+    def __init__(
+            self,
+            transform: callable,
+            cache_dir,
+            config: dict,
+            file_key='audio_path',
+            size_limit: int = None,
+    ):
+        """
+        Caches the output of a deterministic transform on the disk. Meant
+        to wrap expensive transforms in a lazy dataset pipeline, e.g.,
+        reading, resampling and feature extraction:
+        `dataset.map(FeatureCache(transform, cache_dir, config))`.
+
+        The cache key of an example is a hash of the example id, the dataset
+        name, the config of the transform, and the modification time and size
+        of all files in `example[file_key]`. Hence, a changed config or a
+        changed audio file invalidates the entry.
+
+        Each entry is one file in `cache_dir`. The numpy arrays are stored
+        uncompressed and are memory mapped when the entry is loaded, so later
+        epochs are served from the page cache. The entries are written
+        atomically, hence multiple processes (e.g. `ProcessPrefetch` workers)
+        may share a cache.
+
+        Examples:
+            >>> import tempfile
+            >>> def transform(example):
+            ...     print('transform', example['example_id'])
+            ...     return {**example, 'x': np.full(3, example['x'])}
+            >>> with tempfile.TemporaryDirectory() as tmp_dir:
+            ...     cached = FeatureCache(transform, tmp_dir, config={'x': 1})
+            ...     for _ in range(2):
+            ...         print(cached({'example_id': 'a', 'x': 2}))
+            transform a
+            {'example_id': 'a', 'x': array([2, 2, 2])}
+            {'example_id': 'a', 'x': array([2, 2, 2])}
+
+        Args:
+            transform: Deterministic function from example to example.
+            cache_dir: Directory of the cache
+            config: The config of the transform, e.g. from
+                `Configurable.get_config`. Must be JSON serializable (a
+                factory may be a class or function) and must contain
+                everything that affects the output of the transform. Add a
+                version key (e.g. `{'version': 2, ...}`) and increase it,
+                when the code of the transform changes.
+            file_key: Key of the (nested) source file paths in the example,
+                e.g. `'audio_path'`.
+            size_limit: Maximum size of the cache in bytes. When exceeded,
+                the least recently used entries are deleted. With multiple
+                processes, each process tracks the size independently, so
+                the limit is only approximately enforced.
+        """
+        self.transform = transform
+        self.cache_dir = Path(cache_dir)
+        self.file_key = file_key
+        self.size_limit = size_limit
+
+        if config is None:
+            # A key from the transform itself (e.g. pickled) does not change,
+            # when the code of the transform changes, and would serve stale
+            # features.
+            raise ValueError(
+                f'{self.__class__.__name__} requires the config of the '
+                f'transform {transform!r} (e.g. with a version key).'
+            )
+        import padertorch as pt
+        self.transform_hash = hashlib.sha256(
+            pt.io.dumps_config(config, '.json').encode()
+        ).hexdigest()
+
+        self._size = None
+
+    def get_key(self, example):
+        parts = [
+            self.transform_hash,
+            str(example.get('dataset')),
+            str(example['example_id']),
+        ]
+        for file in _get_files(example.get(self.file_key)):
+            stat = os.stat(file)
+            parts += [str(file), str(stat.st_mtime_ns), str(stat.st_size)]
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def get_path(self, key):
+        return self.cache_dir / key[:2] / f'{key}.cache'
+
+    def __call__(self, example):
+        path = self.get_path(self.get_key(example))
+        try:
+            example = _load(path)
+        except FileNotFoundError:
+            pass
+        else:
+            # Mark as recently used for the LRU eviction
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process
+                pass
+            return example
+
+        example = self.transform(example)
+        self.write(path, example)
+        return example
+
+    def write(self, path, example):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=path.parent, suffix='.tmp', delete=False) as fd:
+            try:
+                _dump(example, fd)
+            except BaseException:
+                os.unlink(fd.name)
+                raise
+        os.replace(fd.name, path)
+
+        if self.size_limit is not None:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += path.stat().st_size
+            if self._size > self.size_limit:
+                self.evict()
+
+    def _entries(self):
+        for file in self.cache_dir.glob('*/*.cache'):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                # Deleted by another process
+                continue
+            yield file, stat.st_mtime_ns, stat.st_size
+
+    def evict(self):
+        """
+        Deletes the least recently used entries, until the cache is smaller
+        than 90 % of `size_limit`.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(size for _, _, size in entries)
+        for file, _, file_size in entries:
+            if size <= 0.9 * self.size_limit:
+                break
+            try:
+                file.unlink()
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self._size = size
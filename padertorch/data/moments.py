@@ -0,0 +1,259 @@
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+__all__ = [
+    'Moments',
+    'compute_moments',
+]
+
+
+class Moments:
+    """
+    First and second order moments (count, mean and sum of squared
+    deviations from the mean) in float64. Batches are added with Welford's
+    update and partial moments are merged with the formulas of Chan et al.,
+    hence the moments can be computed in parallel and without the
+    cancellation of `E[x**2] - E[x]**2`.
+
+    >>> x = np.random.RandomState(0).randn(1000, 3) + 1e4
+    >>> m1, m2 = Moments(), Moments()
+    >>> m1.update(x[:300], axis=0)
+    >>> m2.update(x[300:], axis=0)
+    >>> m = m1.merge(m2)
+    >>> m.count
+    array(1000.)
+    >>> np.allclose(m.mean, x.mean(axis=0, keepdims=True))
+    True
+    >>> np.allclose(m.var, x.var(axis=0, keepdims=True))
+    True
+    >>> np.allclose(m.reduce(1).var, x.var(keepdims=True))
+    True
+    """
+    def __init__(self, count=0., mean=0., m2=0.):
+        self.count = np.asarray(count, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def power(self):
+        """The second raw moment E[x**2]."""
+        return self.var + self.mean ** 2
+
+    def update(self, x, axis=None):
+        """
+        Adds the values of `x`. The moments are computed over `axis`
+        (`None` for all axes) and the other axes are kept as independent
+        statistics.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if axis is None:
+            axis = tuple(range(x.ndim))
+        elif isinstance(axis, int):
+            axis = (axis,)
+        count = np.prod([x.shape[ax] for ax in axis], dtype=np.float64)
+        if count == 0:
+            return
+        mean = x.mean(axis=axis, keepdims=True)
+        m2 = ((x - mean) ** 2).sum(axis=axis, keepdims=True)
+        merged = self.merge(Moments(count, mean, m2))
+        self.count, self.mean, self.m2 = merged.count, merged.mean, merged.m2
+
+    def merge(self, other: 'Moments') -> 'Moments':
+        """Returns the moments of the union of the values."""
+        if np.all(other.count == 0):
+            return Moments(self.count, self.mean, self.m2)
+        if np.all(self.count == 0):
+            return Moments(other.count, other.mean, other.m2)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * (other.count / count)
+        m2 = (
+            self.m2 + other.m2
+            + delta ** 2 * (self.count * other.count / count)
+        )
+        return Moments(count, mean, m2)
+
+    def reduce(self, axis):
+        """
+        Merges the independent statistics along `axis`, e.g., to obtain the
+        global moments from the moments of each frequency.
+        """
+        if isinstance(axis, int):
+            axis = (axis,)
+        axis = tuple(axis)
+        if len(axis) == 0:
+            return Moments(self.count, self.mean, self.m2)
+        count = np.broadcast_to(self.count, self.mean.shape)
+        total = count.sum(axis=axis, keepdims=True)
+        mean = (count * self.mean).sum(axis=axis, keepdims=True) / total
+        m2 = (
+            self.m2.sum(axis=axis, keepdims=True)
+            + (count * (self.mean - mean) ** 2).sum(axis=axis, keepdims=True)
+        )
+        return Moments(total, mean, m2)
+
+    def state_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        return cls(**state_dict)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(count={self.count}, '
+            f'mean={self.mean}, var={self.var})'
+        )
+
+
+# The dataset is passed to forked workers as global variable, so that it
+# doesn't need to be picklable.
+_WORKER_ARGS = None
+
+
+def _chunk_moments(chunk_index, dataset, get_array, axis, chunk_size):
+    moments = Moments()
+    start = chunk_index * chunk_size
+    for example in dataset[start:start + chunk_size]:
+        moments.update(get_array(example), axis=axis)
+    return moments
+
+
+def _worker_chunk_moments(chunk_index):
+    return chunk_index, _chunk_moments(chunk_index, *_WORKER_ARGS)
+
+
+def _save_state(state, state_file):
+    state_file = Path(state_file)
+    with tempfile.NamedTemporaryFile(
+            dir=state_file.parent, suffix='.tmp', delete=False) as fd:
+        pickle.dump(state, fd)
+    os.replace(fd.name, state_file)
+
+
+def compute_moments(
+        dataset,
+        key=None,
+        axis=None,
+        num_workers: int = 1,
+        chunk_size: int = 100,
+        state_file=None,
+        verbose: bool = False,
+) -> Moments:
+    """
+    Computes the moments of the arrays in a dataset in a single pass.
+
+    The dataset is split into chunks of `chunk_size` examples, which are
+    processed by `num_workers` forked processes. The moments of the chunks
+    are merged in the order of the chunks, hence the result does not depend
+    on `num_workers`. If `state_file` is given, the moments of each finished
+    chunk are stored there and a later call with the same `state_file`
+    continues with the missing chunks.
+
+    >>> import lazy_dataset
+    >>> rng = np.random.RandomState(0)
+    >>> arrays = [rng.randn(n, 2) for n in rng.randint(1, 10, size=20)]
+    >>> dataset = lazy_dataset.new([{'x': x} for x in arrays])
+    >>> moments = compute_moments(dataset, 'x', axis=0, chunk_size=3)
+    >>> np.allclose(moments.mean, np.concatenate(arrays).mean(axis=0))
+    True
+    >>> np.allclose(moments.std, np.concatenate(arrays).std(axis=0))
+    True
+
+    Args:
+        dataset: Indexable dataset (e.g. lazy dataset or list). An iterable
+            without length is processed in the main process.
+        key: Key of the array in the example or callable, that returns the
+            array from an example. If `None`, the example is the array.
+        axis: Axes of the array over which the moments are computed. All
+            other axes must have the same size in all examples.
+        num_workers: Number of worker processes.
+        chunk_size: Number of examples in a chunk.
+        state_file: Optional file to store the moments of finished chunks.
+            Ignored, if the dataset is not indexable.
+        verbose: If `True`, shows a progress bar.
+
+    Returns:
+        The merged `Moments`
+    """
+    global _WORKER_ARGS
+
+    if key is None:
+        def get_array(example):
+            return example
+    elif callable(key):
+        get_array = key
+    else:
+        def get_array(example):
+            return example[key]
+
+    try:
+        num_chunks = -(-len(dataset) // chunk_size)
+    except TypeError:
+        # Not indexable, e.g. an iterable: single process without state
+        moments = Moments()
+        for example in tqdm(dataset, disable=not verbose):
+            moments.update(get_array(example), axis=axis)
+        return moments
+
+    state = {'chunk_size': chunk_size, 'num_chunks': num_chunks, 'chunks': {}}
+    if state_file is not None and Path(state_file).exists():
+        with open(state_file, 'rb') as fd:
+            restored = pickle.load(fd)
+        assert (
+            restored['chunk_size'] == chunk_size
+            and restored['num_chunks'] == num_chunks
+        ), (
+            'The state file was created for another dataset or chunk_size',
+            state_file, restored['chunk_size'], restored['num_chunks'],
+            chunk_size, num_chunks,
+        )
+        state = restored
+    chunks = state['chunks']
+
+    def add(chunk_index, moments):
+        chunks[chunk_index] = moments.state_dict()
+        if state_file is not None:
+            _save_state(state, state_file)
+
+    pending = [i for i in range(num_chunks) if i not in chunks]
+    with tqdm(
+            total=num_chunks, initial=num_chunks - len(pending),
+            disable=not verbose,
+    ) as progress:
+        if num_workers == 1 or len(pending) <= 1:
+            for chunk_index in pending:
+                add(chunk_index, _chunk_moments(
+                    chunk_index, dataset, get_array, axis, chunk_size))
+                progress.update()
+        else:
+            import multiprocessing
+            _WORKER_ARGS = (dataset, get_array, axis, chunk_size)
+            try:
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(num_workers) as pool:
+                    for chunk_index, moments in pool.imap_unordered(
+                            _worker_chunk_moments, pending):
+                        add(chunk_index, moments)
+                        progress.update()
+            finally:
+                _WORKER_ARGS = None
+
+    moments = Moments()
+    for chunk_index in range(num_chunks):
+        moments = moments.merge(
+            Moments.from_state_dict(chunks[chunk_index]))
+    return moments
@@ -0,0 +1,320 @@
+import pickle
+import queue
+import random
+import time
+import traceback
+
+import numpy as np
+import torch
+import torch.multiprocessing
+import lazy_dataset
+
+__all__ = [
+    'ProcessPrefetch',
+]
+
+
+class ProcessPrefetch:
+    def __init__(
+            self,
+            num_workers: int,
+            buffer_size: int,
+            catch_filter_exception=False,
+            seed: int = None,
+            worker_init_fn: callable = None,
+            timeout: float = None,
+    ):
+        """
+        Prefetches the examples of an indexable lazy dataset in worker
+        processes. Meant as a replacement for `.prefetch(...)`, whose
+        thread backend is limited by the GIL for heavy preprocessing in
+        Python, e.g. reading, resampling and STFT:
+        `dataset.map(transform).apply(ProcessPrefetch(8, 16)).batch(...)`.
+
+        The NumPy arrays of the examples are not pickled. They are copied
+        once into shared memory (using the tensor sharing of
+        `torch.multiprocessing`) and the main process receives NumPy views on
+        that memory. All other objects are pickled as usual.
+
+        The examples are yielded in the order of the input dataset and
+        `lazy_dataset.FilterException`s raised in a worker are handled as
+        in `Dataset.prefetch`. The resulting dataset can be iterated
+        multiple times, e.g., by `Trainer.train`. The worker processes are
+        started with `fork` for each iteration, so the dataset and the
+        functions mapped on it don't need to be picklable and a reshuffle is
+        applied in each iteration. Note that the workers must not use CUDA.
+
+        Examples:
+            >>> import lazy_dataset
+            >>> def transform(x):
+            ...     if x == 3:
+            ...         raise lazy_dataset.FilterException()
+            ...     return {'x': np.full(x, x)}
+            >>> ds = lazy_dataset.new(list(range(6))).map(transform)
+            >>> prefetched = ds.apply(ProcessPrefetch(
+            ...     num_workers=2, buffer_size=4, catch_filter_exception=True))
+            >>> for example in prefetched:
+            ...     print(example['x'])
+            []
+            [1]
+            [2 2]
+            [4 4 4 4]
+            [5 5 5 5 5]
+
+        Args:
+            num_workers: Number of worker processes.
+            buffer_size: Maximum number of examples that are processed or
+                waiting to be yielded at the same time.
+            catch_filter_exception: If `True`, examples that raise a
+                `lazy_dataset.FilterException` are skipped. Can also be an
+                exception type or a tuple of exception types that should be
+                skipped.
+            seed: Seed for the random number generators of `random`, `numpy`
+                and `torch` in the workers. Each worker in each iteration
+                gets a different seed that is derived from `seed`, the
+                iteration and the worker index. The examples are assigned
+                round-robin to the workers, hence the random numbers of an
+                example are reproducible. If `None`, the seed is drawn from
+                `np.random` in the main process.
+            worker_init_fn: Optional function that is called with the worker
+                index in each worker after seeding.
+            timeout: Optional timeout in seconds to wait for an example.
+        """
+        assert num_workers >= 1, num_workers
+        assert buffer_size >= num_workers, (buffer_size, num_workers)
+        self.num_workers = num_workers
+        self.buffer_size = buffer_size
+        if catch_filter_exception is True:
+            catch_filter_exception = lazy_dataset.FilterException
+        self.catch_filter_exception = catch_filter_exception
+        self.seed = seed
+        self.worker_init_fn = worker_init_fn
+        self.timeout = timeout
+        self.iteration = 0
+
+    def __call__(self, dataset: lazy_dataset.Dataset) -> lazy_dataset.Dataset:
+        # Same check as in `Dataset.prefetch` for multiple workers
+        try:
+            _ = len(dataset)
+        except Exception:
+            raise RuntimeError(
+                f'You can only use {self.__class__.__name__} if the incoming '
+                f'dataset is indexable.\ninput_dataset:\n{dataset!r}'
+            )
+        return _ProcessPrefetchDataset(dataset, self)
+
+    def get_worker_seeds(self):
+        if self.seed is None:
+            seed = np.random.randint(2 ** 31)
+        else:
+            seed = self.seed
+        seeds = np.random.SeedSequence([seed, self.iteration]).generate_state(
+            self.num_workers)
+        self.iteration += 1
+        return [int(s) for s in seeds]
+
+
+class _Shared:
+    """Marks a tensor that has been created from a numpy array."""
+    def __init__(self, tensor):
+        self.tensor = tensor
+
+
+class _RemoteTraceback(Exception):
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _to_shared(example):
+    if isinstance(example, dict):
+        return example.__class__({
+            k: _to_shared(v) for k, v in example.items()
+        })
+    elif isinstance(example, (tuple, list)):
+        return example.__class__([_to_shared(v) for v in example])
+    elif isinstance(example, np.ndarray) and example.dtype != object:
+        try:
+            return _Shared(torch.from_numpy(example))
+        except (TypeError, ValueError):
+            # Unsupported dtype or negative strides
+            return example
+    else:
+        return example
+
+
+def _from_shared(example):
+    if isinstance(example, dict):
+        return example.__class__({
+            k: _from_shared(v) for k, v in example.items()
+        })
+    elif isinstance(example, (tuple, list)):
+        return example.__class__([_from_shared(v) for v in example])
+    elif isinstance(example, _Shared):
+        return example.tensor.numpy()
+    else:
+        return example
+
+
+def _worker_loop(
+        dataset, worker_index, seed, worker_init_fn, catch_filter_exception,
+        index_queue, result_queue,
+):
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    if worker_init_fn is not None:
+        worker_init_fn(worker_index)
+
+    while True:
+        index = index_queue.get()
+        if index is None:
+            break
+        try:
+            example = dataset[index]
+        except Exception as e:
+            if catch_filter_exception and isinstance(e, catch_filter_exception):
+                result_queue.put((index, 'filter', None))
+                continue
+            tb = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(repr(e))
+            result_queue.put((index, 'error', (e, tb)))
+        else:
+            result_queue.put((index, 'ok', _to_shared(example)))
+
+
+class _ProcessPrefetchDataset(lazy_dataset.Dataset):
+    def __init__(self, input_dataset, prefetcher: ProcessPrefetch):
+        self.input_dataset = input_dataset
+        self.prefetcher = prefetcher
+        # Number of examples that are ready to be yielded, while iterating.
+        # Sampled by the ResourceMonitor of the Trainer.
+        self.queue_depth = None
+
+    def copy(self, freeze=False):
+        return self.__class__(
+            self.input_dataset.copy(freeze=freeze), self.prefetcher
+        )
+
+    @property
+    def indexable(self):
+        return False
+
+    @property
+    def ordered(self) -> bool:
+        return self.input_dataset.ordered
+
+    def __len__(self):
+        if self.prefetcher.catch_filter_exception:
+            raise TypeError(
+                f'__len__ is not implemented for {self.__class__} '
+                f'if `catch_filter_exception` is set.'
+            )
+        return len(self.input_dataset)
+
+    def __str__(self):
+        return (
+            f'{self.__class__.__name__}({self.prefetcher.num_workers}, '
+            f'{self.prefetcher.buffer_size})'
+        )
+
+    def __iter__(self, with_key=False):
+        if with_key:
+            return super().__iter__(with_key=with_key)
+        return self._iter_examples()
+
+    def _iter_examples(self):
+        prefetcher = self.prefetcher
+        # Convert ReShuffleDataset to ShuffleDataset
+        input_dataset = self.input_dataset.copy(freeze=True)
+        num_examples = len(input_dataset)
+
+        ctx = torch.multiprocessing.get_context('fork')
+        # Like the torch DataLoader, the indices are assigned round-robin to
+        # the workers, so that the random numbers of an example only depend
+        # on the seed and not on the scheduling.
+        index_queues = [
+            ctx.SimpleQueue() for _ in range(prefetcher.num_workers)
+        ]
+        result_queue = ctx.Queue()
+        workers = [
+            ctx.Process(
+                target=_worker_loop,
+                args=(
+                    input_dataset, worker_index, seed,
+                    prefetcher.worker_init_fn,
+                    prefetcher.catch_filter_exception,
+                    index_queues[worker_index], result_queue,
+                ),
+                daemon=True,
+            )
+            for worker_index, seed in enumerate(prefetcher.get_worker_seeds())
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            submitted = 0
+            results = {}
+            for index in range(num_examples):
+                stop = min(num_examples, index + prefetcher.buffer_size)
+                while submitted < stop:
+                    index_queues[submitted % len(workers)].put(submitted)
+                    submitted += 1
+
+                while index not in results:
+                    i, status, payload = self._get(result_queue, workers)
+                    results[i] = (status, payload)
+
+                status, payload = results.pop(index)
+                self.queue_depth = len(results) + self._qsize(result_queue)
+                if status == 'ok':
+                    yield _from_shared(payload)
+                elif status == 'error':
+                    exception, tb = payload
+                    raise exception from _RemoteTraceback(tb)
+        finally:
+            self.queue_depth = None
+            for index_queue in index_queues:
+                index_queue.put(None)
+            # Workers that still have to flush examples into the result
+            # queue would block, when the iteration was stopped early.
+            deadline = time.monotonic() + 1
+            for worker in workers:
+                worker.join(timeout=max(deadline - time.monotonic(), 0))
+                if worker.is_alive():
+                    worker.terminate()
+            result_queue.cancel_join_thread()
+            result_queue.close()
+
+    @staticmethod
+    def _qsize(result_queue):
+        try:
+            return result_queue.qsize()
+        except NotImplementedError:
+            # macOS
+            return 0
+
+    def _get(self, result_queue, workers):
+        timeout = self.prefetcher.timeout
+        waited = 0
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                waited += 1
+                dead = [w for w in workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(
+                        f'{len(dead)} worker(s) of {self} exited unexpectedly '
+                        f'with exit code(s) {[w.exitcode for w in dead]}.'
+                    )
+                if timeout is not None and waited >= timeout:
+                    raise TimeoutError(
+                        f'{self} timed out after {timeout} seconds.')
@@ -1,5 +1,6 @@
 
 import numpy as np
+import torch
 
 
 def pad_tensor(vec, pad, axis):
@@ -15,7 +16,111 @@ def pad_tensor(vec, pad, axis):
 
     pad_size = list(vec.shape)
     pad_size[axis] = pad - vec.shape[axis]
-    return np.concatenate([vec, np.zeros(pad_size)], axis=axis)
+    return np.concatenate(
+        [vec, np.zeros(pad_size, dtype=vec.dtype)], axis=axis)
+
+
+def pad_batch(
+        arrays,
+        axis=-1,
+        pad_value=0,
+        dtype=None,
+        to_tensor=False,
+        pin_memory=False,
+        share_memory=False,
+        return_mask=False,
+):
+    """Pads a list of arrays to a common shape and stacks them.
+
+    The shape of the batch is computed once and a single output buffer is
+    allocated, into which each array is copied once. Only the padded part
+    of the buffer is filled with `pad_value`.
+
+    Args:
+        arrays: list of arrays with the same number of dimensions
+        axis: sequence axis of the arrays, used for the sequence lengths and
+            the mask
+        pad_value: value of the padded part
+        dtype: dtype of the batch. Defaults to the result type of the arrays,
+            i.e., float32 arrays are not upcasted.
+        to_tensor: If `True`, the batch, the sequence lengths and the mask
+            are returned as `torch.Tensor`s.
+        pin_memory: If `True`, the batch is allocated in page-locked memory,
+            so that it can be copied asynchronously to the GPU. Ignored when
+            CUDA is not available. Implies `to_tensor`.
+        share_memory: If `True`, the batch is allocated in shared memory,
+            so that it can be sent to another process without a copy.
+            Implies `to_tensor`.
+        return_mask: If `True`, additionally returns a boolean mask with
+            shape `(batch_size, max(sequence_lengths))` that is `True` for
+            the valid frames.
+
+    Returns:
+        batch, sequence_lengths (and mask)
+
+    >>> batch, sequence_lengths, mask = pad_batch(
+    ...     [np.ones(3, np.float32), np.ones(2, np.float32)], return_mask=True)
+    >>> batch
+    array([[1., 1., 1.],
+           [1., 1., 0.]], dtype=float32)
+    >>> sequence_lengths
+    array([3, 2])
+    >>> mask
+    array([[ True,  True,  True],
+           [ True,  True, False]])
+    >>> batch, sequence_lengths = pad_batch(
+    ...     [np.ones((2, 1)), np.ones((1, 2))], axis=0, pad_value=-1,
+    ...     to_tensor=True)
+    >>> batch
+    tensor([[[ 1., -1.],
+             [ 1., -1.]],
+    <BLANKLINE>
+            [[ 1.,  1.],
+             [-1., -1.]]], dtype=torch.float64)
+    >>> sequence_lengths
+    tensor([2, 1])
+    """
+    arrays = [np.asarray(array) for array in arrays]
+    assert len(arrays) > 0, arrays
+    ndim = arrays[0].ndim
+    assert all(array.ndim == ndim for array in arrays), (
+        'All arrays must have the same number of dimensions',
+        [array.shape for array in arrays]
+    )
+    shape = tuple(np.max([array.shape for array in arrays], axis=0))
+    if dtype is None:
+        dtype = np.result_type(*arrays)
+    batch_shape = (len(arrays), *shape)
+
+    to_tensor = to_tensor or pin_memory or share_memory
+    if to_tensor:
+        batch = torch.empty(
+            batch_shape,
+            dtype=torch.from_numpy(np.empty(0, dtype)).dtype,
+            pin_memory=pin_memory and torch.cuda.is_available(),
+        )
+        if share_memory:
+            batch.share_memory_()
+        buffer = batch.numpy()
+    else:
+        batch = buffer = np.empty(batch_shape, dtype)
+
+    for out, array in zip(buffer, arrays):
+        out[tuple(map(slice, array.shape))] = array
+        for d, size in enumerate(array.shape):
+            if size < shape[d]:
+                out[(slice(None),) * d + (slice(size, None),)] = pad_value
+
+    sequence_lengths = np.array([array.shape[axis] for array in arrays])
+    if to_tensor:
+        sequence_lengths = torch.from_numpy(sequence_lengths)
+    if not return_mask:
+        return batch, sequence_lengths
+
+    mask = np.arange(shape[axis]) < np.asarray(sequence_lengths)[:, None]
+    if to_tensor:
+        mask = torch.from_numpy(mask)
+    return batch, sequence_lengths, mask
 
 
 def collate_fn(batch):
@@ -67,3 +172,72 @@ def collate_fn(batch):
         })
     else:
         return batch
+
+
+class PadCollate:
+    """Collates a batch and pads the arrays of `keys` with `pad_batch`.
+
+    The sequence lengths are added as `'{key}_lengths'` and, if
+    `return_mask` is `True`, the masks as `'{key}_mask'`. All other entries
+    are collated with `collate_fn`.
+
+    Can be used as map after batching of a dataset:
+        `dataset.batch(...).map(PadCollate('audio_data'))`
+
+    >>> batch = [
+    ...     {'example_id': 'a', 'x': np.ones(3, np.float32)},
+    ...     {'example_id': 'b', 'x': np.ones(2, np.float32)},
+    ... ]
+    >>> PadCollate('x')(batch)
+    {'example_id': ['a', 'b'], 'x': array([[1., 1., 1.],
+           [1., 1., 0.]], dtype=float32), 'x_lengths': array([3, 2])}
+    """
+    def __init__(
+            self,
+            keys,
+            axis=-1,
+            pad_value=0,
+            to_tensor=False,
+            pin_memory=False,
+            share_memory=False,
+            return_mask=False,
+    ):
+        """
+        Args:
+            keys: key or list of keys of the arrays that should be padded
+            axis: sequence axis, an int for all keys or a dict from key to
+                axis
+            pad_value, to_tensor, pin_memory, share_memory, return_mask:
+                See `pad_batch`.
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        self.keys = list(keys)
+        self.axis = axis
+        self.pad_value = pad_value
+        self.to_tensor = to_tensor
+        self.pin_memory = pin_memory
+        self.share_memory = share_memory
+        self.return_mask = return_mask
+
+    def __call__(self, batch):
+        batch = collate_fn(batch)
+        for key in self.keys:
+            if isinstance(self.axis, dict):
+                axis = self.axis[key]
+            else:
+                axis = self.axis
+            padded = pad_batch(
+                batch[key],
+                axis=axis,
+                pad_value=self.pad_value,
+                to_tensor=self.to_tensor,
+                pin_memory=self.pin_memory,
+                share_memory=self.share_memory,
+                return_mask=self.return_mask,
+            )
+            batch[key] = padded[0]
+            batch[f'{key}_lengths'] = padded[1]
+            if self.return_mask:
+                batch[f'{key}_mask'] = padded[2]
+        return batch
@@ -1,7 +1,12 @@
 import os
 import io
+import pickle
+import struct
 from pathlib import Path
 
+import numpy as np
+import torch
+
 from paderbox.io.new_subdir import get_new_subdir
 
 
@@ -174,3 +179,227 @@ def loads_config(
         return loads_yaml(content)
     else:
         raise NotImplementedError(format)
+
+
+MMAP_CHECKPOINT_MAGIC = b'PTMMAP01'
+_MMAP_CHECKPOINT_ALIGNMENT = 64
+
+
+class _TensorRef:
+    """
+    Placeholder for a tensor in the index of a mmap checkpoint. `offset` and
+    `nbytes` describe the storage of the tensor in the file, `stride` and
+    `storage_offset` (in elements) the view of the tensor into the storage.
+    """
+    __slots__ = (
+        'dtype', 'shape', 'offset', 'nbytes', 'stride', 'storage_offset')
+
+    def __init__(
+            self, dtype, shape, offset, nbytes, stride=None, storage_offset=0,
+    ):
+        self.dtype = dtype
+        self.shape = shape
+        self.offset = offset
+        self.nbytes = nbytes
+        self.stride = stride
+        self.storage_offset = storage_offset
+
+    def __getstate__(self):
+        return (
+            self.dtype, self.shape, self.offset, self.nbytes, self.stride,
+            self.storage_offset,
+        )
+
+    def __setstate__(self, state):
+        # Older checkpoints store only contiguous tensors without the view.
+        state = (*state, None, 0)[:6]
+        (self.dtype, self.shape, self.offset, self.nbytes, self.stride,
+         self.storage_offset) = state
+
+
+def _align(offset):
+    return -(-offset // _MMAP_CHECKPOINT_ALIGNMENT) * _MMAP_CHECKPOINT_ALIGNMENT
+
+
+def save_mmap_checkpoint(obj, file):
+    """
+    Saves a (nested) checkpoint in a format, where each tensor can be memory
+    mapped.
+
+    The file starts with a small index: the nested structure of `obj`,
+    where each tensor is replaced by its dtype, shape and position in the
+    file. The raw data of the tensors follows the index. Hence, a loader can
+    read the index and then memory map only the tensors that it needs (see
+    `load_mmap_checkpoint`).
+
+    Layout:
+        MMAP_CHECKPOINT_MAGIC, index size (uint64, little endian), index
+        (pickle), padding, storage data (each aligned to 64 bytes)
+
+    Like `torch.save`, the whole storage of a tensor is saved and tensors
+    that share a storage (e.g. tied weights or views) share it in the file.
+
+    Args:
+        obj: Nested dicts, lists and tuples with tensors as leaves, e.g.
+            `Trainer.state_dict()`. Other leaves are pickled in the index.
+        file: Path or binary file object
+    """
+    if isinstance(file, (str, Path)):
+        with open(file, 'wb') as fd:
+            return save_mmap_checkpoint(obj, fd)
+
+    storages = {}
+    offset = 0
+
+    def to_index(obj):
+        nonlocal offset
+        if torch.is_tensor(obj):
+            tensor = obj.detach()
+            storage = tensor.untyped_storage()
+            # Tensors that share a storage (e.g. tied weights) are written
+            # once and keep sharing it, when the checkpoint is loaded.
+            key = (tensor.device, storage.data_ptr())
+            if key not in storages:
+                storages[key] = offset, storage
+                offset = _align(offset + storage.nbytes())
+            ref = _TensorRef(
+                str(tensor.dtype)[len('torch.'):], tuple(tensor.shape),
+                storages[key][0], storage.nbytes(), tuple(tensor.stride()),
+                tensor.storage_offset(),
+            )
+            return ref
+        elif isinstance(obj, dict):
+            out = {k: to_index(v) for k, v in obj.items()}
+            if type(obj) is not dict:
+                try:
+                    out = type(obj)(out)
+                except TypeError:
+                    pass
+            return out
+        elif isinstance(obj, (tuple, list)) and not hasattr(obj, '_fields'):
+            return type(obj)(to_index(v) for v in obj)
+        else:
+            return obj
+
+    index = pickle.dumps(to_index(obj), protocol=pickle.HIGHEST_PROTOCOL)
+    header = MMAP_CHECKPOINT_MAGIC + struct.pack('<Q', len(index)) + index
+    data_start = _align(len(header))
+
+    file.write(header)
+    file.write(bytes(data_start - len(header)))
+    position = 0
+    for storage_position, storage in storages.values():
+        file.write(bytes(storage_position - position))
+        if storage.device.type != 'cpu':
+            storage = storage.cpu()
+        # Write the bytes of the storage without a copy.
+        data = torch.empty(0, dtype=torch.uint8).set_(storage)
+        file.write(memoryview(data.numpy()))
+        position = storage_position + storage.nbytes()
+
+
+def is_mmap_checkpoint(path):
+    """Returns True if `path` is a checkpoint written by `save_mmap_checkpoint`."""
+    with open(path, 'rb') as fd:
+        return fd.read(len(MMAP_CHECKPOINT_MAGIC)) == MMAP_CHECKPOINT_MAGIC
+
+
+def read_mmap_checkpoint_index(path):
+    """
+    Reads the raw bytes of the index of a mmap checkpoint (see
+    `save_mmap_checkpoint`), e.g., to broadcast them with MPI.
+    """
+    with open(path, 'rb') as fd:
+        magic = fd.read(len(MMAP_CHECKPOINT_MAGIC))
+        assert magic == MMAP_CHECKPOINT_MAGIC, (magic, path)
+        size, = struct.unpack('<Q', fd.read(8))
+        return fd.read(size)
+
+
+def load_mmap_checkpoint(
+        path, in_checkpoint_path=None, map_location=None, index=None,
+):
+    """
+    Loads a checkpoint written by `save_mmap_checkpoint`.
+
+    Only the tensors below `in_checkpoint_path` are loaded. They are memory
+    mapped (copy on write), i.e. the data is read from the disk, when it is
+    accessed, and no tensor is copied unless `map_location` requests another
+    device.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     save_mmap_checkpoint({
+    ...         'model': {'l.weight': torch.ones(2, 3), 'l.bias': torch.zeros(2)},
+    ...         'iteration': 3,
+    ...     }, Path(tmp_dir) / 'ckpt.pth')
+    ...     print(load_mmap_checkpoint(Path(tmp_dir) / 'ckpt.pth', 'model.l'))
+    {'weight': tensor([[1., 1., 1.],
+            [1., 1., 1.]]), 'bias': tensor([0., 0.])}
+
+    Args:
+        path: The checkpoint file
+        in_checkpoint_path: Dot separated path to the sub dict that should be
+            loaded (e.g. 'model' for the parameters of a `Trainer`
+            checkpoint). If `None`, the whole checkpoint is loaded.
+        map_location: Device for the tensors. By default the tensors stay in
+            the memory mapped file (CPU).
+        index: The bytes from `read_mmap_checkpoint_index`. If `None`, they
+            are read from `path`.
+
+    Returns:
+        The (sub) checkpoint
+    """
+    from paderbox.utils.nested import deflatten
+
+    if index is None:
+        index = read_mmap_checkpoint_index(path)
+    checkpoint = pickle.loads(index)
+    data_start = _align(len(MMAP_CHECKPOINT_MAGIC) + 8 + len(index))
+
+    if in_checkpoint_path:
+        for part in in_checkpoint_path.split('.'):
+            try:
+                checkpoint = deflatten(checkpoint, maxdepth=1)
+                checkpoint = checkpoint[part]
+            except KeyError:
+                raise ValueError(part, in_checkpoint_path, checkpoint)
+
+    memmap = None
+    storages = {}
+
+    def from_index(obj):
+        nonlocal memmap
+        if isinstance(obj, _TensorRef):
+            if memmap is None:
+                memmap = np.memmap(path, dtype=np.uint8, mode='c')
+            dtype = getattr(torch, obj.dtype)
+            key = (obj.offset, dtype)
+            if key not in storages:
+                start = data_start + obj.offset
+                array = memmap[start:start + obj.nbytes]
+                if dtype == torch.bfloat16:
+                    # numpy has no bfloat16, the raw 16 bit are stored.
+                    storage = torch.from_numpy(array.view(np.int16)).view(
+                        dtype)
+                else:
+                    storage = torch.from_numpy(array.view(
+                        torch.empty(0, dtype=dtype).numpy().dtype))
+                if map_location is not None:
+                    storage = storage.to(map_location)
+                storages[key] = storage
+            storage = storages[key]
+            if obj.stride is None:
+                return storage.reshape(obj.shape)
+            return storage.as_strided(
+                obj.shape, obj.stride, obj.storage_offset)
+        elif isinstance(obj, dict):
+            for k, v in obj.items():
+                obj[k] = from_index(v)
+            return obj
+        elif isinstance(obj, (tuple, list)) and not hasattr(obj, '_fields'):
+            return type(obj)(from_index(v) for v in obj)
+        else:
+            return obj
+
+    return from_index(checkpoint)
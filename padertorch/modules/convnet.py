@@ -67,13 +67,38 @@ class Conv1d(pt.Module):
             bias=bias, groups=groups
         )
 
-    def forward(self, x):
+    def init_state(self, batch_size=1, device=None, dtype=None):
+        """
+        Returns the initial state for the streaming mode of `forward`, i.e.,
+        the zero padding of a causal (`pad_type='front'`) convolution.
+
+        Returns:
+            left context of shape b,c,(kernel_size-1)*dilation
+        """
+        assert self.pad_type == 'front' and self.stride == 1, (
+            'The streaming mode requires a causal convolution (pad_type '
+            f'front and stride 1), got {self.pad_type} and {self.stride}.'
+        )
+        front_pad, _ = compute_pad_size(
+            self.kernel_size, self.dilation, self.stride, self.pad_type)
+        weight = self.conv.weight
+        return torch.zeros(
+            (batch_size, self.in_channels, front_pad),
+            device=weight.device if device is None else device,
+            dtype=weight.dtype if dtype is None else dtype,
+        )
+
+    def forward(self, x, state=None):
         """
 
         Args:
             x: input tensor of shape b,c,t
+            state: left context of the input, see `init_state`. If given,
+                the input is a chunk of a stream, the padding is replaced
+                by the state and the new state is returned.
 
         Returns:
+            output of shape b,c,t and, if state is given, the new state
 
         """
 
@@ -81,9 +106,35 @@ class Conv1d(pt.Module):
             x = F.dropout(x, self.dropout)
         if self.norm is not None:
             x = self.norm(x)
-        x = self.pad(x)
-        y = self.conv(x)
+        if state is None:
+            x = self.pad(x)
+            y = self.conv(x)
+        else:
+            x = torch.cat([state, x], dim=-1)
+            state = x[..., x.shape[-1] - state.shape[-1]:]
+            if self.conv.groups == self.in_channels == self.out_channels:
+                y = self._depthwise_conv_taps(x)
+            else:
+                y = self.conv(x)
         y = self.activation_fn(y)
+        if state is None:
+            return y
+        return y, state
+
+    def _depthwise_conv_taps(self, x):
+        """
+        Depthwise convolution (without padding) as a sum over the kernel
+        taps. For the short chunks of the streaming mode, this is much faster
+        than `conv1d` with groups on the CPU.
+        """
+        weight = self.conv.weight  # c, 1, k
+        num_frames = x.shape[-1] - (self.kernel_size - 1) * self.dilation
+        y = x[..., :num_frames] * weight[:, :, 0]
+        for k in range(1, self.kernel_size):
+            offset = k * self.dilation
+            y = y.addcmul_(x[..., offset:offset + num_frames], weight[:, :, k])
+        if self.conv.bias is not None:
+            y = y + self.conv.bias[:, None]
         return y
 
     def pad(self, x):
@@ -95,6 +146,8 @@ class Conv1d(pt.Module):
         Returns:
 
         """
+        if self.pad_type is None:
+            return x
         front_pad, end_pad = list(zip(*[
             compute_pad_size(k, d, s, t)
             for k, d, s, t in zip(
@@ -124,13 +177,18 @@ class _Conv1DBlock(pt.Module):
     >>> conv = _Conv1DBlock(norm='gLN')
     >>> conv(torch.rand(5, 256, 343)).shape
     torch.Size([5, 256, 343])
+    >>> conv = _Conv1DBlock(dilation=4, causal=True)
+    >>> y, state = conv(torch.rand(5, 256, 10), state=conv.init_state(5))
+    >>> y.shape, state.shape
+    (torch.Size([5, 256, 10]), torch.Size([5, 512, 8]))
     """
     def __init__(self,
                  in_channels=256,
                  hidden_channels=512,
                  kernel_size=3,
                  dilation=1,
-                 norm="cLN"):
+                 norm="cLN",
+                 causal=False):
         super().__init__()
 
         # ToDo: this can be replaced by a CNN1D from JE
@@ -145,7 +203,7 @@ class _Conv1DBlock(pt.Module):
             kernel_size,
             groups=hidden_channels,
             activation_fn='prelu',
-            pad_type='both',
+            pad_type='front' if causal else 'both',
             dilation=dilation
         )
 
@@ -153,12 +211,20 @@ class _Conv1DBlock(pt.Module):
         self.output_conv = Conv1d(hidden_channels, in_channels, 1,
                                   norm=self.norm, activation_fn='identity')
 
-    def forward(self, x):
+    def init_state(self, batch_size=1, device=None, dtype=None):
+        return self.conv.init_state(batch_size, device, dtype)
+
+    def forward(self, x, state=None):
         y = self.input_conv(x)
-        y = self.conv(y)
+        if state is None:
+            y = self.conv(y)
+        else:
+            y, state = self.conv(y, state)
         y = self.output_conv(y)
         x = x + y
-        return x
+        if state is None:
+            return x
+        return x, state
 
 
 class ConvNet(pt.Module):
@@ -170,6 +236,21 @@ class ConvNet(pt.Module):
     >>> module = ConvNet()
     >>> module(torch.rand(4, 323, 256), None).shape
     torch.Size([4, 323, 256])
+
+    A causal ConvNet with a frame-wise norm can process a stream chunk by
+    chunk with the same output as the offline forward:
+    >>> module = ConvNet(
+    ...     num_blocks=3, num_repeats=2, in_channels=16, hidden_channels=32,
+    ...     norm='cLN', causal=True,
+    ... ).eval()
+    >>> x = torch.rand(2, 50, 16)
+    >>> state = module.init_state(batch_size=2)
+    >>> chunks = []
+    >>> for t in range(0, 50, 10):
+    ...     y, state = module(x[:, t:t + 10], state=state)
+    ...     chunks.append(y)
+    >>> torch.allclose(torch.cat(chunks, dim=1), module(x), atol=1e-6)
+    True
     """
 
     def __init__(
@@ -182,6 +263,7 @@ class ConvNet(pt.Module):
             kernel_size=3,
             norm="gLN",
             activation="relu",
+            causal=False,
     ):
         """
 
@@ -195,9 +277,13 @@ class ConvNet(pt.Module):
             kernel_size:
             norm:
             activation:
+            causal: If True, the dilated convolutions only use past frames,
+                which is required for the streaming mode (see `init_state`).
         """
         super().__init__()
         self.input_size = input_size
+        self.norm = norm
+        self.causal = causal
         self.activation = pt.mappings.ACTIVATION_FN_MAP[activation]()
 
         self.layer_norm = build_norm('cLN', input_size)
@@ -209,7 +295,8 @@ class ConvNet(pt.Module):
             in_channels=in_channels,
             hidden_channels=hidden_channels,
             kernel_size=kernel_size,
-            norm=norm)
+            norm=norm,
+            causal=causal)
         self.hidden_size = in_channels
 
     def _build_blocks(self, num_blocks, **block_kwargs):
@@ -226,20 +313,59 @@ class ConvNet(pt.Module):
         ]
         return nn.Sequential(*repeats)
 
+    def init_state(self, batch_size=1, device=None, dtype=None):
+        """
+        Returns the initial state for the streaming mode of `forward`, i.e.,
+        the left context buffer of the dilated convolution of each block.
+        With the state, each chunk costs the same, independent of the
+        position in the stream.
+
+        Requires a causal ConvNet with a frame-wise norm ('cLN' or 'BN' in
+        eval mode), because 'gLN' normalizes over the whole utterance.
+        """
+        if not self.causal:
+            raise ValueError(
+                f'The streaming mode of {self.__class__.__name__} requires '
+                f'causal=True.'
+            )
+        if self.norm == 'gLN' or (self.norm == 'BN' and self.training):
+            raise ValueError(
+                f'The streaming mode of {self.__class__.__name__} requires a '
+                f'frame-wise norm, i.e., "cLN" or "BN" in eval mode, got '
+                f'{self.norm!r} (training={self.training}).'
+            )
+        return [
+            block.init_state(batch_size, device, dtype)
+            for repeat in self.conv_blocks for block in repeat
+        ]
+
     def forward(
                 self,
                 sequence: torch.Tensor,
-                sequence_lengths: Optional[torch.Tensor] = None
-        ) -> torch.Tensor:
+                sequence_lengths: Optional[torch.Tensor] = None,
+                state: Optional[list] = None,
+        ):
         """
 
             Args:
                 sequence (B, L, N):
                 sequence_lengths:
+                state: state from `init_state` or from the previous chunk.
+                    If given, the sequence is the next chunk of a stream.
 
             Returns:
+                output (B, L, N) and, if state is given, the new state
 
         """
         x = rearrange(sequence, 'b l n -> b n l')
-        y = self.conv_blocks(x)
-        return rearrange(y, 'b n l -> b l n')
+        if state is None:
+            y = self.conv_blocks(x)
+            return rearrange(y, 'b n l -> b l n')
+
+        blocks = [block for repeat in self.conv_blocks for block in repeat]
+        assert len(state) == len(blocks), (len(state), len(blocks))
+        new_state = []
+        for block, block_state in zip(blocks, state):
+            x, block_state = block(x, block_state)
+            new_state.append(block_state)
+        return rearrange(x, 'b n l -> b l n'), new_state
@@ -18,7 +18,8 @@ from torch.nn import functional as F
 from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence, \
     PackedSequence, pad_sequence
 
-import paderbox as pb
+from padertorch.contrib.jensheit.norm import GlobalChannelLayerNorm
+from padertorch.ops.sequence.mask import compute_sequence_mask
 
 
 def segment(
@@ -137,11 +138,17 @@ def segment(
     # that the first half of the first block and the last half of the last
     # block are filled with 0s for the case of 50% overlap.
     padding = window_size - hop_size
-    signal = F.pad(signal, [0, 0, padding, padding])
 
-    segmented = pb.array.segment_axis(
-        signal, window_size, hop_size, axis=-2, end='pad')
-    segmented = rearrange(segmented, '... s k n -> ... n k s')
+    # Pad the end, so that the last segment is complete (`end='pad'` in
+    # `pb.array.segment_axis`). Both paddings are done in a single copy and
+    # the segments are a strided view into the padded signal.
+    length = signal.shape[-2] + 2 * padding
+    num_segments = max(0, math.ceil((length - window_size) / hop_size)) + 1
+    end_padding = (num_segments - 1) * hop_size + window_size - length
+    signal = F.pad(signal, [0, 0, padding, padding + end_padding])
+
+    segmented = signal.unfold(-2, window_size, hop_size)
+    segmented = rearrange(segmented, '... s n k -> ... n k s')
 
     if sequence_lengths is not None:
         sequence_lengths = sequence_lengths + 2 * padding
@@ -189,21 +196,43 @@ def overlap_add(
                  [3],
                  [4]]])
 
+        >>> overlap_add(segment(torch.arange(7)[None, :, None], 2, 5)[0], 2)
+        tensor([[[ 0],
+                 [ 3],
+                 [ 4],
+                 [ 9],
+                 [ 8],
+                 [15],
+                 [12]]])
+
     Args:
-        signal:
-        hop_size:
+        signal (B, N, K, S): Segmented signal
+        hop_size: Hop size P
+        unpad: If `True`, remove the padding that was added by `segment`
 
     Returns:
-
+        (B, L, N)
     """
     B, N, K, S = signal.shape
     assert K > hop_size
 
-    out = signal.new_zeros(B, S*hop_size + K - hop_size, N)
+    # Split the windows into blocks of size gcd(K, P). Then, the n-th block
+    # of every window is added with a single strided in-place add, i.e., the
+    # number of operations depends on K / gcd(K, P) and not on S.
+    # The blocks are added in reverse order to sum the segments in the same
+    # order as a loop over the segments would (identical numerics).
+    block_size = math.gcd(K, hop_size)
+    blocks_per_window = K // block_size
+    blocks_per_hop = hop_size // block_size
 
-    signal = rearrange(signal, 'b n k s -> b k n s')
-    for i in range(S):
-        out[:, i * hop_size:i * hop_size + K, :] += signal[..., :, :, i]
+    out = signal.new_zeros(
+        B, (S - 1) * blocks_per_hop + blocks_per_window, block_size, N)
+
+    signal = rearrange(signal, 'b n (a g) s -> b a s g n', g=block_size)
+    for i in reversed(range(blocks_per_window)):
+        out[:, i:i + (S - 1) * blocks_per_hop + 1:blocks_per_hop] += \
+            signal[:, i]
+    out = rearrange(out, 'b l g n -> b (l g) n')
 
     if unpad:
         out = out[..., K - hop_size:- (K - hop_size), :]
@@ -255,11 +284,97 @@ def unpack(x: torch.Tensor, sequence_lengths: torch.Tensor):
     return pad_sequence(segments, batch_first=True)
 
 
-def apply_examplewise(fn, x: torch.Tensor, sequence_lengths, time_axis=1):
+def _is_framewise(fn, x: torch.Tensor, time_axis: int) -> bool:
+    """
+    Returns `True` if `fn` processes every frame along `time_axis`
+    independently, so that it can be applied to the padded tensor.
+    """
+    if isinstance(fn, torch.nn.LayerNorm):
+        return time_axis < x.dim() - len(fn.normalized_shape)
+    if isinstance(fn, torch.nn.Linear):
+        return time_axis < x.dim() - 1
+    return False
+
+
+def _global_layer_norm(
+        norm: GlobalChannelLayerNorm, x: torch.Tensor,
+        mask: Optional[torch.Tensor], time_axis: int,
+) -> torch.Tensor:
+    """
+    `GlobalChannelLayerNorm` of a (B, F, T) (`time_axis=2`) or (B, T, F)
+    (`time_axis=1`) input, where the statistics of each example are only
+    computed from the frames within its sequence length (`mask`).
+    """
+    if mask is None:
+        count = x.shape[1] * x.shape[2]
+    else:
+        count = mask.sum(dim=(1, 2), keepdim=True) * x.shape[3 - time_axis]
+        x = x.masked_fill(~mask, 0)
+    mean = torch.sum(x, (1, 2), keepdim=True) / count
+    centered = x - mean
+    if mask is not None:
+        centered = centered.masked_fill(~mask, 0)
+    var = torch.sum(centered ** 2, (1, 2), keepdim=True) / count
+    x = centered / torch.sqrt(var + norm.eps)
+    if norm.elementwise_affine:
+        # The parameters have the shape (F, 1)
+        gamma, beta = norm.gamma, norm.beta
+        if time_axis == 1:
+            gamma, beta = gamma.t(), beta.t()
+        x = gamma * x + beta
+    if mask is not None:
+        x = x.masked_fill(~mask, 0)
+    return x
+
+
+def apply_examplewise(
+        fn, x: torch.Tensor, sequence_lengths, time_axis=1,
+        framewise: Optional[bool] = None,
+):
     """
     Applies a function to each element of x (along batch (0) dimension) and
     respects the sequence lengths along time axis. Assumes that fn does not
-    change the dimensions of its input (e.g., norm).
+    change the dimensions of its input (e.g., norm). The output is 0 outside
+    of the sequence lengths.
+
+    Depending on `fn`, this is done for the whole batch at once:
+     - Frame-wise functions (`torch.nn.LayerNorm` over the feature axes,
+       `torch.nn.Linear`, or any `fn` with `framewise=True`) are applied to
+       the padded tensor and the padding is masked afterwards.
+     - `GlobalChannelLayerNorm` (gLN) computes the statistics of each example
+       from the frames within the sequence length. The input has the shape
+       (B, T, F) for `time_axis=1` (e.g. in `TasNet`), i.e., the gLN is
+       applied to the transposed frames, or (B, F, T) for `time_axis=2`.
+     - Any other function is called once for each group of examples with the
+       same length. Hence, it must process the examples in a batch
+       independently (e.g., no `BatchNorm` in training mode).
+
+    Examples:
+        >>> norm = torch.nn.LayerNorm(3)
+        >>> x = torch.randn(3, 5, 3)
+        >>> sequence_lengths = torch.tensor([5, 2, 2])
+        >>> out = apply_examplewise(norm, x, sequence_lengths)
+        >>> torch.allclose(out[1, :2], norm(x[1:2, :2])[0])
+        True
+        >>> bool(torch.all(out[1:, 2:] == 0))
+        True
+        >>> out_grouped = apply_examplewise(
+        ...     norm, x, sequence_lengths, framewise=False)
+        >>> torch.allclose(out, out_grouped)
+        True
+        >>> gln = GlobalChannelLayerNorm(3)
+        >>> out = apply_examplewise(gln, x, sequence_lengths)
+        >>> torch.allclose(out[1, :2], gln(x[1:2, :2].transpose(1, 2))[0].t())
+        True
+
+    Args:
+        fn: Function to apply
+        x: Input tensor with the batch axis first
+        sequence_lengths: Sequence lengths along `time_axis`. If `None`, `fn`
+            is applied to `x` directly.
+        time_axis: The axis that contains the (padded) sequences
+        framewise: Whether `fn` processes each frame along `time_axis`
+            independently. If `None`, this is detected from the type of `fn`.
     """
     if sequence_lengths is None:
         return fn(x)
@@ -269,15 +384,32 @@ def apply_examplewise(fn, x: torch.Tensor, sequence_lengths, time_axis=1):
         assert len(sequence_lengths) == x.shape[0], (
             'Number of sequence lengths and batch size must match!'
         )
-
         time_axis = time_axis % x.dim()
+        if not torch.is_tensor(sequence_lengths):
+            sequence_lengths = torch.tensor(sequence_lengths)
+
+        mask = compute_sequence_mask(
+            x, sequence_lengths, batch_axis=0, sequence_axis=time_axis)
+
+        if isinstance(fn, GlobalChannelLayerNorm) and x.dim() == 3:
+            return _global_layer_norm(fn, x, mask, time_axis)
+
+        if framewise is None:
+            framewise = _is_framewise(fn, x, time_axis)
+
+        if framewise:
+            x = fn(x)
+            if mask is not None:
+                x = x.masked_fill(~mask, 0)
+            return x
+
         selector = [slice(None)] * (time_axis - 1)
         out = torch.zeros_like(x)
-        for b, l in enumerate(sequence_lengths):
+        for l in torch.unique(sequence_lengths).tolist():
+            b = torch.nonzero(sequence_lengths == l, as_tuple=True)[0].to(
+                x.device)
             s = (b, *selector, slice(l))
-
-            # Keep the batch dimension while processing
-            out[s] = fn(x[s][None, ...])[0]
+            out[s] = fn(x[s])
         return out
 
 
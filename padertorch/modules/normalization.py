@@ -1,6 +1,7 @@
+import numpy as np
 import torch
 from padertorch.base import Module
-from padertorch.ops.sequence.mask import compute_mask
+from padertorch.ops.sequence.mask import compute_sequence_mask
 from torch import nn
 from torch.autograd import Function
 
@@ -169,6 +170,69 @@ class Normalization(Module):
             if self.scale:
                 self.running_power.fill_(1)
 
+    def set_running_stats(self, moments):
+        """
+        Sets the running statistics from `padertorch.data.Moments`, whose
+        independent axes are given in `data_format` without the batch axis.
+        """
+        assert self.track_running_stats
+        reduced_shape = self.num_tracked_values.shape
+
+        def to_buffer(value, buffer):
+            value = np.expand_dims(value, self.batch_axis)
+            value = np.broadcast_to(value, reduced_shape)
+            buffer.copy_(torch.tensor(value))
+
+        to_buffer(moments.count, self.num_tracked_values)
+        if self.shift:
+            to_buffer(moments.mean, self.running_mean)
+        if self.scale:
+            to_buffer(moments.power, self.running_power)
+
+    def initialize_running_stats(
+            self, dataset, key=None, num_workers=1, chunk_size=100,
+            state_file=None, verbose=False,
+    ):
+        """
+        Computes the running statistics offline over a dataset (see
+        `padertorch.data.compute_moments`) instead of during the first
+        training steps. With `momentum=None`, the training continues the
+        cumulative average.
+
+        >>> norm = InputNormalization(
+        ...     data_format='bct', shape=(None, 2, None), statistics_axis='bt')
+        >>> dataset = [np.array([[1., 2., 3.], [0., 0., 4.]]), np.ones((2, 1))]
+        >>> norm.initialize_running_stats(dataset)
+        >>> norm.num_tracked_values
+        tensor([[[4.],
+                 [4.]]])
+        >>> norm.running_mean
+        tensor([[[1.7500],
+                 [1.2500]]])
+
+        Args:
+            dataset: Indexable dataset of examples, where each array has the
+                `data_format` without the batch axis, e.g. 'ct' for 'bct'.
+            key: Key of the array in an example or callable, that returns the
+                array. If `None`, the example is the array.
+            num_workers, chunk_size, state_file, verbose: See
+                `padertorch.data.compute_moments`.
+        """
+        from padertorch.data.moments import compute_moments
+        assert self.track_running_stats
+        batch_char = self.data_format[self.batch_axis]
+        example_format = self.data_format.replace(batch_char, '')
+        axis = tuple(
+            example_format.index(self.data_format[ax])
+            for ax in self.statistics_axis if ax != self.batch_axis
+        )
+        moments = compute_moments(
+            dataset, key, axis=axis, num_workers=num_workers,
+            chunk_size=chunk_size, state_file=state_file, verbose=verbose,
+        )
+        with torch.no_grad():
+            self.set_running_stats(moments)
+
     def reset_parameters(self):
         self.reset_running_stats()
         if self.gamma is not None:
@@ -214,9 +278,12 @@ class Normalization(Module):
             x = x * self.gamma
         if self.beta is not None:
             x = x + self.beta
-        return x * compute_mask(
+        mask = compute_sequence_mask(
             x, sequence_lengths, self.batch_axis, self.sequence_axis
         )
+        if mask is not None:
+            x = x * mask
+        return x
 
     def inverse(self, x, sequence_lengths=None):
         if not self.track_running_stats:
@@ -229,9 +296,11 @@ class Normalization(Module):
             x = torch.sqrt(self.running_var.detach() + self.eps) * x
         if self.shift:
             x = x + self.running_mean.detach()
-        x = x * compute_mask(
+        mask = compute_sequence_mask(
             x, sequence_lengths, self.batch_axis, self.sequence_axis
         )
+        if mask is not None:
+            x = x * mask
         return x
 
 
@@ -309,7 +378,9 @@ class _Normalize(Function):
     """
     Normalization function incl. backward computation.
     The implementation of the backward step saves memory compared to simply
-    using autograd of the forward operations.
+    using autograd of the forward operations. The padding mask is a boolean
+    tensor that only spans the batch and sequence axes. It is computed once
+    in the forward step and reused in the backward step.
     """
     @staticmethod
     def forward(
@@ -317,9 +388,6 @@ class _Normalize(Function):
             sequence_lengths, shift, scale, eps
     ):
         ctx.statistics_axis = statistics_axis
-        ctx.batch_axis = batch_axis
-        ctx.sequence_axis = sequence_axis
-        ctx.seq_len = sequence_lengths
         ctx.shift = shift
         ctx.scale = scale
         ctx.eps = eps
@@ -327,35 +395,38 @@ class _Normalize(Function):
         x, mask, mean, power, n_values = mask_and_compute_stats(
             x, sequence_lengths, statistics_axis, batch_axis, sequence_axis
         )
-        y = x
         if shift:
-            y = y - mean
+            y = x - mean
             power_scale = power - mean**2
         else:
+            y = x
             power_scale = power
         if scale:
             y = y / torch.sqrt(power_scale + eps)
-        ctx.save_for_backward(x, gamma, beta, mean, power_scale)
+        ctx.save_for_backward(x, gamma, beta, mean, power_scale, mask, n_values)
 
+        # y is a new tensor from here on, hence it can be modified in-place
         if gamma is not None:
             assert gamma.dim() == x.dim(), gamma.shape
-            y = y * gamma
+            y = y * gamma if y is x else y.mul_(gamma)
         if beta is not None:
             assert beta.dim() == x.dim(), beta.shape
-            y = y + beta
-        return y*mask, mean, power, n_values
+            y = y + beta if y is x else y.add_(beta)
+        if mask is not None:
+            y = y * mask if y is x else y.mul_(mask)
+        elif y is x:
+            y = x.clone()
+        return y, mean, power, n_values
 
     @staticmethod
     def backward(ctx, grad_y, grad_mean, grad_power, _):
         # equations from https://arxiv.org/abs/1502.03167
         if (grad_mean != 0).any() or (grad_power != 0).any():
             raise NotImplementedError
-        x, gamma, beta, mean, power_scale = ctx.saved_tensors
-        # compute mask
-        mask = compute_mask(x, ctx.seq_len, ctx.batch_axis, ctx.sequence_axis)
-        n_values = mask.sum(dim=ctx.statistics_axis, keepdim=True)
+        x, gamma, beta, mean, power_scale, mask, n_values = ctx.saved_tensors
 
-        grad_y = grad_y * mask
+        if mask is not None:
+            grad_y = grad_y * mask
         x_hat = x
         scale = torch.sqrt(power_scale + ctx.eps)
         if ctx.shift:
@@ -374,8 +445,11 @@ class _Normalize(Function):
             reduce_axis = [i for i in range(gamma.dim()) if gamma.shape[i] == 1]
             grad_gamma = (grad_y * x_hat).sum(reduce_axis, keepdim=True)
             grad_x_hat = grad_y * gamma
+        del x_hat
         if ctx.shift:
-            x = (x - mean) * mask
+            x = x - mean
+            if mask is not None:
+                x.mul_(mask)
             grad_mean_ = -grad_x_hat.sum(ctx.statistics_axis, keepdim=True)
         if ctx.scale:
             grad_power_ = (
@@ -394,7 +468,9 @@ class _Normalize(Function):
             grad_x = grad_x / scale + grad_power_ * 2 * x / n_values
         if ctx.shift:
             grad_x = grad_x + grad_mean_ / n_values
-        return grad_x * mask, grad_gamma, grad_beta, None, None, None, None, None, None, None
+        if mask is not None:
+            grad_x = grad_x * mask
+        return grad_x, grad_gamma, grad_beta, None, None, None, None, None, None, None
 
 
 def normalize(
@@ -447,16 +523,41 @@ def normalize(
 def mask_and_compute_stats(
         x, sequence_lengths, statistics_axis, batch_axis, sequence_axis
 ):
-    # compute mask
-    mask = compute_mask(x, sequence_lengths, batch_axis, sequence_axis)
-
-    # compute statistics
-    n_values = mask.sum(dim=statistics_axis, keepdim=True)
-    x = x * mask
-    mean = x.sum(dim=statistics_axis, keepdim=True) / torch.max(
-        n_values, torch.ones_like(n_values)
-    )
-    power = (x ** 2).sum(dim=statistics_axis, keepdim=True) / torch.max(
-        n_values, torch.ones_like(n_values)
-    )
+    """
+    Returns the masked input, the mask (see `compute_sequence_mask`), the
+    mean, the power and the number of non-padded values along
+    `statistics_axis`.
+
+    The number of non-padded values is computed from the small mask and the
+    input is only masked, if it contains padding. Hence, no mask of the size
+    of `x` is allocated.
+
+    >>> x = torch.arange(8.).view(2, 1, 4)
+    >>> _, _, mean, power, n = mask_and_compute_stats(x, [2, 4], (0, 2), 0, 2)
+    >>> mean, power, n
+    (tensor([[[3.8333]]]), tensor([[[21.1667]]]), tensor([[[6.]]]))
+    """
+    mask = compute_sequence_mask(x, sequence_lengths, batch_axis, sequence_axis)
+    if mask is not None:
+        x = x * mask
+
+    n_total = 1
+    for ax in statistics_axis:
+        n_total *= x.shape[ax]
+    reduced_shape = [
+        1 if ax in statistics_axis else d for ax, d in enumerate(x.shape)
+    ]
+    if mask is None:
+        n_values = x.new_full(reduced_shape, n_total)
+    else:
+        # Values along axes, that are not covered by the mask, are all valid
+        n_broadcast = 1
+        for ax in statistics_axis:
+            n_broadcast *= x.shape[ax] // mask.shape[ax]
+        n_values = mask.sum(dim=statistics_axis, keepdim=True, dtype=x.dtype)
+        n_values = (n_values * n_broadcast).expand(reduced_shape).contiguous()
+
+    n = torch.max(n_values, torch.ones_like(n_values))
+    mean = x.sum(dim=statistics_axis, keepdim=True) / n
+    power = (x ** 2).sum(dim=statistics_axis, keepdim=True) / n
     return x, mask, mean, power, n_values
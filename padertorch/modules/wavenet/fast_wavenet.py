@@ -0,0 +1,180 @@
+import torch
+
+
+__all__ = [
+    'FastWaveNet',
+]
+
+
+class FastWaveNet:
+    """
+    Pure PyTorch autoregressive WaveNet inference with per layer dilation
+    queues (Paine et al., "Fast Wavenet Generation Algorithm", 2016).
+
+    Each dilated layer keeps a ring buffer with its last `dilation` inputs,
+    so generating one sample costs O(n_layers) matrix-vector products
+    instead of re-running the whole receptive field. The constructor takes
+    the same arguments as `NVWaveNet`, i.e. the output of
+    `WaveNet.export_weights`, so this class is a drop in replacement on
+    hosts without CUDA or without the compiled nv_wavenet extension.
+
+    >>> from padertorch.modules.wavenet import WaveNet
+    >>> wavenet = WaveNet(
+    ...     n_cond_channels=4, upsamp_window=4, upsamp_stride=2, n_layers=4,
+    ...     max_dilation=4, n_residual_channels=8, n_skip_channels=16)
+    >>> fast_wavenet = FastWaveNet(**wavenet.export_weights())
+    >>> cond_input = wavenet.get_cond_input(torch.randn(3, 4, 10))
+    >>> cond_input.shape
+    torch.Size([16, 3, 4, 20])
+    >>> fast_wavenet.infer(cond_input).shape
+    torch.Size([3, 20])
+    """
+    def __init__(
+            self,
+            embedding_prev,
+            embedding_curr,
+            conv_out_weight,
+            conv_end_weight,
+            dilate_weights,
+            dilate_biases,
+            max_dilation,
+            res_weights,
+            res_biases,
+            skip_weights,
+            skip_biases,
+            use_embed_tanh,
+    ):
+        self.A, self.R = embedding_curr.shape
+        self.S = conv_out_weight.shape[1]
+        self.num_layers = len(dilate_weights)
+        self.max_dilation = max_dilation
+        self.use_embed_tanh = use_embed_tanh
+
+        assert embedding_prev.shape == (self.A, self.R), (
+            embedding_prev.shape, (self.A, self.R))
+        assert len(dilate_biases) == self.num_layers, len(dilate_biases)
+        assert len(skip_weights) == len(skip_biases) == self.num_layers, (
+            len(skip_weights), len(skip_biases), self.num_layers)
+        assert len(res_weights) == len(res_biases) == self.num_layers - 1, (
+            len(res_weights), len(res_biases), self.num_layers)
+
+        self.embedding_prev = embedding_prev
+        self.embedding_curr = embedding_curr
+        self.conv_out = conv_out_weight[:, :, 0]
+        self.conv_end = conv_end_weight[:, :, 0]
+
+        # The dilated convolutions have kernel size 2. Concatenate the two
+        # taps, so that a single matmul on [x[t - dilation], x[t]] computes
+        # the convolution.
+        self.dilate_weights = []
+        for weight in dilate_weights:
+            assert weight.shape == (2 * self.R, self.R, 2), (
+                'Only kernel_size 2 is supported', weight.shape)
+            self.dilate_weights.append(
+                weight.transpose(1, 2).reshape(2 * self.R, 2 * self.R))
+        self.dilate_biases = torch.stack(dilate_biases)
+
+        # The residual output of the last layer is never used, so the last
+        # layer only has a skip connection. For all other layers, residual
+        # and skip projection are fused into a single matmul.
+        self.res_skip_weights = []
+        self.res_skip_biases = []
+        for i in range(self.num_layers):
+            weight = skip_weights[i][:, :, 0]
+            bias = skip_biases[i]
+            if i < self.num_layers - 1:
+                weight = torch.cat([res_weights[i][:, :, 0], weight])
+                bias = torch.cat([res_biases[i], bias])
+            self.res_skip_weights.append(weight)
+            self.res_skip_biases.append(bias)
+
+        loop_factor = max_dilation.bit_length()
+        self.dilations = [
+            2 ** (i % loop_factor) for i in range(self.num_layers)
+        ]
+
+    def infer(self, cond_input, return_logits=False):
+        """
+        Generates one sample per conditioning frame.
+
+        The first sample is generated from the mu-law code of silence, each
+        following sample from the previously generated one. The network is
+        evaluated in a teacher forced way, i.e. the logits for step `t` are
+        equal to the (unshifted) output of `WaveNet.forward` at time `t` for
+        the input sequence `[silence, sample_0, ..., sample_{t-1}]`.
+
+        Args:
+            cond_input: Output of `WaveNet.get_cond_input` with shape
+                (2*R, batch, num_layers, samples).
+            return_logits: If True, additionally return the logits with
+                shape (batch, n_out_channels, samples).
+
+        Returns:
+            Quantized samples (batch, samples) with dtype int64.
+        """
+        assert cond_input.shape[0:3:2] == (2 * self.R, self.num_layers), (
+            'Inputs are channels x batch x num_layers x samples',
+            cond_input.shape, (2 * self.R, self.num_layers)
+        )
+        R = self.R
+        batch_size = cond_input.shape[1]
+        sample_count = cond_input.shape[3]
+
+        # samples x num_layers x batch x 2*R, with the dilate bias folded in
+        cond_input = (
+            cond_input.permute(3, 2, 1, 0) + self.dilate_biases[:, None, :]
+        ).contiguous()
+
+        queues = [
+            cond_input.new_zeros(dilation, batch_size, R)
+            for dilation in self.dilations
+        ]
+        samples = cond_input.new_empty(
+            (sample_count, batch_size), dtype=torch.long)
+        if return_logits:
+            logits = cond_input.new_empty((sample_count, batch_size, self.A))
+
+        # mu-law code of silence
+        prev = curr = torch.full(
+            (batch_size,), self.A // 2, dtype=torch.long,
+            device=cond_input.device
+        )
+        for t in range(sample_count):
+            x = self.embedding_prev[prev] + self.embedding_curr[curr]
+            if self.use_embed_tanh:
+                x = torch.tanh(x)
+
+            skip = None
+            for i, (queue, dilation) in enumerate(
+                    zip(queues, self.dilations)):
+                slot = t % dilation
+                in_act = torch.addmm(
+                    cond_input[t, i],
+                    torch.cat([queue[slot], x], dim=-1),
+                    self.dilate_weights[i].t(),
+                )
+                queue[slot] = x
+                acts = torch.tanh(in_act[:, :R]) * torch.sigmoid(in_act[:, R:])
+                res_skip = torch.addmm(
+                    self.res_skip_biases[i], acts,
+                    self.res_skip_weights[i].t()
+                )
+                if i < self.num_layers - 1:
+                    x = x + res_skip[:, :R]
+                    res_skip = res_skip[:, R:]
+                skip = res_skip if skip is None else skip + res_skip
+
+            output = torch.relu(skip) @ self.conv_out.t()
+            output = torch.relu(output) @ self.conv_end.t()
+            if return_logits:
+                logits[t] = output
+
+            prev = curr
+            curr = torch.multinomial(
+                torch.softmax(output, dim=-1), 1).squeeze(-1)
+            samples[t] = curr
+
+        samples = samples.t()
+        if return_logits:
+            return samples, logits.permute(1, 2, 0)
+        return samples
@@ -30,6 +30,7 @@ from cached_property import cached_property
 
 from padertorch.base import Module
 from padertorch.ops import mu_law_encode, mu_law_decode
+from .fast_wavenet import FastWaveNet
 
 
 __all__ = [
@@ -153,12 +154,38 @@ class WaveNet(Module):
             cond_input = cond_input[:, :, pad_width:]
         cond_input = cond_input[:, :, :quantized.size(1)]
 
-        forward_input = self.embed(quantized)
-        forward_input = forward_input.transpose(1, 2)
-
         cond_acts = self.cond_layers(cond_input)
         cond_acts = cond_acts.view(
             cond_acts.size(0), self.n_layers, -1, cond_acts.size(2))
+        output = self._logits(quantized, cond_acts)
+
+        # Remove last probabilities because they've seen all the data
+        last = output[:, :, -1]
+        last = last.unsqueeze(2)
+        output = output[:, :, :-1]
+
+        # Replace probability for first value with 0's because we don't know
+        first = last * 0.0
+        output = torch.cat((first, output), dim=2)
+
+        return output, quantized
+
+    def _logits(self, quantized, cond_acts):
+        """
+        Unshifted network output, i.e. output[..., t] are the logits for the
+        sample that follows quantized[..., t].
+
+        Args:
+            quantized: mu-law encoded input with shape (batch, samples)
+            cond_acts: conditioning with shape
+                (batch, num_layers, 2*R, samples)
+
+        Returns:
+            logits with shape (batch, n_out_channels, samples)
+        """
+        forward_input = self.embed(quantized)
+        forward_input = forward_input.transpose(1, 2)
+
         for i in range(self.n_layers):
             in_act = self.dilate_layers[i](forward_input)
             in_act = in_act + cond_acts[:, i, :, :]
@@ -178,27 +205,18 @@ class WaveNet(Module):
         output = self.conv_out(output)
         output = torch.nn.functional.relu(output, True)
         output = self.conv_end(output)
-
-        # Remove last probabilities because they've seen all the data
-        last = output[:, :, -1]
-        last = last.unsqueeze(2)
-        output = output[:, :, :-1]
-
-        # Replace probability for first value with 0's because we don't know
-        first = last * 0.0
-        output = torch.cat((first, output), dim=2)
-
-        return output, quantized
+        return output
 
     def export_weights(self):
         """
-        Returns a dictionary with tensors ready for nv_wavenet wrapper
+        Returns a dictionary with tensors ready for the nv_wavenet wrapper
+        and `FastWaveNet`
         """
         model = {}
         # We're not using a convolution to start to this does nothing
         model["embedding_prev"] = torch.zeros(
-            self.n_out_channels, self.n_residual_channels).float().cuda(
-            self.embed.weight.get_device()
+            self.n_out_channels, self.n_residual_channels,
+            device=self.embed.weight.device
         )
 
         model["embedding_curr"] = self.embed.weight.data
@@ -254,7 +272,30 @@ class WaveNet(Module):
         from .nv_wavenet.nv_wavenet import NVWaveNet
         return NVWaveNet(**(self.export_weights()))
 
-    def infer(self, x, chunk_length=None, chunk_overlap=0):
+    def infer(
+            self, x, chunk_length=None, chunk_overlap=0, implementation=None
+    ):
+        """
+        Autoregressive generation of audio from features.
+
+        Args:
+            x: features with shape (batch, n_cond_channels, frames)
+            chunk_length: If not None, the conditioning is split into chunks
+                of (about) this many samples, that are generated
+                independently.
+            chunk_overlap: Number of samples the chunks overlap. The
+                overlapping samples are dropped from all but the first chunk.
+            implementation: 'nv_wavenet' uses the compiled CUDA kernel,
+                'torch' uses `FastWaveNet`, which also runs on the CPU.
+                Defaults to 'nv_wavenet' for CUDA tensors and to 'torch'
+                otherwise.
+
+        Returns:
+            audio with shape (batch, samples)
+        """
+        if implementation is None:
+            implementation = 'nv_wavenet' if x.is_cuda else 'torch'
+        assert implementation in ['nv_wavenet', 'torch'], implementation
         with torch.no_grad():
             x = self.get_cond_input(x)
             length = x.shape[-1]
@@ -271,14 +312,16 @@ class WaveNet(Module):
                         0, length - chunk_overlap, chunk_length - chunk_overlap
                     )
                 ]
+            if implementation == 'torch':
+                fast_wavenet = FastWaveNet(**self.export_weights())
             audio = []
             for i, xi in enumerate(chunks):
-                if xi.device == 'cpu':
-                    raise NotImplementedError
+                if implementation == 'torch':
+                    xi = fast_wavenet.infer(xi)
                 else:
                     from .nv_wavenet.nv_wavenet import Impl
                     xi = self.nv_wavenet.infer(xi, Impl.AUTO)
-                    xi = mu_law_decode(xi, self.n_out_channels)
+                xi = mu_law_decode(xi, self.n_out_channels)
                 if i > 0:
                     xi = xi[..., chunk_overlap:]
                 audio.append(xi)
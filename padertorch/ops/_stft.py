@@ -1,8 +1,10 @@
 import numpy as np
 import torch
+import torch.fft
 from einops import rearrange
 import paderbox as pb
 import typing
+import functools
 from math import ceil
 
 from torch.nn import functional as F
@@ -10,16 +12,12 @@ from torch.nn import functional as F
 
 def get_stft_kernel(size, window):
     length = len(window)
-    real = np.array([
-        [np.cos(-1 * n * 2 * np.pi / size * k) * window[k]
-         for k in range(length)] for n in range(size // 2 + 1)
-    ])
-    imag = np.array([
-        [np.sin(-1 * n * 2 * np.pi / size * k) * window[k]
-         for k in range(length)] for n in range(size // 2 + 1)
-    ])
+    # angle[n, k] = -2 pi n k / size
+    angle = -2 * np.pi / size * np.outer(
+        np.arange(size // 2 + 1), np.arange(length))
+    real = np.cos(angle) * window
+    imag = np.sin(angle) * window
     kernel = np.concatenate([real, imag], axis=0)
-    # print(kernel.shape)
     return torch.from_numpy(kernel).unsqueeze(dim=1)
 
 
@@ -27,22 +25,43 @@ def get_istft_kernel(size, shift, window):
     window = pb.transform.module_stft._biorthogonal_window_fastest(
         window, shift) / size
     length = len(window)
-    kernel_numpy = np.array([
-        [np.cos(1 * f * 2 * np.pi / size * n) * window[n]
-         for n in range(length)] for f in range(size)
-    ])
-    kernel_real = torch.from_numpy(kernel_numpy)
+    # angle[f, n] = 2 pi f n / size
+    angle = 2 * np.pi / size * np.outer(np.arange(size), np.arange(length))
+    kernel_real = torch.from_numpy(np.cos(angle) * window)
     kernel_real = torch.unsqueeze(kernel_real, dim=1)
 
-    kernel_numpy = np.array([
-        [np.sin(-1 * f * 2 * np.pi / size * n) * window[n]
-         for n in range(length)] for f in range(size)
-    ])
-    kernel_imag = torch.from_numpy(kernel_numpy)
+    kernel_imag = torch.from_numpy(np.sin(-angle) * window)
     kernel_imag = torch.unsqueeze(kernel_imag, dim=1)
     return kernel_real, kernel_imag
 
 
+@functools.lru_cache(maxsize=16)
+def _get_kernels(size, shift, window, window_length, symmetric_window, backend):
+    """
+    Cached construction of the analysis and synthesis kernels (conv backend)
+    or windows (fft backend) for `STFT`.
+    """
+    window = pb.transform.module_stft._get_window(
+        window=window,
+        symmetric_window=symmetric_window,
+        window_length=window_length,
+    )
+    if backend == 'conv':
+        return (
+            get_stft_kernel(size, window),
+            *get_istft_kernel(size, shift, window),
+        )
+    elif backend == 'fft':
+        return (
+            torch.from_numpy(window),
+            torch.from_numpy(
+                pb.transform.module_stft._biorthogonal_window_fastest(
+                    window, shift)),
+        )
+    else:
+        raise ValueError(backend)
+
+
 class STFT:
     def __init__(
             self,
@@ -54,7 +73,8 @@ class STFT:
             fading: typing.Optional[typing.Union[bool, str]] = 'full',
             pad: bool = True,
             symmetric_window: bool = False,
-            complex_representation: str = 'complex'
+            complex_representation: str = 'complex',
+            backend: str = 'conv',
     ):
         """
         This is a torch stft implementation which mirrors the behavior of
@@ -74,6 +94,11 @@ class STFT:
                 imaginary part of the complex stft signal:
                                 either complex, concat or stacked
                                 complex is not supported at the moment
+            backend: 'conv' computes the transforms with a convolution with
+                the DFT kernels (O(size^2) per frame), 'fft' with
+                `torch.fft.rfft`/`irfft` on strided frames
+                (O(size log size) per frame). The fft backend requires
+                window_length <= size.
         """
         if complex_representation == 'complex':
             raise NotImplementedError('Complex tensors are not yet implemented'
@@ -91,17 +116,31 @@ class STFT:
         self.window_length = window_length if window_length is not None \
             else size
 
-        window = pb.transform.module_stft._get_window(
-            window=window,
-            symmetric_window=symmetric_window,
-            window_length=self.window_length,
-        )
         assert fading in [None, True, False, 'full', 'half'], fading
         self.fading = fading
         self.pad = pad
-        self.stft_kernel = get_stft_kernel(size, window)
-        self.istft_kernel_real, self.istft_kernel_imag = get_istft_kernel(
-            size, shift, window)
+
+        assert backend in ['conv', 'fft'], backend
+        self.backend = backend
+        if backend == 'fft':
+            assert self.window_length <= size, (self.window_length, size)
+
+        if isinstance(window, str):
+            kernels = _get_kernels(
+                size, shift, window, self.window_length, symmetric_window,
+                backend
+            )
+        else:
+            # A callable may not be hashable or may have a state.
+            kernels = _get_kernels.__wrapped__(
+                size, shift, window, self.window_length, symmetric_window,
+                backend
+            )
+        if backend == 'conv':
+            (self.stft_kernel, self.istft_kernel_real,
+             self.istft_kernel_imag) = kernels
+        else:
+            self.window, self.synthesis_window = kernels
 
     def __call__(self, inputs):
         """
@@ -148,13 +187,29 @@ class STFT:
                 pad_size = stride - ((x.shape[-1] + stride - length) % stride)
                 x = F.pad(x, (0, pad_size))
 
-        x = torch.unsqueeze(x, 1) # [..., 1, T]
-        weights = self.stft_kernel.to(x)
-        encoded = F.conv1d(x, weight=weights, stride=stride)
+        return self._frames(x, org_shape[:-1])
+
+    def _frames(self, x, batch_shape):
+        """
+        Computes the STFT of all complete frames in the already padded
+        signal `x` with shape [..., T]. The leading dimensions are reshaped
+        to `batch_shape`.
+        """
+        x = x.reshape(-1, x.shape[-1])
+        if self.backend == 'fft':
+            frames = x.unfold(-1, self.window_length, self.shift)
+            encoded = torch.fft.rfft(
+                frames * self.window.to(frames), n=self.size)
+            encoded = encoded.view(*batch_shape, *encoded.shape[-2:])
+            encoded = (encoded.real, encoded.imag)
+        else:
+            x = torch.unsqueeze(x, 1) # [..., 1, T]
+            weights = self.stft_kernel.to(x)
+            encoded = F.conv1d(x, weight=weights, stride=self.shift)
 
-        encoded = encoded.view(*org_shape[:-1], *encoded.shape[-2:])
-        encoded = rearrange(encoded, '... feat frames -> ... frames feat')
-        encoded = torch.chunk(encoded, 2, dim=-1)
+            encoded = encoded.view(*batch_shape, *encoded.shape[-2:])
+            encoded = rearrange(encoded, '... feat frames -> ... frames feat')
+            encoded = torch.chunk(encoded, 2, dim=-1)
         if self.complex_representation == 'stacked':
             encoded = torch.stack(encoded, dim=-1)
         elif self.complex_representation == 'concat':
@@ -204,6 +259,20 @@ class STFT:
         >>> time_signal = istft(complex_signal, 512, 20, window_length=40)
         >>> np.testing.assert_allclose(torch_signal, time_signal, atol=1e-5)
         """
+        time_signal = self._overlap_add(stft_signal)
+        if self.fading not in [None, False]:
+            pad_width = (self.window_length - self.shift)
+            if self.fading == 'half':
+                pad_width /= 2
+            cut_off = time_signal.shape[-1] - ceil(pad_width)
+            time_signal = time_signal[..., int(pad_width): cut_off]
+        return time_signal
+
+    def _overlap_add(self, stft_signal):
+        """
+        Inverse of `_frames`: Overlap-add of the frames with the biorthogonal
+        synthesis window without removing the fading.
+        """
 
         if self.complex_representation == 'stacked':
             signal_real, signal_imag = rearrange(stft_signal, '... s -> s ...')
@@ -216,6 +285,22 @@ class STFT:
             )
         org_shape = signal_real.shape
 
+        if self.backend == 'fft':
+            frames = torch.fft.irfft(
+                torch.complex(signal_real, signal_imag), n=self.size)
+            frames = frames[..., :self.window_length]
+            frames = frames * self.synthesis_window.to(frames)
+            frames = frames.reshape(-1, *frames.shape[-2:])
+            num_frames = frames.shape[-2]
+            time_signal = F.fold(
+                rearrange(frames, 'b frames n -> b n frames'),
+                output_size=(
+                    1, (num_frames - 1) * self.shift + self.window_length),
+                kernel_size=(1, self.window_length),
+                stride=(1, self.shift),
+            )
+            return time_signal.view(*org_shape[:-2], time_signal.shape[-1])
+
         def _apply_kernel(signal, kernel, reflect):
             signal = signal.view(-1, *org_shape[-2:])
             signal = rearrange(signal, '... frames feat -> ... feat frames')
@@ -233,14 +318,20 @@ class STFT:
             signal_imag, self.istft_kernel_imag.to(signal_imag), reflect=True)
 
         time_signal = decoded_real + decoded_imag
-        time_signal = time_signal.view(*org_shape[:-2], time_signal.shape[-1])
-        if self.fading not in [None, False]:
-            pad_width = (self.window_length - self.shift)
-            if self.fading == 'half':
-                pad_width /= 2
-            cut_off = time_signal.shape[-1] - ceil(pad_width)
-            time_signal = time_signal[..., int(pad_width): cut_off]
-        return time_signal
+        return time_signal.view(*org_shape[:-2], time_signal.shape[-1])
+
+    def _fading_pad_width(self):
+        """Number of zeros that the fading adds at the start and the end."""
+        if self.fading in [None, False]:
+            return 0, 0
+        elif self.fading == 'half':
+            return (
+                (self.window_length - self.shift) // 2,
+                ceil((self.window_length - self.shift) / 2)
+            )
+        else:
+            pad_width = self.window_length - self.shift
+            return pad_width, pad_width
 
     def samples_to_frames(self, samples):
         """
@@ -285,3 +376,166 @@ class STFT:
         return pb.transform.module_stft._stft_frames_to_samples(
             frames, self.window_length, self.shift, fading=self.fading
         )
+
+
+class StreamingSTFT:
+    """
+    Stateful version of `STFT.__call__` for signals that arrive in blocks
+    of arbitrary size (e.g. for online processing).
+
+    Each call returns the frames that are complete with the new samples. The
+    samples of incomplete frames are kept until the next call. `flush` adds
+    the end padding (fading and `pad`) and returns the remaining frames.
+    Together, the frames are the same as the frames of the offline `STFT`.
+
+    >>> stft = STFT(512, 128, complex_representation='concat')
+    >>> signal = torch.rand((2, 1000), dtype=torch.float64)
+    >>> stream = StreamingSTFT(stft)
+    >>> frames = [stream(chunk) for chunk in torch.split(signal, 300, dim=-1)]
+    >>> [f.shape[-2] for f in frames]
+    [2, 2, 3, 0]
+    >>> frames.append(stream.flush())
+    >>> frames = torch.cat(frames, dim=-2)
+    >>> frames.shape
+    torch.Size([2, 11, 514])
+    >>> np.testing.assert_allclose(frames, stft(signal), atol=1e-10)
+    """
+    def __init__(self, stft: STFT):
+        self.stft = stft
+        self.reset()
+
+    def reset(self):
+        self.buffer = None
+        self.num_samples = 0
+
+    def __call__(self, chunk):
+        """
+        Args:
+            chunk: shape: [..., t], the next samples of the signal
+
+        Returns:
+            The complete frames, shape: [..., frames, feat] (see `STFT`)
+        """
+        if self.buffer is None:
+            start, _ = self.stft._fading_pad_width()
+            self.buffer = chunk.new_zeros((*chunk.shape[:-1], start))
+            self.num_samples = start
+        self.buffer = torch.cat([self.buffer, chunk], dim=-1)
+        self.num_samples += chunk.shape[-1]
+        return self._emit()
+
+    def flush(self):
+        """
+        Pads the end of the signal like the offline `STFT` and returns the
+        remaining frames. Afterwards, a new signal can be processed.
+        """
+        assert self.buffer is not None, 'No signal to flush.'
+        length = self.stft.window_length
+        stride = self.stft.shift
+
+        _, end = self.stft._fading_pad_width()
+        num_samples = self.num_samples + end
+        if self.stft.pad:
+            if num_samples < length:
+                end += length - num_samples
+            elif stride != 1 and (num_samples + stride - length) % stride != 0:
+                end += stride - ((num_samples + stride - length) % stride)
+        self.buffer = F.pad(self.buffer, (0, end))
+        frames = self._emit()
+        self.reset()
+        return frames
+
+    def _emit(self):
+        length = self.stft.window_length
+        stride = self.stft.shift
+        batch_shape = self.buffer.shape[:-1]
+        num_frames = max(0, (self.buffer.shape[-1] - length) // stride + 1)
+        if num_frames == 0:
+            size = self.stft.size // 2 + 1
+            if self.stft.complex_representation == 'stacked':
+                return self.buffer.new_zeros((*batch_shape, 0, size, 2))
+            else:
+                return self.buffer.new_zeros((*batch_shape, 0, 2 * size))
+        frames = self.stft._frames(
+            self.buffer[..., :(num_frames - 1) * stride + length], batch_shape)
+        self.buffer = self.buffer[..., num_frames * stride:]
+        return frames
+
+
+class StreamingISTFT:
+    """
+    Stateful version of `STFT.inverse` with an incremental overlap-add.
+
+    Each call returns the samples that no later frame overlaps with, i.e.
+    `shift` samples per frame. The remaining `window_length - shift` samples
+    are kept and added to the next frames. `flush` returns them. The samples
+    that the offline `STFT.inverse` cuts off because of the fading are
+    removed.
+
+    >>> stft = STFT(512, 128, complex_representation='concat')
+    >>> stft_signal = torch.rand((2, 11, 514), dtype=torch.float64)
+    >>> stream = StreamingISTFT(stft)
+    >>> signal = [stream(f) for f in torch.split(stft_signal, 4, dim=-2)]
+    >>> [s.shape[-1] for s in signal]
+    [128, 512, 384]
+    >>> signal.append(stream.flush())
+    >>> signal = torch.cat(signal, dim=-1)
+    >>> signal.shape
+    torch.Size([2, 1024])
+    >>> np.testing.assert_allclose(
+    ...     signal, stft.inverse(stft_signal), atol=1e-10)
+    """
+    def __init__(self, stft: STFT):
+        self.stft = stft
+        self.reset()
+
+    def reset(self):
+        self.tail = None
+        self.skip, _ = self.stft._fading_pad_width()
+
+    def __call__(self, stft_signal):
+        """
+        Args:
+            stft_signal: The next frames, see `STFT.inverse` for the shape
+
+        Returns:
+            The completed samples, shape: [..., t]
+        """
+        if self.stft.complex_representation == 'stacked':
+            num_frames = stft_signal.shape[-3]
+        else:
+            num_frames = stft_signal.shape[-2]
+        if num_frames == 0:
+            batch_shape = stft_signal.shape[:-3] \
+                if self.stft.complex_representation == 'stacked' \
+                else stft_signal.shape[:-2]
+            return stft_signal.new_zeros((*batch_shape, 0))
+
+        time_signal = self.stft._overlap_add(stft_signal)
+        if self.tail is not None:
+            overlap = self.tail.shape[-1]
+            time_signal = torch.cat([
+                time_signal[..., :overlap] + self.tail,
+                time_signal[..., overlap:]
+            ], dim=-1)
+        complete = num_frames * self.stft.shift
+        self.tail = time_signal[..., complete:]
+        return self._skip(time_signal[..., :complete])
+
+    def flush(self):
+        """
+        Returns the remaining samples without the end fading. Afterwards, a
+        new signal can be processed.
+        """
+        assert self.tail is not None, 'No signal to flush.'
+        _, end = self.stft._fading_pad_width()
+        time_signal = self._skip(
+            self.tail[..., :self.tail.shape[-1] - end])
+        self.reset()
+        return time_signal
+
+    def _skip(self, time_signal):
+        # Remove the start fading
+        skip = min(self.skip, time_signal.shape[-1])
+        self.skip -= skip
+        return time_signal[..., skip:]
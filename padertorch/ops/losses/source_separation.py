@@ -1,12 +1,18 @@
+import inspect
+import itertools
+
+import numpy as np
 import torch
 import torch.nn.functional
-import itertools
 import padertorch as pt
+from padertorch.ops.losses import regression
+from padertorch.ops.sequence.mask import compute_sequence_mask
 
 
 __all__ = [
     'deep_clustering_loss',
     'pit_loss',
+    'batched_pit_loss',
 ]
 
 
@@ -303,3 +309,396 @@ def pit_loss_from_loss_matrix(
         return min_loss, col_ind
     else:
         return min_loss
+
+
+def _energies(estimate, target, pairwise):
+    """
+    Returns the energies of the estimates and the targets and the
+    correlations between them, each summed over the last axis.
+
+    If `pairwise`, the shapes are (B, K, 1, ...), (B, 1, K, ...) and
+    (B, K, K, ...), i.e. each estimate vs. each target, else (B, K, ...)
+    for the aligned pairs `estimate[b, k]` and `target[b, k]`.
+    """
+    estimate_energy = torch.sum(estimate ** 2, dim=-1)
+    target_energy = torch.sum(target ** 2, dim=-1)
+    if pairwise:
+        correlation = torch.einsum('bk...n,bl...n->bkl...', estimate, target)
+        return estimate_energy[:, :, None], target_energy[:, None, :], \
+            correlation
+    return estimate_energy, target_energy, torch.sum(estimate * target, dim=-1)
+
+
+def _squared_error(estimate, target, pairwise):
+    if not pairwise:
+        return (
+            torch.sum((estimate - target) ** 2, dim=-1),
+            torch.sum(target ** 2, dim=-1),
+        )
+    estimate_energy, target_energy, correlation = _energies(
+        estimate, target, pairwise)
+    # Values below the resolution of the expansion are caused by
+    # cancellation. The lower bound avoids negative values and ties of
+    # several permutations at -inf (e.g. SDR), when the estimates are good.
+    resolution = torch.finfo(correlation.dtype).eps * (
+        estimate_energy + target_energy)
+    return torch.maximum(
+        estimate_energy + target_energy - 2 * correlation, resolution
+    ), target_energy
+
+
+def _rowwise_mse(estimate, target, num_values, pairwise):
+    return _squared_error(estimate, target, pairwise)[0] / num_values
+
+
+def _rowwise_log_mse(estimate, target, num_values, pairwise):
+    return torch.log10(_rowwise_mse(estimate, target, num_values, pairwise))
+
+
+def _rowwise_log1p_mse(estimate, target, num_values, pairwise):
+    return torch.log10(
+        1 + _rowwise_mse(estimate, target, num_values, pairwise))
+
+
+def _rowwise_sdr(estimate, target, num_values, pairwise):
+    squared_error, target_energy = _squared_error(estimate, target, pairwise)
+    return -10 * torch.log10(target_energy / squared_error)
+
+
+def _rowwise_si_sdr(estimate, target, num_values, pairwise):
+    if not pairwise:
+        # Same as si_sdr_loss
+        s_target = regression._get_scaling_factor(target, estimate) * target
+        return _rowwise_sdr(estimate, s_target, num_values, pairwise)
+    estimate_energy, target_energy, correlation = _energies(
+        estimate, target, pairwise)
+    # Energy of the scaled target (s_target) and the remaining noise (e_noise)
+    # of [1] in si_sdr_loss, derived from the correlation.
+    s_target_energy = correlation ** 2 / target_energy
+    e_noise_energy = torch.maximum(
+        estimate_energy - s_target_energy,
+        torch.finfo(correlation.dtype).eps * estimate_energy,
+    )
+    return -10 * torch.log10(s_target_energy / e_noise_energy)
+
+
+# Maps a loss function to an implementation that reduces the last axis of the
+# signals with a few matrix operations. With `pairwise=True` the loss is
+# computed for each estimate target pair from the energies and the
+# correlations, i.e. without a (B, K, K, ..., N) intermediate.
+# Signature: (estimate (B, K, ..., N), target (B, K, ..., N),
+#             num_values (number of non padded values along N), pairwise)
+#            -> losses (B, K_estimate, K_target, ...) or (B, K, ...)
+_ROWWISE_LOSSES = {
+    regression.mse_loss: _rowwise_mse,
+    regression.log_mse_loss: _rowwise_log_mse,
+    regression.log1p_mse_loss: _rowwise_log1p_mse,
+    regression.sdr_loss: _rowwise_sdr,
+    regression.si_sdr_loss: _rowwise_si_sdr,
+    torch.nn.functional.mse_loss: _rowwise_mse,
+}
+
+
+def _speaker_reduction(loss_fn):
+    """
+    The reduction along the speaker axis, that `pit_loss` would use with
+    `loss_fn`, e.g. 'sum' for `pt.ops.losses.mse_loss` and 'mean' for
+    `torch.nn.functional.mse_loss`.
+    """
+    try:
+        reduction = inspect.signature(loss_fn).parameters['reduction'].default
+    except (KeyError, ValueError):
+        reduction = 'mean'
+    if reduction not in ['mean', 'sum']:
+        # e.g. torch.nn.functional.mse_loss, where the default is 'mean'
+        reduction = 'mean'
+    return reduction
+
+
+def _batched_losses(estimate, target, loss_fn, sequence_lengths, pairwise):
+    """
+    Computes the losses between each estimate and each target (B, K, K), if
+    `pairwise`, else between `estimate[b, k]` and `target[b, k]` (B, K).
+
+    `loss_fn` reduces the last axis of the signals. The remaining signal
+    axes are reduced like `pit_loss` reduces them, i.e. with the speaker
+    reduction of `loss_fn` (see `_speaker_reduction`). The values after the
+    sequence length (axis 2) are masked, so they neither contribute to the
+    losses nor get a gradient.
+    """
+    assert estimate.shape == target.shape, (estimate.shape, target.shape)
+    assert estimate.dim() >= 3, (
+        f'Expected (B, K, T, ...), got {estimate.shape}'
+    )
+    B, K = estimate.shape[:2]
+    assert K < 30, f'Are you sure? sources={K}'
+
+    mask = compute_sequence_mask(
+        estimate, sequence_lengths, batch_axis=0, sequence_axis=2,
+    )
+    if mask is not None:
+        zero = estimate.new_zeros(())
+        estimate = torch.where(mask, estimate, zero)
+        target = torch.where(mask, target, zero)
+
+    if loss_fn in _ROWWISE_LOSSES:
+        if mask is not None and estimate.dim() == 3:
+            # The last axis is the sequence axis
+            num_values = sequence_lengths.to(estimate.dtype)[:, None]
+            if pairwise:
+                num_values = num_values[:, :, None]
+        else:
+            num_values = estimate.shape[-1]
+        losses = _ROWWISE_LOSSES[loss_fn](
+            estimate, target, num_values, pairwise)
+    elif mask is not None and estimate.dim() == 3:
+        raise ValueError(
+            f'The loss_fn {loss_fn} reduces the sequence axis, hence the '
+            f'padding cannot be masked. Use one of '
+            f'{[fn.__name__ for fn in _ROWWISE_LOSSES]} or signals with the '
+            f'shape (B, K, T, ...).'
+        )
+    elif pairwise:
+        shape = (B, K, K, *estimate.shape[2:])
+        losses = loss_fn(
+            estimate[:, :, None].expand(shape),
+            target[:, None, :].expand(shape),
+            reduction=None,
+        )
+    else:
+        losses = loss_fn(estimate, target, reduction=None)
+
+    signal_dim = 3 if pairwise else 2
+    if losses.dim() == signal_dim:
+        return losses
+    if mask is not None:
+        # Mask of the losses, i.e., without the reduced last axis
+        mask = mask[..., 0]
+        if pairwise:
+            mask = mask[:, :, None]
+        losses = torch.where(mask, losses, losses.new_zeros(()))
+    losses = losses.flatten(start_dim=signal_dim).sum(dim=-1)
+    if _speaker_reduction(loss_fn) == 'mean':
+        if mask is None:
+            losses = losses / np.prod(estimate.shape[2:-1])
+        else:
+            losses = losses / mask.flatten(start_dim=signal_dim).sum(dim=-1)
+    return losses
+
+
+def compute_batched_pairwise_losses(
+        estimate: torch.Tensor,
+        target: torch.Tensor,
+        loss_fn=regression.mse_loss,
+        sequence_lengths=None,
+):
+    """
+    Computes the pair wise loss between each estimated and each target signal
+    for a whole batch, i.e. the batched version of `compute_pairwise_losses`.
+
+    `loss_fn` reduces the last axis of the signals. All other axes after the
+    speaker axis are reduced with the default reduction of `loss_fn`, so
+    `pit_loss(estimate[b], target[b], axis=0, loss_fn=loss_fn)` is the
+    minimum over the permutations of the sum (e.g. `mse_loss`) or the mean
+    (e.g. `si_sdr_loss`) of the assigned entries.
+
+    For the loss functions `pt.ops.losses.{mse_loss, log_mse_loss,
+    log1p_mse_loss, sdr_loss, si_sdr_loss}` and
+    `torch.nn.functional.mse_loss` the losses are computed from the energies
+    and the correlations of the signals, so no (B, K, K, ..., N) intermediate
+    is necessary. Note: Because of this, the precision is lower for very good
+    estimates (e.g. SDRs beyond 60 dB in float32). Hence, `batched_pit_loss`
+    uses the matrix only to select the permutation and computes the returned
+    loss on the permuted estimates.
+
+    Any other `loss_fn` must support `reduction=None` and reduce only the last
+    axis, like the losses in `pt.ops.losses.regression`. It is called once on
+    a (B, K, K, ...) broadcast of the signals. With `sequence_lengths`, the
+    sequence axis must not be the last axis.
+
+    Args:
+        estimate: Shape (B, K, T, ...)
+        target: Same shape as `estimate`.
+        loss_fn: See above.
+        sequence_lengths: None or list/tensor with B lengths of the T axis.
+            The values after the sequence length are ignored.
+
+    Returns:
+        pair_wise_loss_matrix: Shape (B, K, K), where the entry [b, i, j] is
+            the loss between `estimate[b, i]` and `target[b, j]`.
+
+    >>> B, K, T = 3, 2, 10
+    >>> estimate, target = torch.ones(B, K, T), torch.zeros(B, K, T)
+    >>> compute_batched_pairwise_losses(estimate, target).shape
+    torch.Size([3, 2, 2])
+    >>> compute_batched_pairwise_losses(estimate, target)[0]
+    tensor([[1., 1.],
+            [1., 1.]])
+    """
+    if sequence_lengths is not None:
+        sequence_lengths = torch.as_tensor(
+            sequence_lengths, device=estimate.device)
+        assert sequence_lengths.shape == (estimate.shape[0],), (
+            sequence_lengths.shape, estimate.shape)
+    return _batched_losses(
+        estimate, target, loss_fn, sequence_lengths, pairwise=True)
+
+
+def _all_permutations(K, device):
+    return torch.tensor(
+        list(itertools.permutations(range(K))),
+        dtype=torch.long, device=device,
+    )
+
+
+def batched_pit_loss_from_loss_matrix(
+        pair_wise_loss_matrix: torch.Tensor,
+        *,
+        reduction='mean',
+        algorithm: ['optimal', 'exhaustive', 'hungarian'] = 'optimal',
+        return_permutation=False,
+):
+    """
+    Finds the best assignment for each example of a batch of pair wise loss
+    matrices and returns the loss of this assignment.
+
+    Args:
+        pair_wise_loss_matrix: Shape (B, K, K). The entry [b, i, j] is the
+            loss between the estimate i and the target j.
+        reduction: 'mean' or 'sum' along the speaker axis.
+        algorithm:
+            'exhaustive': Evaluate all K! permutations in one vectorized
+                operation on the device of the `pair_wise_loss_matrix`.
+            'hungarian': `scipy.optimize.linear_sum_assignment` on the host
+                for each example.
+            'optimal': 'exhaustive' for K <= 7, otherwise 'hungarian'.
+        return_permutation: If `True`, returns additionally the permutations
+            (B, K), such that `estimate[b, permutation[b]]` aligns with
+            `target[b]` (see `pit_loss`).
+
+    Returns:
+        loss: Shape (B,)
+
+    >>> score_matrix = np.array([[11., 10, 0],[4, 5, 10],[6, 0, 5]])
+    >>> pair_wise_loss_matrix = torch.tensor(-score_matrix)[None]
+    >>> batched_pit_loss_from_loss_matrix(pair_wise_loss_matrix, reduction='sum')
+    tensor([-26.], dtype=torch.float64)
+    >>> batched_pit_loss_from_loss_matrix(
+    ...     pair_wise_loss_matrix, reduction='sum', algorithm='hungarian',
+    ...     return_permutation=True)
+    (tensor([-26.], dtype=torch.float64), tensor([[2, 0, 1]]))
+    """
+    assert pair_wise_loss_matrix.dim() == 3, pair_wise_loss_matrix.shape
+    B, K, K_ = pair_wise_loss_matrix.shape
+    assert K == K_, pair_wise_loss_matrix.shape
+
+    if algorithm == 'optimal':
+        algorithm = 'exhaustive' if K <= 7 else 'hungarian'
+
+    if algorithm == 'exhaustive':
+        # permutations[p, k] is the estimate that is assigned to target k
+        permutations = _all_permutations(K, pair_wise_loss_matrix.device)
+        targets = torch.arange(K, device=pair_wise_loss_matrix.device)
+        # (B, P, K) -> (B, P)
+        candidates = pair_wise_loss_matrix[:, permutations, targets].sum(-1)
+        idx = torch.argmin(candidates.detach(), dim=-1)
+        permutation = permutations[idx]
+    elif algorithm == 'hungarian':
+        import scipy.optimize
+        permutation = []
+        for loss_matrix in pt.utils.to_numpy(
+                pair_wise_loss_matrix, detach=True):
+            # Transpose, so col_ind are the estimates for each target
+            _, col_ind = scipy.optimize.linear_sum_assignment(loss_matrix.T)
+            permutation.append(col_ind)
+        permutation = torch.as_tensor(
+            np.array(permutation), device=pair_wise_loss_matrix.device
+        ).to(torch.long)
+    else:
+        raise ValueError(algorithm)
+
+    min_loss = torch.gather(
+        pair_wise_loss_matrix, 1, permutation[:, None, :]
+    )[:, 0, :]
+    if reduction == 'mean':
+        min_loss = min_loss.mean(dim=-1)
+    elif reduction == 'sum':
+        min_loss = min_loss.sum(dim=-1)
+    else:
+        raise ValueError(reduction)
+
+    if return_permutation:
+        return min_loss, permutation
+    else:
+        return min_loss
+
+
+def batched_pit_loss(
+        estimate: torch.Tensor,
+        target: torch.Tensor,
+        loss_fn=regression.mse_loss,
+        sequence_lengths=None,
+        *,
+        reduction='mean',
+        algorithm='optimal',
+        return_permutation=False,
+):
+    """
+    Permutation invariant loss for a batch of examples. Computes the pair wise
+    losses of all examples at once (see `compute_batched_pairwise_losses`)
+    and selects the best permutation for each example (see
+    `batched_pit_loss_from_loss_matrix`).
+
+    For each example the result is equal to
+    `pit_loss(estimate[b, :, :l], target[b, :, :l], axis=0, loss_fn=loss_fn)`,
+    where `l` is the sequence length of the example. The padding is masked,
+    so all examples are processed at once.
+
+    Args:
+        estimate: Shape (B, K, T, ...)
+        target: Same shape as `estimate`
+        loss_fn: The loss function. Must be factorizable in pair wise losses,
+            see `compute_batched_pairwise_losses`. The reduction along the
+            speaker axis is the default reduction of `loss_fn`.
+        sequence_lengths: None or the B lengths of the T axis.
+        reduction: 'mean', 'sum' or 'none'/None along the batch axis.
+        algorithm: See `batched_pit_loss_from_loss_matrix`.
+        return_permutation: If `True`, returns additionally the best
+            permutations with shape (B, K).
+
+    >>> B, K, T = 3, 2, 4
+    >>> estimate, target = torch.ones(B, K, T), torch.zeros(B, K, T)
+    >>> batched_pit_loss(estimate, target)
+    tensor(2.)
+    >>> estimate = torch.stack([torch.ones(T), torch.zeros(T)])[None]
+    >>> target = estimate[:, (1, 0), :]
+    >>> batched_pit_loss(estimate, target, return_permutation=True)
+    (tensor(0.), tensor([[1, 0]]))
+    """
+    if sequence_lengths is not None:
+        sequence_lengths = torch.as_tensor(
+            sequence_lengths, device=estimate.device)
+    with torch.no_grad():
+        # The loss matrix is only used to select the permutation
+        pair_wise_loss_matrix = compute_batched_pairwise_losses(
+            estimate, target, loss_fn=loss_fn,
+            sequence_lengths=sequence_lengths,
+        )
+        _, permutation = batched_pit_loss_from_loss_matrix(
+            pair_wise_loss_matrix,
+            algorithm=algorithm,
+            return_permutation=True,
+        )
+    batch_index = torch.arange(estimate.shape[0], device=estimate.device)
+    estimate = estimate[batch_index[:, None], permutation]
+    min_loss = _batched_losses(
+        estimate, target, loss_fn, sequence_lengths, pairwise=False)
+    if _speaker_reduction(loss_fn) == 'mean':
+        min_loss = min_loss.mean(dim=-1)
+    else:
+        min_loss = min_loss.sum(dim=-1)
+    min_loss = regression._reduce(min_loss, reduction=reduction)
+    if return_permutation:
+        return min_loss, permutation
+    else:
+        return min_loss
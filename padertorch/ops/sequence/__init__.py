@@ -1,7 +1,9 @@
+from . import mask
 from . import pack_module
 from . import pointwise
 from . import reduction
 
+from .mask import *
 from .pack_module import *
 from .pointwise import *
 from .reduction import *
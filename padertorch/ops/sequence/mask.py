@@ -1,5 +1,134 @@
+import contextlib
+import threading
+
+import numpy as np
 import torch
 
+__all__ = [
+    'compute_mask',
+    'compute_sequence_mask',
+    'mask_cache',
+]
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def mask_cache():
+    """
+    Within this context, `compute_sequence_mask` (and hence `compute_mask`)
+    caches the masks, so that the layers of a model, that get the same
+    sequence lengths, share a single mask instead of building one per call.
+    The cache is cleared, when the outermost context exits, hence it should
+    wrap one forward step (the `Trainer` does that for the forward step and
+    the review).
+
+    Lists and arrays of sequence lengths are identified by their values,
+    tensors by their identity, i.e., a tensor must not be modified in-place
+    within the context.
+
+    >>> x = torch.zeros((2, 3, 5))
+    >>> with mask_cache():
+    ...     m1 = compute_sequence_mask(x, [3, 5], sequence_axis=-1)
+    ...     m2 = compute_sequence_mask(x + 1, [3, 5], sequence_axis=-1)
+    >>> m1 is m2
+    True
+    >>> m1 is compute_sequence_mask(x, [3, 5], sequence_axis=-1)
+    False
+    """
+    if getattr(_local, 'cache', None) is not None:
+        # Nested context: Use the cache of the outer context
+        yield
+        return
+    _local.cache = {}
+    try:
+        yield
+    finally:
+        _local.cache = None
+
+
+def _lengths_key(sequence_lengths):
+    if isinstance(sequence_lengths, torch.Tensor):
+        # The cache holds a reference to the tensor, hence the id is unique
+        # for the lifetime of the cache.
+        return 'tensor', id(sequence_lengths)
+    return 'values', tuple(np.asarray(sequence_lengths).tolist())
+
+
+def compute_sequence_mask(
+        x, sequence_lengths, batch_axis=0, sequence_axis=1
+):
+    """
+    Boolean mask of the non-padded values of `x`. In contrast to
+    `compute_mask`, the mask is not expanded to the shape of `x`. It has the
+    size of `x` along the batch and the sequence axis and size one along all
+    other axes, so it broadcasts in `x * mask` or `x.masked_fill(~mask, 0)`.
+
+    Returns `None`, if `sequence_lengths` is `None` or if no value of `x` is
+    padded, so callers can skip the masking.
+
+    The lengths are moved to the device of `x` once. Within `mask_cache`,
+    the mask is computed once for each combination of lengths, sequence
+    size, device and axes.
+
+    >>> x = torch.ones((3, 10, 4))
+    >>> compute_sequence_mask(x, [1, 2, 3], batch_axis=0, sequence_axis=-1)
+    tensor([[[ True, False, False, False]],
+    <BLANKLINE>
+            [[ True,  True, False, False]],
+    <BLANKLINE>
+            [[ True,  True,  True, False]]])
+    >>> print(compute_sequence_mask(x, [4, 4, 4], 0, -1))
+    None
+
+    Args:
+        x: tensor to be masked
+        sequence_lengths: list, array or tensor with the sequence length for
+            each sequence in the mini-batch.
+        batch_axis: axis along which sequences are stacked
+        sequence_axis: axis which may contain padding (of different lengths
+            for each sequence)
+
+    Returns:
+        Boolean tensor with `x.dim()` dimensions or `None`
+    """
+    if sequence_lengths is None:
+        return None
+    batch_axis = batch_axis % x.dim()
+    sequence_axis = sequence_axis % x.dim()
+
+    cache = getattr(_local, 'cache', None)
+    if cache is not None:
+        key = (
+            _lengths_key(sequence_lengths), x.shape[sequence_axis], x.device,
+            x.dim(), batch_axis, sequence_axis,
+        )
+        try:
+            return cache[key][0]
+        except KeyError:
+            pass
+
+    if isinstance(sequence_lengths, torch.Tensor):
+        lengths = sequence_lengths.to(device=x.device)
+    else:
+        lengths = torch.as_tensor(
+            np.asarray(sequence_lengths), dtype=torch.long, device=x.device
+        )
+    if bool((lengths >= x.shape[sequence_axis]).all()):
+        mask = None
+    else:
+        shape = x.dim() * [1]
+        shape[batch_axis] = x.shape[batch_axis]
+        lengths = lengths.view(shape)
+        shape = x.dim() * [1]
+        shape[sequence_axis] = x.shape[sequence_axis]
+        idx = torch.arange(x.shape[sequence_axis], device=x.device).view(shape)
+        mask = idx < lengths
+
+    if cache is not None:
+        cache[key] = (mask, sequence_lengths)
+    return mask
+
 
 def compute_mask(x, sequence_lengths, batch_axis=0, sequence_axis=1):
     """
@@ -54,17 +183,7 @@ def compute_mask(x, sequence_lengths, batch_axis=0, sequence_axis=1):
     Returns:
 
     """
-    if sequence_lengths is None:
+    mask = compute_sequence_mask(x, sequence_lengths, batch_axis, sequence_axis)
+    if mask is None:
         return torch.ones_like(x)
-    if batch_axis < 0:
-        batch_axis = x.dim() + batch_axis
-    if sequence_axis < 0:
-        sequence_axis = x.dim() + sequence_axis
-    sequence_lengths = torch.Tensor(sequence_lengths).long().to(x.device)
-    for dim in range(batch_axis + 1, x.dim()):
-        sequence_lengths = sequence_lengths.unsqueeze(-1)
-    idx = torch.arange(x.shape[sequence_axis]).to(x.device)
-    for dim in range(sequence_axis + 1, x.dim()):
-        idx = idx.unsqueeze(-1)
-    mask = (idx < sequence_lengths).float().expand(x.shape)
-    return mask
+    return mask.float().expand(x.shape)
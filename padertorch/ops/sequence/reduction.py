@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from padertorch.utils import normalize_axis
 
@@ -18,17 +19,75 @@ def packed_batch_sizes_to_sequence_lengths(batch_sizes: list):
 
     """
     # TODO: May need to respect batch_first argument.
-    # TODO: This is a good candidate for Cython.
     # TODO: Neither we nor them support empty dimensions.
-    lengths = []
-    last_batch_size = 0
-    for length, batch_size in reversed(list(enumerate(batch_sizes, 1))):
-        if batch_size > last_batch_size:
-            lengths.extend((int(batch_size) - last_batch_size) * [length])
-            last_batch_size = int(batch_size)
-        else:
-            pass
-    return lengths
+    # The length of sequence b is the number of time steps with more than b
+    # sequences, i.e. `num_frames - #{t: batch_sizes[t] <= b}`.
+    batch_sizes = np.asarray(batch_sizes, dtype=np.int64)
+    counts = np.bincount(batch_sizes, minlength=batch_sizes[0] + 1)
+    lengths = len(batch_sizes) - np.cumsum(counts)[:batch_sizes[0]]
+    return lengths.tolist()
+
+
+def packed_batch_sizes_to_segment_ids(batch_sizes):
+    """
+    Returns the index of the sequence for each frame in the data of a
+    `PackedSequence`, i.e., the position in the sorted batch.
+
+    >>> packed_batch_sizes_to_segment_ids(torch.tensor([3, 2, 1]))
+    tensor([0, 1, 2, 0, 1, 0])
+    """
+    batch_sizes = torch.as_tensor(batch_sizes, dtype=torch.long)
+    offsets = torch.cumsum(batch_sizes, 0) - batch_sizes
+    return (
+        torch.arange(int(batch_sizes.sum()))
+        - torch.repeat_interleave(offsets, batch_sizes)
+    )
+
+
+# Reductions of a `PackedSequence` over time that are computed as segment
+# reductions without a loop over the sequences.
+_SEGMENT_REDUCTIONS = {
+    torch.sum: 'sum',
+    torch.mean: 'mean',
+    torch.max: 'amax',
+    torch.amax: 'amax',
+    torch.min: 'amin',
+    torch.amin: 'amin',
+}
+
+_FRAME_REDUCTIONS = {
+    'sum': torch.sum,
+    'mean': torch.mean,
+    'amax': torch.amax,
+    'amin': torch.amin,
+}
+
+
+def _packed_segment_reduction(reduce, x, axis, keepdims):
+    """
+    Reduces the `PackedSequence` `x` over time and the axes `axis` of
+    `x.data` (without the packed axis 0) for each sequence with `index_add_`
+    (sum and mean) or `scatter_reduce_` (amax and amin).
+
+    Returns the result in the order of the sorted sequences of `x`.
+    """
+    data = x.data
+    if len(axis) > 0:
+        data = _FRAME_REDUCTIONS[reduce](data, dim=axis, keepdim=keepdims)
+    batch_size = int(x.batch_sizes[0])
+    segment_ids = packed_batch_sizes_to_segment_ids(x.batch_sizes).to(
+        data.device)
+    out = data.new_zeros((batch_size, *data.shape[1:]))
+    if reduce in ['sum', 'mean']:
+        out = out.index_add(0, segment_ids, data)
+        if reduce == 'mean':
+            lengths = torch.bincount(segment_ids, minlength=batch_size)
+            out = out / lengths.to(out.dtype).view(
+                -1, *(out.dim() - 1) * [1])
+    else:
+        index = segment_ids.view(-1, *(data.dim() - 1) * [1]).expand_as(data)
+        out = out.scatter_reduce(0, index, data, reduce, include_self=False)
+    return out
 
 
 def sequence_reduction(function, x, *args, axis=None, keepdims=False, **kwargs):
@@ -96,31 +155,46 @@ def sequence_reduction(function, x, *args, axis=None, keepdims=False, **kwargs):
                         [1]
                     )
                 else:
-                    function(x.data, *args, dim=axis, keepdim=keepdims)
+                    return function(x.data, *args, dim=axis, keepdim=keepdims)
             else:
-                results = []
-                lengths = packed_batch_sizes_to_sequence_lengths(x.batch_sizes)
-                position = 0
-
-                # Adjust `axis` since time and batch axes are collapsed.
-                axis = [a - 1 if not a == 0 else 0 for a in axis]
-                for length in lengths:
-                    results.append(function(
-                        x.data[position:position+length],
-                        *args,
-                        dim=axis,
-                        keepdim=keepdims,
-                        **kwargs
-                    ))
-                    position += length
+                reduce = _SEGMENT_REDUCTIONS.get(function)
+                if reduce is not None and not args and not kwargs:
+                    # Adjust `axis` since time and batch axes are collapsed.
+                    axis = [a - 1 for a in axis if not a == 0]
+                    result = _packed_segment_reduction(
+                        reduce, x, axis, keepdims)
+                else:
+                    # Generic reduction: Gather the frames of each sequence
+                    segment_ids = packed_batch_sizes_to_segment_ids(
+                        x.batch_sizes).to(x.data.device)
+                    # Adjust `axis` since time and batch axes are collapsed.
+                    axis = [a - 1 if not a == 0 else 0 for a in axis]
+                    results = [
+                        function(
+                            x.data[segment_ids == b],
+                            *args,
+                            dim=axis,
+                            keepdim=keepdims,
+                            **kwargs
+                        )
+                        for b in range(int(x.batch_sizes[0]))
+                    ]
+                    if keepdims:
+                        result = torch.cat(results)
+                    else:
+                        result = torch.stack(results)
                 if keepdims:
+                    # Each sequence has a single frame.
                     return torch.nn.utils.rnn.PackedSequence(
-                        torch.cat(results), [1 for b in x.batch_sizes]
+                        result, torch.tensor([result.shape[0]]),
+                        x.sorted_indices, x.unsorted_indices
                     )
                 else:
                     # PackedSequence is not necessary here, since
                     # the sequence dimension is not kept
-                    return torch.stack(results)
+                    if x.unsorted_indices is not None:
+                        result = result.index_select(0, x.unsorted_indices)
+                    return result
         else:
             if batch_axis in axis:
                 raise NotImplementedError(
@@ -9,6 +9,7 @@ trainer.
 
 """
 import types
+import warnings
 from collections import defaultdict
 from enum import IntEnum
 from pathlib import Path
@@ -35,6 +36,8 @@ __all__ = [
     'LossWeightAnnealingHook',
     'ModelAttributeAnnealingHook',
     'LRAnnealingHook',
+    'ProfilerHook',
+    'MemoryWatchdogHook',
 ]
 
 
@@ -198,6 +201,7 @@ class SummaryHook(TriggeredHook):
             texts=dict(),
             figures=dict(),
             timings=dict(),
+            resources=dict(),
             buffers=defaultdict(list),
             snapshots=dict()
         ))
@@ -226,11 +230,27 @@ class SummaryHook(TriggeredHook):
         assert len(review) >= 1, review
         popped_review = {**review}  # copy for "pop"
 
-        # note item is the pytorch function to get the value of a tensor
         for key, scalars in popped_review.pop('scalars', dict()).items():
-            self.summary['scalars'][key].extend(self._to_list(scalars))
+            if torch.is_tensor(scalars):
+                # Keep the tensor on the device. The transfer to the host
+                # would block until all queued kernels are finished, hence
+                # it is delayed to finalize_summary (see _scalars_to_host).
+                if scalars._base is not None:
+                    # Do not keep the storage of a larger tensor alive.
+                    scalars = scalars.clone()
+                self.summary['scalars'][key].append(scalars.detach())
+            else:
+                self.summary['scalars'][key].extend(self._to_list(scalars))
         for key, histogram in popped_review.pop('histograms', dict()).items():
-            self.summary['histograms'][key].extend(self._to_list(histogram))
+            if torch.is_tensor(histogram) and histogram.numel() == 1:
+                # e.g. the grad norm of the trainer: deferred like the
+                # scalars. Larger tensors are transferred immediately to
+                # bound the memory on the device.
+                self.summary['histograms'][key].append(
+                    histogram.detach().clone().reshape(1))
+            else:
+                self.summary['histograms'][key].extend(
+                    self._to_list(histogram))
             # do not hold more than 1M values in memory
             self.summary['histograms'][key] = \
                 self.summary['histograms'][key][-1000000:]
@@ -261,6 +281,130 @@ class SummaryHook(TriggeredHook):
             scalars = [scalars]
         return scalars
 
+    @staticmethod
+    def _scalars_to_host(values):
+        """
+        Converts the (deferred) tensors in `values` to python scalars.
+
+        Consecutive tensors that share the device and dtype are concatenated,
+        so a whole summary interval needs only a few host transfers instead of
+        one per iteration.
+
+        >>> SummaryHook._scalars_to_host([
+        ...     1, torch.tensor(2.), torch.tensor([3., 4.]), 5, torch.tensor(6)
+        ... ])
+        [1, 2.0, 3.0, 4.0, 5, 6]
+        """
+        host_values = []
+        tensors = []
+
+        def flush():
+            if len(tensors) > 0:
+                host_values.extend(torch.cat(
+                    [t.reshape(-1) for t in tensors]).cpu().tolist())
+                tensors.clear()
+
+        for value in values:
+            if torch.is_tensor(value):
+                if len(tensors) > 0 and (
+                        tensors[-1].device != value.device
+                        or tensors[-1].dtype != value.dtype
+                ):
+                    flush()
+                tensors.append(value)
+            else:
+                flush()
+                host_values.append(value)
+        flush()
+        return host_values
+
+    def _scalars_to_host_and_check(self, trainer, gather=False):
+        """
+        Transfers all scalars to the host and checks that the loss and the
+        grad norms are finite. See `Trainer.defer_scalar_sync`.
+
+        With `gather=True` the scalars of all ranks are concatenated in
+        a distributed training (see `DistributedTrainer`). Otherwise, the
+        ranks check their own scalars and agree on the result (see
+        `DistributedTrainer.any_rank_failed`), so that all ranks raise, when
+        one rank fails.
+        """
+        for key, values in self.summary['scalars'].items():
+            self.summary['scalars'][key] = self._scalars_to_host(values)
+        for key, values in self.summary['histograms'].items():
+            self.summary['histograms'][key] = self._scalars_to_host(values)
+        distributed = getattr(trainer, 'world_size', 1) > 1
+        if gather and distributed:
+            # A rank may have failed before this point, e.g. in the
+            # validation, and does not join the all_gather.
+            if trainer.any_rank_failed(False):
+                raise RuntimeError(
+                    f'Another rank failed before the {self.summary_prefix} '
+                    f'summary of iteration {trainer.iteration}.'
+                )
+            self.summary['scalars'].update(
+                trainer.all_gather_scalars(self.summary['scalars']))
+
+        # With loss scaling, non finite gradients are expected and the
+        # optimizer skips these steps (see Trainer.mixed_precision). They are
+        # removed from the grad norm scalars, whose mean would be inf, and
+        # from the histograms, which have to be finite.
+        if getattr(trainer, 'loss_scaler', None) is not None:
+            for summary_type, suffix in [
+                    ('scalars', 'grad_norm'), ('histograms', 'grad_norm_'),
+            ]:
+                summary = self.summary[summary_type]
+                for key in list(summary.keys()):
+                    if key.split('/')[0].endswith(suffix):
+                        values = [v for v in summary[key] if np.isfinite(v)]
+                        if len(values) > 0:
+                            summary[key] = values
+                        else:
+                            del summary[key]
+            grad_norm_keys = []
+        else:
+            grad_norm_keys = [
+                key for key in self.summary['scalars'].keys()
+                if key.split('/')[0].endswith('grad_norm')
+            ]
+        non_finite_keys = [
+            key for key in [*grad_norm_keys, 'loss']
+            if not np.all(np.isfinite(self.summary['scalars'].get(key, [])))
+        ]
+        if distributed and not gather:
+            if trainer.any_rank_failed(len(non_finite_keys) > 0) \
+                    and len(non_finite_keys) == 0:
+                raise RuntimeError(
+                    f'The loss or grad_norm is not finite on another rank in '
+                    f'{self.summary_prefix} before iteration '
+                    f'{trainer.iteration}.'
+                )
+        if len(non_finite_keys) > 0:
+            key = non_finite_keys[0]
+            values = self.summary['scalars'][key]
+            # The first failing step and its scalars, i.e. the scalars of the
+            # review and of the optimizer step.
+            index = int(np.argmin(np.isfinite(values)))
+            review = {'scalars': {
+                k: v[index] for k, v in self.summary['scalars'].items()
+                if len(v) == len(values)
+            }}
+            # Write each interesting object to an individual file, because
+            # not each object is serializable with `torch.save`.
+            log_path_pattern = trainer.log_error_state({
+                'model': trainer.model,
+                'state_dict': trainer.state_dict(),
+                'review': review,
+                'summary': dict(self.summary),
+            })
+            raise RuntimeError(
+                f"The {key} ({values[index]}) is not finite in step "
+                f"{index + 1} of {len(values)} of the {self.summary_prefix} "
+                f"summary before iteration {trainer.iteration}.\n"
+                f"See error states (model, state_dict, review and summary) "
+                f"in {log_path_pattern}."
+            )
+
     @staticmethod
     def _detach(buffer):
         if torch.is_tensor(buffer):
@@ -294,6 +438,7 @@ class SummaryHook(TriggeredHook):
                     'time_per_replicate',
                     'time_per_parallel_apply',
                     'time_per_gather',
+                    'time_per_all_reduce',
             ]:
                 if k in timer_dict:
                     summary_timings[k.replace('_per_', '_rel_')] = \
@@ -305,11 +450,41 @@ class SummaryHook(TriggeredHook):
         timer.clear()
         return summary_timings
 
+    @staticmethod
+    def compute_resources(monitor: 'pt.trainer.ResourceMonitor'):
+        """
+        Aggregates the samples of the resource monitor of a summary interval:
+        The maximum of the peak values (`max_*`), the mean of the
+        `data_queue_depth` and for the other values the last value and the
+        growth since the last summary (`*_growth`). A growth that stays
+        positive over many summaries (e.g. `rss_growth` or
+        `python_allocated_blocks_growth`) indicates a memory leak.
+        """
+        summary_resources = {}
+        for key, values in monitor.as_dict.items():
+            name, sep, device = key.partition('/')
+            if 'max_' in name:
+                summary_resources[key] = values.max()
+            elif name == 'data_queue_depth':
+                summary_resources[key] = values.mean()
+            else:
+                summary_resources[key] = values[-1]
+                summary_resources[f'{name}_growth{sep}{device}'] = \
+                    values[-1] - monitor.baseline.get(key, values[0])
+        monitor.clear()
+        return summary_resources
+
     def finalize_summary(self, trainer):
         assert len(self.summary['timings']) == 0, self.summary['timings']
+        assert len(self.summary['resources']) == 0, self.summary['resources']
 
+        self._scalars_to_host_and_check(trainer)
         for key, timing in self.compute_timings(trainer.train_timer).items():
             self.summary['timings'][key] = timing
+        resource_monitor = getattr(trainer, 'resource_monitor', None)
+        if resource_monitor is not None:
+            self.summary['resources'].update(
+                self.compute_resources(resource_monitor))
         self.summary = trainer.model.modify_summary(self.summary)
         # Assert the intermediate types were converted in he modify summary
         assert len(self.summary['buffers']) == 0, "intermediate format buffers has to be converted during modify_summary"
@@ -320,6 +495,7 @@ class SummaryHook(TriggeredHook):
         prefix = self.summary_prefix
 
         time_prefix = f'{prefix}_timings'
+        resources_prefix = f'{prefix}_resources'
 
         tags = set()
 
@@ -345,6 +521,9 @@ class SummaryHook(TriggeredHook):
         for key, scalar in self.summary['timings'].items():
             tag = check_tag(f'{time_prefix}/{key}')
             trainer.writer.add_scalar(tag, scalar.mean(), iteration)
+        for key, scalar in self.summary['resources'].items():
+            tag = check_tag(f'{resources_prefix}/{key}')
+            trainer.writer.add_scalar(tag, float(scalar), iteration)
         for key, histogram in self.summary['histograms'].items():
             tag = check_tag(f'{prefix}/{key}')
             trainer.writer.add_histogram(tag, np.array(histogram), iteration)
@@ -497,6 +676,8 @@ class ValidationHook(SummaryHook):
         # This function replaces `trainer.train_timer` with
         # `trainer.validate_timer` from the super function.
         assert len(self.summary['timings']) == 0, self.summary['timings']
+        # Each rank validates a part of the data (see DistributedTrainer).
+        self._scalars_to_host_and_check(trainer, gather=True)
         for key, timing in self.compute_timings(trainer.validate_timer).items():
             self.summary['timings'][key] = timing
         try:
@@ -533,6 +714,8 @@ class ValidationHook(SummaryHook):
         # current best checkpoint.
         assert all([len(value) == 0 for value in self.summary.values()]), self.summary
         assert len(trainer.validate_timer.timings) == 0, trainer.validate_timer
+        # Stale checkpoints are deleted below, they must not be in flight.
+        trainer.wait_for_checkpoints()
         print('Starting Validation')
         at_least_one_value = False
 
@@ -544,7 +727,8 @@ class ValidationHook(SummaryHook):
             trainer.model.create_snapshot = False
             self.update_summary(review)
         trainer.model.create_snapshot = create_snapshot
-        if not at_least_one_value:
+        # In a distributed training a rank may get no validation examples.
+        if not at_least_one_value and getattr(trainer, 'world_size', 1) == 1:
             raise Exception(
                 f'Got an empty validation iterator: {self.iterator}'
             )
@@ -577,7 +761,8 @@ class ValidationHook(SummaryHook):
                 if ckpt_name == ckpt_path.name:
                     continue
                 ckpt = ckpt_dir / ckpt_name
-                if ckpt.exists():  # may not exist anymore after backoff
+                # may not exist anymore after backoff
+                if trainer.is_main_process and ckpt.exists():
                     ckpt.unlink()
                 self.ckpt_ranking.pop(i)
         if self.ckpt_ranking[0][0] != ckpt_path.name:
@@ -587,12 +772,15 @@ class ValidationHook(SummaryHook):
 
     def post_step(self, trainer: 'pt.Trainer', example, model_out, review):
         # Ignore super.
-        if trainer.iteration == self.last_validation:
+        if trainer.iteration == self.last_validation \
+                and trainer.is_main_process:
             # As CheckpointHook.pre_step is called after ValidationHook.pre_step
             # (which is necessary to save ValidationHook state),
             # a symlink to the latest checkpoint can not be set during ValidationHook.pre_step
             ckpt_dir = trainer.checkpoint_dir
             ckpt_path: Path = trainer.default_checkpoint_path()
+            # The CheckpointHook may write the checkpoint in the background.
+            trainer.wait_for_checkpoints()
             if not ckpt_path.exists():
                 raise RuntimeError(
                     'Before each validation the CheckpointHook has to write '
@@ -615,7 +803,8 @@ class ValidationHook(SummaryHook):
             ) from None
 
     def close(self, trainer: 'pt.Trainer'):
-        if trainer.checkpoint_dir.exists():
+        trainer.wait_for_checkpoints()
+        if trainer.is_main_process and trainer.checkpoint_dir.exists():
             # When checkpoint_dir does not exist, your training failed, before
             # the first validation started
             self.set_best_symlink(trainer.checkpoint_dir)
@@ -704,19 +893,27 @@ class BackOffValidationHook(ValidationHook):
         print(f'Back off to {best_ckpt}.')
 
         ckpt_dir = trainer.checkpoint_dir
-        latest_symlink_path = (ckpt_dir / f'ckpt_latest.pth').absolute()
-        if latest_symlink_path.is_symlink():  # CB: Change to assert?
-            latest_symlink_path.unlink()
-        latest_symlink_path.symlink_to(best_ckpt)
+        if trainer.is_main_process:
+            latest_symlink_path = (ckpt_dir / f'ckpt_latest.pth').absolute()
+            if latest_symlink_path.is_symlink():  # CB: Change to assert?
+                latest_symlink_path.unlink()
+            latest_symlink_path.symlink_to(best_ckpt)
 
         best_iter = int(best_ckpt[len('ckpt_'): -len('.pth')])
+        # In a distributed training only rank 0 deletes the files. The
+        # decision must not depend on the files, so that the ranking is the
+        # same on all ranks.
+        latest_ckpt = trainer.default_checkpoint_path().name
         for j in reversed(range(len(self.ckpt_ranking))):
             ckpt = self.ckpt_ranking[j][0]
             if int(ckpt[len('ckpt_'): -len('.pth')]) > best_iter:
+                if ckpt == latest_ckpt:
+                    # latest checkpoint does not exist because it is written after validation
+                    continue
                 ckpt_path = ckpt_dir / ckpt
-                if ckpt_path.exists():  # latest checkpoint does not exist because it is written after validation
+                if trainer.is_main_process and ckpt_path.exists():
                     ckpt_path.unlink()
-                    self.ckpt_ranking.pop(j)
+                self.ckpt_ranking.pop(j)
 
         remaining_back_offs = self.remaining_back_offs
         trainer.load_checkpoint()
@@ -1015,3 +1212,300 @@ class LRAnnealingHook(AnnealingHook):
         optimizer = self.get_optimizer(trainer)
         for param_group in optimizer.param_groups:
             param_group['lr'] = value
+
+
+class ProfilerHook(TriggeredHook):
+    """
+    Records a window of training steps with `torch.profiler`, when the
+    trigger fires, and writes the results to `storage_dir/profiler`:
+
+     - `trace_{iteration}.json`: chrome trace (chrome://tracing or
+       https://ui.perfetto.dev)
+     - `operators_{iteration}.txt`: the `top_k` operators by self time
+     - `modules_{iteration}.txt`: time and memory of the submodules
+
+    The forward of each submodule of the model up to `max_module_depth` is
+    annotated with a `record_function` (`module::<name>`), so the time and
+    the allocated memory of the operators are attributed to the named
+    submodules. The time per step and the allocated memory per step of the
+    submodules and the time per step are reported as scalars with the tag
+    prefix `profiler/` to tensorboard.
+
+    Examples:
+        >>> trainer = pt.Trainer(...)   # doctest: +SKIP
+        >>> trainer.register_hook(ProfilerHook(
+        ...     (1000, 'iteration'), num_steps=5))  # doctest: +SKIP
+
+    Note: The backward is executed by the autograd engine, hence it is not
+        attributed to the submodules. It is contained in the operator table
+        and in the trace.
+    """
+    module_prefix = 'module::'
+
+    def __init__(
+            self,
+            trigger=(1000, 'iteration'),
+            num_steps=5,
+            warmup_steps=1,
+            top_k=30,
+            max_module_depth=2,
+            record_shapes=False,
+            profile_memory=True,
+            with_stack=False,
+    ):
+        """
+
+        Args:
+            trigger: When the profiling starts (see `TriggeredHook`)
+            num_steps: Number of recorded steps after each trigger
+            warmup_steps: Number of steps after the trigger, that are not
+                recorded
+            top_k: Number of operators in the operator table
+            max_module_depth: Maximum depth of the annotated submodules, e.g.
+                1 for the direct children of the model. `None` annotates all
+                submodules.
+            record_shapes: See `torch.profiler.profile`
+            profile_memory: See `torch.profiler.profile`
+            with_stack: See `torch.profiler.profile`
+        """
+        super().__init__(trigger)
+        assert num_steps >= 1, num_steps
+        self.num_steps = num_steps
+        self.warmup_steps = warmup_steps
+        self.top_k = top_k
+        self.max_module_depth = max_module_depth
+        self.record_shapes = record_shapes
+        self.profile_memory = profile_memory
+        self.with_stack = with_stack
+
+        self._start_iteration = None
+        self._stop_iteration = None
+        self._profiler = None
+        self._handles = []
+
+    def pre_step(self, trainer: 'pt.Trainer'):
+        iteration = trainer.iteration
+        triggered = self.trigger(iteration=iteration, epoch=trainer.epoch)
+
+        if self._profiler is not None:
+            if iteration >= self._stop_iteration:
+                self._stop(trainer)
+            else:
+                self._profiler.step()
+        if triggered and self._profiler is None \
+                and self._start_iteration is None:
+            self._start_iteration = iteration + self.warmup_steps
+        if self._profiler is None and self._start_iteration is not None \
+                and iteration >= self._start_iteration:
+            self._start(trainer)
+
+    def close(self, trainer: 'pt.Trainer'):
+        if self._profiler is not None:
+            self._stop(trainer)
+
+    def _annotate_modules(self, model):
+        def pre_hook(module, inputs):
+            record = torch.autograd.profiler.record_function(
+                module._profiler_hook_name)
+            record.__enter__()
+            module._profiler_hook_records.append(record)
+
+        def post_hook(module, inputs, outputs):
+            if module._profiler_hook_records:
+                module._profiler_hook_records.pop().__exit__(None, None, None)
+
+        for name, module in model.named_modules():
+            depth = len(name.split('.'))
+            if name == '' or (
+                    self.max_module_depth is not None
+                    and depth > self.max_module_depth
+            ):
+                continue
+            module._profiler_hook_name = self.module_prefix + name
+            module._profiler_hook_records = []
+            self._handles.append((
+                module,
+                module.register_forward_pre_hook(pre_hook),
+                module.register_forward_hook(post_hook),
+            ))
+
+    def _remove_annotations(self):
+        for module, pre_handle, post_handle in self._handles:
+            pre_handle.remove()
+            post_handle.remove()
+            del module._profiler_hook_name
+            del module._profiler_hook_records
+        self._handles = []
+
+    def _start(self, trainer: 'pt.Trainer'):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._annotate_modules(trainer.model)
+        self._profiler = torch.profiler.profile(
+            activities=activities,
+            # With a schedule, the steps are recorded (ProfilerStep#i)
+            schedule=lambda step: torch.profiler.ProfilerAction.RECORD,
+            record_shapes=self.record_shapes,
+            profile_memory=self.profile_memory,
+            with_stack=self.with_stack,
+        )
+        self._profiler.start()
+        self._start_iteration = trainer.iteration
+        self._stop_iteration = trainer.iteration + self.num_steps
+
+    def _stop(self, trainer: 'pt.Trainer'):
+        profiler, self._profiler = self._profiler, None
+        profiler.stop()
+        self._remove_annotations()
+        start_iteration = self._start_iteration
+        num_steps = max(trainer.iteration - start_iteration, 1)
+        self._start_iteration = None
+        self._stop_iteration = None
+
+        events = profiler.key_averages()
+        modules = sorted(
+            [
+                event for event in events
+                if event.key.startswith(self.module_prefix)
+            ],
+            key=lambda event: event.cpu_time_total, reverse=True,
+        )
+        steps = [
+            event for event in events if event.key.startswith('ProfilerStep')
+        ]
+
+        def per_step(value):
+            return value / num_steps
+
+        # Scalars: time in ms and memory in MB per step
+        writer = trainer.writer
+        if steps:
+            writer.add_scalar(
+                'profiler/time_per_step',
+                per_step(sum(e.cpu_time_total for e in steps)) / 1e3,
+                start_iteration,
+            )
+        for event in modules:
+            name = event.key[len(self.module_prefix):]
+            writer.add_scalar(
+                f'profiler/time_per_step/{name}',
+                per_step(event.cpu_time_total) / 1e3, start_iteration,
+            )
+            if self.profile_memory:
+                writer.add_scalar(
+                    f'profiler/memory_per_step/{name}',
+                    per_step(event.cpu_memory_usage) / 2 ** 20,
+                    start_iteration,
+                )
+                if event.device_memory_usage:
+                    writer.add_scalar(
+                        f'profiler/device_memory_per_step/{name}',
+                        per_step(event.device_memory_usage) / 2 ** 20,
+                        start_iteration,
+                    )
+
+        if not trainer.is_main_process:
+            return
+        profiler_dir = trainer.storage_dir / 'profiler'
+        profiler_dir.mkdir(parents=True, exist_ok=True)
+        profiler.export_chrome_trace(
+            str(profiler_dir / f'trace_{start_iteration}.json'))
+        sort_by = 'self_cpu_time_total'
+        if torch.cuda.is_available():
+            sort_by = 'self_cuda_time_total'
+        (profiler_dir / f'operators_{start_iteration}.txt').write_text(
+            events.table(sort_by=sort_by, row_limit=self.top_k))
+        lines = [
+            f'Iterations {start_iteration} to '
+            f'{start_iteration + num_steps - 1} (per step)',
+            f'{"module":<50} {"time [ms]":>10} {"memory [MB]":>12}',
+        ]
+        for event in modules:
+            lines.append(
+                f'{event.key[len(self.module_prefix):]:<50} '
+                f'{per_step(event.cpu_time_total) / 1e3:10.3f} '
+                f'{per_step(event.cpu_memory_usage) / 2 ** 20:12.3f}'
+            )
+        (profiler_dir / f'modules_{start_iteration}.txt').write_text(
+            '\n'.join(lines) + '\n')
+
+
+class MemoryWatchdogHook(Hook):
+    """
+    Checks the memory usage, that the trainer samples after each iteration
+    (see `Trainer.monitor_resources` and `ResourceMonitor`), against a
+    budget. When a budget is exceeded, the hook either emits a warning
+    (`action='warn'`, once until the usage falls below the budget again) or
+    stops the training (`action='stop'`). Stopping saves the latest
+    checkpoint (see `CheckpointHook.close`), so the training can be resumed,
+    e.g., with a smaller batch size, instead of being killed by the OOM
+    killer.
+
+    Examples:
+        >>> trainer = pt.Trainer(...)   # doctest: +SKIP
+        >>> trainer.register_hook(MemoryWatchdogHook(
+        ...     max_rss=32 * 2**30, action='stop'))  # doctest: +SKIP
+    """
+    def __init__(
+            self,
+            max_rss=None,
+            max_device_memory=None,
+            action='warn',
+    ):
+        """
+
+        Args:
+            max_rss: Budget for the resident set size of the process in
+                bytes. Where the current RSS is not available (i.e. not on
+                Linux), the peak RSS is used.
+            max_device_memory: Budget for the peak allocated memory of an
+                iteration on each CUDA device in bytes.
+            action: 'warn' or 'stop'
+        """
+        if action not in ['warn', 'stop']:
+            raise ValueError(
+                f'action must be "warn" or "stop", got {action!r}.')
+        self.max_rss = max_rss
+        self.max_device_memory = max_device_memory
+        self.action = action
+        self._exceeded = set()
+
+    def get_exceeded(self, sample):
+        """Returns the values of `sample` that exceed the budget."""
+        exceeded = {}
+        if self.max_rss is not None:
+            key = 'rss' if 'rss' in sample else 'max_rss'
+            if sample.get(key, 0) > self.max_rss:
+                exceeded[key] = (sample[key], self.max_rss)
+        if self.max_device_memory is not None:
+            for key, value in sample.items():
+                if key.startswith('device_max_memory_allocated/') \
+                        and value > self.max_device_memory:
+                    exceeded[key] = (value, self.max_device_memory)
+        return exceeded
+
+    def pre_step(self, trainer: 'pt.Trainer'):
+        if not trainer.monitor_resources:
+            raise RuntimeError(
+                f'{self.__class__.__name__} requires '
+                f'a Trainer with monitor_resources=True.'
+            )
+        exceeded = self.get_exceeded(trainer.resource_monitor.last)
+        new = exceeded.keys() - self._exceeded
+        self._exceeded = set(exceeded.keys())
+        if len(exceeded) == 0:
+            return
+
+        message = (
+            f'The memory usage exceeds the budget before iteration '
+            f'{trainer.iteration}: ' + ', '.join([
+                f'{key}: {value / 2**30:.2f} GiB > {budget / 2**30:.2f} GiB'
+                for key, (value, budget) in exceeded.items()
+            ])
+        )
+        if self.action == 'stop':
+            print(f'{message}\nStop the training.')
+            raise StopTraining
+        elif len(new) > 0:
+            warnings.warn(message)
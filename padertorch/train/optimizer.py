@@ -1,8 +1,21 @@
+import inspect
+
 import torch
 from torch import optim
 
 
 class Optimizer:
+    """
+    Wrapper of a torch optimizer, that is created for the parameters with
+    `set_parameters`.
+
+    The gradients are processed with multi tensor (foreach) kernels and
+    without a host synchronization (see `clip_grad`). If the torch optimizer
+    supports the AMP scaling interface (e.g. `fused=True` for Adam and SGD,
+    which is opt-in), `step` skips the update on the device, when the
+    gradient is not finite, like the `torch.cuda.amp.GradScaler`. Other
+    optimizers skip the update after a host synchronization.
+    """
     optimizer_cls = None
     optimizer = None
     parameters = None
@@ -12,11 +25,32 @@ class Optimizer:
     ):
         self.gradient_clipping = gradient_clipping
         self.optimizer_kwargs = kwargs
+        self.param_group_grad_norms = None
+        # 1., if `clip_grad` found a non finite gradient, else 0. (on the
+        # device)
+        self.found_inf = None
 
     def set_parameters(self, parameters):
         self.parameters = tuple(parameters)
+        kwargs = self.optimizer_kwargs
+        if kwargs.get('fused', None) is False:
+            # The default of torch. Not passed, because older torch versions
+            # have no `fused` argument for all optimizers.
+            kwargs = {k: v for k, v in kwargs.items() if k != 'fused'}
+        elif 'fused' in kwargs and kwargs['fused'] is None:
+            # Use the fused implementation, if it supports the parameters
+            # (e.g. torch >= 2.4 for CPU parameters), else the default.
+            kwargs = {k: v for k, v in kwargs.items() if k != 'fused'}
+            if 'fused' in inspect.signature(self.optimizer_cls).parameters:
+                try:
+                    self.optimizer = self.optimizer_cls(
+                        self.parameters, fused=True, **kwargs
+                    )
+                    return
+                except (RuntimeError, ValueError):
+                    pass
         self.optimizer = self.optimizer_cls(
-            self.parameters, **self.optimizer_kwargs
+            self.parameters, **kwargs
         )
 
     def check_if_set(self):
@@ -26,21 +60,112 @@ class Optimizer:
 
     def zero_grad(self):
         self.check_if_set()
+        self.found_inf = None
         return self.optimizer.zero_grad()
 
     def step(self):
+        """
+        Does the update. When `clip_grad` found a non finite gradient, the
+        update is skipped. If all param groups use an implementation, that
+        supports the AMP scaling interface (e.g. fused Adam), this is done on
+        the device, else it requires a host synchronization.
+        """
         self.check_if_set()
-        return self.optimizer.step()
+        found_inf, self.found_inf = self.found_inf, None
+        if found_inf is None:
+            return self.optimizer.step()
+        if not self._supports_amp_scaling():
+            if found_inf.item():
+                return None
+            return self.optimizer.step()
+        # Same interface as used by torch.cuda.amp.GradScaler.step
+        self.optimizer.grad_scale = None
+        self.optimizer.found_inf = found_inf
+        try:
+            return self.optimizer.step()
+        finally:
+            del self.optimizer.grad_scale
+            del self.optimizer.found_inf
 
-    def clip_grad(self):
-        self.check_if_set()
-        # Todo: report clipped and unclipped
-        # Todo: allow clip=None but still report grad_norm
-        grad_clips = self.gradient_clipping
-        return torch.nn.utils.clip_grad_norm_(
-            self.parameters, grad_clips
+    def _supports_amp_scaling(self):
+        # The flag is set at construction time, while `fused` may be changed
+        # by `load_state_dict` (e.g. `fused=None` in an older checkpoint).
+        return getattr(
+            self.optimizer, '_step_supports_amp_scaling', False
+        ) and all(
+            param_group.get('fused') for param_group in
+            self.optimizer.param_groups
         )
 
+    def clip_grad(self, loss_scale=None):
+        """
+        Clips the gradients to a total norm of `gradient_clipping` (no
+        clipping, if it is `None`).
+
+        The norms are computed and the gradients are scaled with multi tensor
+        (foreach) kernels. All results stay on the device, i.e., there is no
+        host synchronization.
+
+        Args:
+            loss_scale: Optional scale of the loss (tensor, see `LossScaler`).
+                The gradients are unscaled together with the clipping.
+
+        Returns:
+            The total norm of the gradients before the clipping. The norms of
+            the param groups are stored in `param_group_grad_norms`.
+        """
+        self.check_if_set()
+        grads = []
+        param_group_grad_norms = []
+        device = None
+        for param_group in self.optimizer.param_groups:
+            group_grads = [
+                p.grad for p in param_group['params'] if p.grad is not None
+            ]
+            if len(group_grads) == 0:
+                param_group_grad_norms.append(None)
+                continue
+            if device is None:
+                device = group_grads[0].device
+            norms = torch._foreach_norm(group_grads)
+            param_group_grad_norms.append(torch.linalg.vector_norm(
+                torch.stack([norm.to(device) for norm in norms])
+            ))
+            grads.extend(group_grads)
+
+        if device is None:
+            # No gradients
+            device = torch.device('cpu')
+        param_group_grad_norms = [
+            torch.zeros((), device=device) if norm is None else norm
+            for norm in param_group_grad_norms
+        ]
+        grad_norm = torch.linalg.vector_norm(
+            torch.stack(param_group_grad_norms))
+        if loss_scale is not None:
+            inv_scale = 1. / loss_scale.to(device)
+            grad_norm = grad_norm * inv_scale
+            param_group_grad_norms = [
+                norm * inv_scale for norm in param_group_grad_norms]
+        self.param_group_grad_norms = param_group_grad_norms
+        self.found_inf = (~torch.isfinite(grad_norm)).float()
+
+        clip_coef = None
+        if self.gradient_clipping is not None:
+            # Same as torch.nn.utils.clip_grad_norm_
+            clip_coef = torch.clamp(
+                self.gradient_clipping / (grad_norm + 1e-6), max=1.
+            )
+        if loss_scale is not None:
+            clip_coef = inv_scale if clip_coef is None else clip_coef * inv_scale
+        if clip_coef is not None:
+            grads_per_device = {}
+            for grad in grads:
+                grads_per_device.setdefault(grad.device, []).append(grad)
+            for grad_device, device_grads in grads_per_device.items():
+                torch._foreach_mul_(device_grads, clip_coef.to(grad_device))
+        return grad_norm
+
     def to(self, device):
         if device is None:
             return
@@ -78,15 +203,26 @@ class Adam(Optimizer):
             betas=(0.9, 0.999),
             eps=1e-8,
             weight_decay=0,
-            amsgrad=False
+            amsgrad=False,
+            fused=False,
     ):
+        """
+        Args:
+            fused: If True, the fused implementation of torch is used. It
+                skips steps with a non finite gradient without a host
+                synchronization, but its numerics differ slightly from the
+                default implementation. If None, it is used, if torch
+                supports it for the parameters. The default False keeps the
+                default (foreach) implementation of torch.
+        """
         super().__init__(
             gradient_clipping,
             lr=lr,
             betas=betas,
             eps=eps,
             weight_decay=weight_decay,
-            amsgrad=amsgrad
+            amsgrad=amsgrad,
+            fused=fused,
         )
 
 
@@ -100,13 +236,91 @@ class SGD(Optimizer):
             momentum=0,
             dampening=0,
             weight_decay=0,
-            nesterov=False
+            nesterov=False,
+            fused=False,
     ):
+        """
+        Args:
+            fused: If True, the fused implementation of torch is used. It
+                skips steps with a non finite gradient without a host
+                synchronization, but its numerics differ slightly from the
+                default implementation. If None, it is used, if torch
+                supports it for the parameters. The default False keeps the
+                default (foreach) implementation of torch.
+        """
         super().__init__(
             gradient_clipping,
             lr=lr,
             momentum=momentum,
             dampening=dampening,
             weight_decay=weight_decay,
-            nesterov=nesterov
+            nesterov=nesterov,
+            fused=fused,
+        )
+
+
+class LossScaler:
+    """
+    Dynamic loss scaling for float16 mixed precision training (see the
+    `mixed_precision` argument of `pt.Trainer`), with the same update rule
+    as `torch.cuda.amp.GradScaler`: The scale is reduced by `backoff_factor`
+    after a step with a non finite gradient and increased by `growth_factor`
+    after `growth_interval` consecutive finite steps.
+
+    The unscaling of the gradients is done in `Optimizer.clip_grad` and the
+    scale is updated on the device, i.e., without host synchronization.
+
+    >>> scaler = LossScaler(init_scale=8., growth_interval=2)
+    >>> for found_inf in [0., 0., 1., 0.]:
+    ...     scaler.update(torch.tensor(found_inf))
+    ...     print(scaler.scale)
+    tensor(8.)
+    tensor(16.)
+    tensor(8.)
+    tensor(8.)
+    """
+    def __init__(
+            self,
+            init_scale=2. ** 16,
+            growth_factor=2.,
+            backoff_factor=.5,
+            growth_interval=2000,
+    ):
+        self.growth_factor = growth_factor
+        self.backoff_factor = backoff_factor
+        self.growth_interval = growth_interval
+        self.scale = torch.tensor(float(init_scale))
+        self.growth_tracker = torch.tensor(0)
+
+    def scale_loss(self, loss):
+        return loss * self.scale.to(loss.device)
+
+    def update(self, found_inf):
+        """
+        Args:
+            found_inf: 1., if the gradient was not finite, else 0.
+        """
+        found_inf = found_inf.to(self.scale.device) > 0
+        growth_tracker = torch.where(
+            found_inf, torch.zeros_like(self.growth_tracker),
+            self.growth_tracker + 1,
         )
+        grow = growth_tracker >= self.growth_interval
+        self.scale = torch.where(
+            found_inf, self.scale * self.backoff_factor,
+            torch.where(grow, self.scale * self.growth_factor, self.scale),
+        )
+        self.growth_tracker = torch.where(
+            grow, torch.zeros_like(growth_tracker), growth_tracker)
+
+    def to(self, device):
+        self.scale = self.scale.to(device)
+        self.growth_tracker = self.growth_tracker.to(device)
+
+    def state_dict(self):
+        return {'scale': self.scale, 'growth_tracker': self.growth_tracker}
+
+    def load_state_dict(self, state_dict):
+        self.scale = state_dict['scale'].to(self.scale.device)
+        self.growth_tracker = state_dict['growth_tracker'].to(
+            self.growth_tracker.device)
@@ -2,15 +2,21 @@
     This module contains the Trainer class which can be used to train
     configurable padertorch models.
 """
+import concurrent.futures
 import contextlib
+import copy
 import itertools
+import os
+import sys
 import time
+import tracemalloc
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
 import functools
 import collections
 
+import lazy_dataset
 import numpy as np
 import torch
 import torch.nn
@@ -20,12 +26,20 @@ import warnings
 from paderbox.utils.nested import deflatten
 import padertorch as pt
 from padertorch.configurable import Configurable
-from padertorch.train.optimizer import Optimizer, Adam
+from padertorch.ops.sequence.mask import mask_cache
+from padertorch.train.optimizer import Optimizer, Adam, LossScaler
 from padertorch.train.runtime_tests import test_run
 from padertorch.train.hooks import *
 
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
 __all__ = [
     'Trainer',
+    'DistributedTrainer',
     'InteractiveTrainer',
 ]
 
@@ -47,6 +61,12 @@ class Trainer(Configurable):
             checkpoint_trigger=(1, 'epoch'),
             stop_trigger=(1, 'epoch'),
             virtual_minibatch_size=1,
+            defer_scalar_sync=False,
+            mixed_precision=None,
+            monitor_resources=False,
+            async_checkpoint=False,
+            max_pending_checkpoints=1,
+            checkpoint_format='torch',
     ):
         """
 
@@ -85,7 +105,42 @@ class Trainer(Configurable):
                 Note: The gradients are accumulated and not averaged.
                 Note: The virtual_minibatch_size is fixed and can contain data
                     from two epochs.
-
+            defer_scalar_sync: If True, the loss and losses are reported as
+                detached tensors to the hooks and are only transferred to the
+                host (i.e. synchronized), when the SummaryHook writes a
+                summary. The check for a non finite loss and gradient is then
+                also delayed to the SummaryHook (see `clip_grad`), i.e. a
+                diverged training continues until the next summary (the
+                updates with a non finite gradient are skipped) and the error
+                state contains the scalars of the failing step instead of the
+                whole review. Hence, use it with a short `summary_trigger`.
+            mixed_precision: None, 'bfloat16' or 'float16'. If not None, the
+                forward and the review run in `torch.autocast` with this
+                dtype (on the CPU and on the GPU), while the parameters
+                (i.e. the master weights), the gradients and the optimizer
+                states stay in float32, hence the checkpoints are the same
+                as without mixed precision.
+                With 'float16', the loss is scaled dynamically (see
+                `pt.optimizer.LossScaler`) and the optimizer steps with
+                non finite gradients are skipped.
+            monitor_resources: If True, the memory usage (e.g. the peak RSS,
+                the allocated blocks of Python, the statistics of the CUDA
+                caching allocator and the number of prefetched examples) is
+                sampled after each iteration, see `ResourceMonitor`. The
+                SummaryHook reports it with the tag prefix
+                `training_resources` and the `MemoryWatchdogHook` checks it.
+            async_checkpoint: If True, `save_checkpoint` copies the state to
+                host memory and writes the checkpoint in a background thread
+                (see `wait_for_checkpoints`). The ckpt_latest.pth symlink is
+                updated after the write. The (pinned) host memory is reused
+                for the next checkpoints, once a write is finished.
+            max_pending_checkpoints: With `async_checkpoint`,
+                `save_checkpoint` blocks, when this number of writes is still
+                in flight.
+            checkpoint_format: The file format of the checkpoints: 'torch'
+                (`torch.save`) or 'mmap' (`padertorch.io.save_mmap_checkpoint`,
+                the tensors can be memory mapped and
+                `Module.load_checkpoint` only reads the tensors of the model).
 
         Usage:
 
@@ -127,11 +182,43 @@ class Trainer(Configurable):
         self.writer = None
         self.train_timer = ContextTimerDict()
         self.validate_timer = ContextTimerDict()
+        self.monitor_resources = monitor_resources
+        self.resource_monitor = ResourceMonitor()
         self.iteration = -1
         self.epoch = -1
 
         self.loss_weights = loss_weights
         self.virtual_minibatch_size = virtual_minibatch_size
+        self.defer_scalar_sync = defer_scalar_sync
+
+        if mixed_precision not in [None, 'bfloat16', 'float16']:
+            raise ValueError(
+                f'mixed_precision must be None, "bfloat16" or "float16", '
+                f'got {mixed_precision!r}.'
+            )
+        self.mixed_precision = mixed_precision
+        if mixed_precision == 'float16':
+            self.loss_scaler = LossScaler()
+        else:
+            self.loss_scaler = None
+
+        if max_pending_checkpoints < 1:
+            raise ValueError(
+                f'max_pending_checkpoints must be at least 1, '
+                f'got {max_pending_checkpoints!r}.'
+            )
+        self.async_checkpoint = async_checkpoint
+        self.max_pending_checkpoints = max_pending_checkpoints
+        self._checkpoint_executor = None
+        self._pending_checkpoints = collections.deque()
+        self._host_buffers = collections.deque()
+
+        if checkpoint_format not in ['torch', 'mmap']:
+            raise ValueError(
+                f'checkpoint_format must be "torch" or "mmap", '
+                f'got {checkpoint_format!r}.'
+            )
+        self.checkpoint_format = checkpoint_format
 
         self.hooks = [
             SummaryHook(summary_trigger),
@@ -286,6 +373,7 @@ class Trainer(Configurable):
         self.optimizer_zero_grad()
 
         self.writer = self.writer_cls(str(self.storage_dir))
+        self.resource_monitor.set_dataset(train_dataset)
         hooks = [*self.hooks]
         if progress_bar:
             try:
@@ -376,7 +464,7 @@ class Trainer(Configurable):
                             del review
 
                             with self.train_timer['time_per_backward']:
-                                loss.backward(retain_graph=False)
+                                self.backward(loss)
                             del loss
 
                         else:
@@ -424,7 +512,7 @@ class Trainer(Configurable):
                             del review
 
                             with self.train_timer['time_per_backward']:
-                                loss.backward(retain_graph=False)
+                                self.backward(loss)
                             del loss
 
                     # Only the summary hook will use optimizer_review
@@ -437,16 +525,26 @@ class Trainer(Configurable):
 
                         self.iteration += 1
 
+                        if self.monitor_resources:
+                            with timer.pause():
+                                self.resource_monitor.sample(device)
+
         except StopTraining:
             pass
         finally:
             try:
                 for hook in hooks:
                     hook.close(self)
+                self.wait_for_checkpoints()
             except Exception:
                 print('Exception in finally. May hide actual exception!!!\n'
                       'You may comment this finally block for debugging.')
                 raise
+            finally:
+                if self._checkpoint_executor is not None:
+                    self._checkpoint_executor.shutdown(wait=True)
+                    self._checkpoint_executor = None
+                self._host_buffers.clear()
             self.writer.close()
             self.writer = None
 
@@ -495,6 +593,11 @@ class Trainer(Configurable):
         else:
             self.optimizer.zero_grad()
 
+    def backward(self, loss):
+        if self.loss_scaler is not None:
+            loss = self.loss_scaler.scale_loss(loss)
+        loss.backward(retain_graph=False)
+
     def optimizer_step(self):
         summary = self.clip_grad({})
 
@@ -509,10 +612,20 @@ class Trainer(Configurable):
 
         # Do the actual optimization
         if isinstance(self.optimizer, dict):
-            for opti in self.optimizer.values():
-                opti.step()
+            optimizers = list(self.optimizer.values())
         else:
-            self.optimizer.step()
+            optimizers = [self.optimizer]
+        if self.loss_scaler is not None:
+            found_inf = torch.stack([
+                opti.found_inf.to(self.loss_scaler.scale.device)
+                for opti in optimizers
+            ]).max()
+            summary['scalars']['loss_scale'] = \
+                self._scalar_to_summary(self.loss_scaler.scale)
+        for opti in optimizers:
+            opti.step()
+        if self.loss_scaler is not None:
+            self.loss_scaler.update(found_inf)
 
         self.optimizer_zero_grad()
         return summary
@@ -528,12 +641,33 @@ class Trainer(Configurable):
         # TODO: Backup OutOfMemory
         with timer['time_per_to_device']:
             example = model.example_to_device(example, device)
-        with timer['time_per_forward']:
-            model_out = model(example)
-        with timer['time_per_review']:
-            review = model.review(example, model_out)
-            loss, summary = self._review_to_loss_and_summary(review)
-            return loss, example, model_out, summary
+        # The padding masks of the sequence lengths are computed once for the
+        # forward step and the review and shared between the layers.
+        with mask_cache(), self._autocast(device):
+            with timer['time_per_forward']:
+                model_out = model(example)
+            with timer['time_per_review']:
+                review = model.review(example, model_out)
+                loss, summary = self._review_to_loss_and_summary(review)
+        if self.mixed_precision is not None:
+            loss = loss.float()
+        return loss, example, model_out, summary
+
+    def _autocast(self, device):
+        """
+        Returns the autocast context for the forward and the review, see the
+        `mixed_precision` argument.
+        """
+        if self.mixed_precision is None:
+            return contextlib.nullcontext()
+        if isinstance(device, int):
+            device_type = 'cuda'
+        elif device is None:
+            device_type = 'cpu'
+        else:
+            device_type = torch.device(device).type
+        return torch.autocast(
+            device_type, dtype=getattr(torch, self.mixed_precision))
 
     def _review_to_loss_and_summary(self, review):
         """
@@ -580,7 +714,7 @@ class Trainer(Configurable):
                 weight = loss_weights[key] if loss_weights is not None else 1.
                 if weight != 0:
                     loss = loss + (weight * value)
-                review['scalars'][key] = value.item()
+                review['scalars'][key] = self._scalar_to_summary(value)
                 review['scalars'][f'{key}_loss_weight'] = weight
             del review['losses']
             # review['loss'] = loss
@@ -588,11 +722,15 @@ class Trainer(Configurable):
             assert 'loss' in review, review
             loss = review.pop('loss')
 
-        review['scalars']['loss'] = loss.item()
+        review['scalars']['loss'] = self._scalar_to_summary(loss)
 
         assert loss.dim() == 0, loss
 
-        if not torch.isfinite(loss):
+        if self.defer_scalar_sync:
+            # The finite check is done by the SummaryHook, when the scalars
+            # are transferred to the host (see SummaryHook.finalize_summary).
+            pass
+        elif not torch.isfinite(loss):
             # Write each interesting object to an individual file, because
             # not each object is serializable with `torch.save`.
             log_path_pattern = self.log_error_state({
@@ -608,6 +746,19 @@ class Trainer(Configurable):
 
         return loss, review
 
+    def _scalar_to_summary(self, value):
+        """
+        Converts a scalar tensor from the review to a value for the summary.
+
+        With `defer_scalar_sync` the value stays a (detached) tensor on the
+        device and the SummaryHook transfers all values of a summary interval
+        at once, otherwise `.item()` blocks until the device is idle.
+        """
+        if self.defer_scalar_sync:
+            return value.detach()
+        else:
+            return value.item()
+
     def log_error_state(self, data_dict, folder='log'):
         """
 
@@ -702,8 +853,15 @@ class Trainer(Configurable):
         ))
 
     def clip_grad(self, summary: dict):
+        """
+        Clips the gradients and adds the gradient norms to the summary.
+
+        With `defer_scalar_sync`, the norms stay on the device and the check
+        for a non finite gradient is delayed to the SummaryHook. The update
+        with a non finite gradient is skipped (see `Optimizer.step`), so the
+        parameters remain finite until the error is raised.
+        """
         # TODO: report clipped and unclipped
-        # TODO: allow clip=None but still report grad_norm
 
         summary.setdefault('scalars', {})
         summary.setdefault('histograms', {})
@@ -724,25 +882,48 @@ class Trainer(Configurable):
                     f"{log_path_pattern}."
                 )
 
-        if isinstance(self.optimizer, dict):
-            for key, opti in self.optimizer.items():
-                grad_norm = opti.clip_grad()
+        loss_scale = None
+        if self.loss_scaler is not None:
+            loss_scale = self.loss_scaler.scale
+
+        def add_grad_norm(prefix, opti):
+            grad_norm = opti.clip_grad(loss_scale=loss_scale)
+            # With loss scaling, non finite gradients are expected and the
+            # optimizer skips these steps.
+            if not self.defer_scalar_sync and loss_scale is None:
                 check(grad_norm)
+            summary['scalars'][f'{prefix}grad_norm'] = \
+                self._scalar_to_summary(grad_norm)
+            if len(opti.param_group_grad_norms) > 1:
+                for i, norm in enumerate(opti.param_group_grad_norms):
+                    summary['scalars'][
+                        f'{prefix}grad_norm/param_group_{i}'
+                    ] = self._scalar_to_summary(norm)
+            # underscore was necessary to obtain unique keys to prevent
+            # tensorboard error
+            if self.defer_scalar_sync:
+                summary['histograms'][f'{prefix}grad_norm_'] = \
+                    grad_norm.detach().reshape(1)
+            else:
+                summary['histograms'][f'{prefix}grad_norm_'] = \
+                    torch.Tensor([grad_norm])
 
-                summary['scalars'][f'{key}_grad_norm'] = grad_norm
-                # underscore was necessary to obtain unique keys to prevent
-                # tensorboard error
-                summary['histograms'][
-                    f'{key}_grad_norm_'] = torch.Tensor([grad_norm])
+        if isinstance(self.optimizer, dict):
+            for key, opti in self.optimizer.items():
+                add_grad_norm(f'{key}_', opti)
         else:
-            grad_norm = self.optimizer.clip_grad()
-            check(grad_norm)
-            summary['scalars'][f'grad_norm'] = grad_norm
-            summary['histograms'][f'grad_norm_'] = \
-                torch.Tensor([grad_norm])
+            add_grad_norm('', self.optimizer)
 
         return summary
 
+    @property
+    def is_main_process(self):
+        """
+        Whether this process writes the summaries and the checkpoints, see
+        `DistributedTrainer`.
+        """
+        return True
+
     @property
     def checkpoint_dir(self):
         return self.storage_dir / 'checkpoints'
@@ -765,6 +946,8 @@ class Trainer(Configurable):
                 optimizer=optimizer_state_dict,
                 hooks=dict(),
         )
+        if self.loss_scaler is not None:
+            state_dict['loss_scaler'] = self.loss_scaler.state_dict()
         for hook in self.hooks:
             if hook is not self.model:
                 hook_state = hook.state_dict()
@@ -777,10 +960,58 @@ class Trainer(Configurable):
         if checkpoint_path is None:
             checkpoint_path = self.default_checkpoint_path()
 
-        torch.save(
-            self.state_dict(),
-            str(checkpoint_path)
-        )
+        if self.async_checkpoint:
+            while len(self._pending_checkpoints) >= \
+                    self.max_pending_checkpoints:
+                self._pending_checkpoints.popleft().result()
+            # Reuse the (pinned) host memory of a finished write. Allocating
+            # pinned memory is expensive and synchronizes the GPU.
+            if len(self._host_buffers) > 0:
+                buffers = self._host_buffers.pop()
+            else:
+                buffers = {}
+            state_dict, copied = _state_to_host(self.state_dict(), buffers)
+            if self._checkpoint_executor is None:
+                self._checkpoint_executor = \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            iteration, checkpoint_format = self.iteration, self.checkpoint_format
+
+            def write():
+                try:
+                    self._write_checkpoint(
+                        state_dict, checkpoint_path, iteration,
+                        checkpoint_format, copied
+                    )
+                finally:
+                    self._host_buffers.append(buffers)
+
+            self._pending_checkpoints.append(
+                self._checkpoint_executor.submit(write))
+        else:
+            self._write_checkpoint(
+                self.state_dict(), checkpoint_path, self.iteration,
+                self.checkpoint_format)
+
+    @staticmethod
+    def _write_checkpoint(
+            state_dict, checkpoint_path, iteration, checkpoint_format,
+            copied=None,
+    ):
+        import paderbox as pb
+
+        if copied is not None:
+            # Wait for the non blocking copies to the host.
+            copied.synchronize()
+
+        # Write to a temporary file and rename it, so the checkpoint is
+        # either complete or does not exist.
+        with pb.io.atomic.open_atomic(checkpoint_path, 'wb') as fd:
+            if checkpoint_format == 'torch':
+                torch.save(state_dict, fd)
+            elif checkpoint_format == 'mmap':
+                pt.io.save_mmap_checkpoint(state_dict, fd)
+            else:
+                raise ValueError(checkpoint_format)
 
         # Create relative symlink to latest checkpoint
         latest_symlink_path = (checkpoint_path.parent / f'ckpt_latest.pth').absolute()
@@ -789,7 +1020,15 @@ class Trainer(Configurable):
         latest_symlink_path.symlink_to(checkpoint_path.name)
 
         print(f"{datetime.now()}: Saved model and optimizer state "
-              f"at iteration {self.iteration} to {checkpoint_path}")
+              f"at iteration {iteration} to {checkpoint_path}")
+
+    def wait_for_checkpoints(self):
+        """
+        Blocks until all checkpoints are written (see `async_checkpoint`) and
+        raises the exception, if a write failed.
+        """
+        while len(self._pending_checkpoints) > 0:
+            self._pending_checkpoints.popleft().result()
 
     def load_state_dict(self, state_dict):
         self.model.load_state_dict(state_dict['model'])
@@ -805,6 +1044,8 @@ class Trainer(Configurable):
 
         self.iteration = state_dict['iteration']
         self.epoch = state_dict['epoch']
+        if self.loss_scaler is not None and 'loss_scaler' in state_dict:
+            self.loss_scaler.load_state_dict(state_dict['loss_scaler'])
 
         if 'hooks' in state_dict:
             hook_states = state_dict['hooks']
@@ -821,12 +1062,17 @@ class Trainer(Configurable):
             )
 
     def load_checkpoint(self, map_location='cpu'):
+        self.wait_for_checkpoints()
         checkpoint_path = self.checkpoint_dir / 'ckpt_latest.pth'
         assert checkpoint_path.is_file(), checkpoint_path
 
-        checkpoint_dict = torch.load(
-            str(checkpoint_path), map_location=map_location
-        )
+        if pt.io.is_mmap_checkpoint(checkpoint_path):
+            checkpoint_dict = pt.io.load_mmap_checkpoint(
+                checkpoint_path, map_location=map_location)
+        else:
+            checkpoint_dict = torch.load(
+                str(checkpoint_path), map_location=map_location
+            )
 
         self.load_state_dict(checkpoint_dict)
 
@@ -853,6 +1099,8 @@ class Trainer(Configurable):
                 self.optimizer[key].to(device)
         else:
             self.optimizer.to(device)
+        if self.loss_scaler is not None:
+            self.loss_scaler.to(device)
         self.device = device
 
     def cpu(self):
@@ -888,6 +1136,471 @@ class MultiDeviceTrainer(Trainer):
         pass
 
 
+class DistributedTrainer(Trainer):
+    """
+    Data parallel training with `torch.distributed`, one process per rank.
+
+    Each process trains on every `world_size`-th example of the
+    `train_dataset`, starting at its rank. Indexable datasets (also lazy
+    datasets with a prefetch or reshuffle stage) are sharded before the
+    examples are loaded, so each rank only loads and preprocesses its own
+    examples. Other iterables are iterated on all ranks and each rank skips
+    the examples of the other ranks, so they have to yield the examples in
+    the same order on all ranks (e.g. use the same seed for shuffling).
+    The gradients are summed over all ranks (as in the multi
+    device training of `Trainer.train`) with one `all_reduce` per bucket of
+    `bucket_cap_mb` megabytes, before the gradients are clipped and the
+    optimizer does its step.
+
+    Only rank 0 writes summaries and checkpoints. The validation data is
+    sharded in the same way as the training data and the scalars of the
+    validation summary are gathered from all ranks.
+    When a rank fails (e.g. an exception in the forward or a non finite
+    loss), the other ranks are notified in the next collective operation
+    (see `any_rank_failed` and `all_reduce_gradients`) and raise as well,
+    instead of waiting for the failed rank.
+    The checkpoints include the random number generator states of all
+    ranks, so a resumed training continues deterministically.
+
+    The default backend is gloo, which works on CPU-only nodes. The process
+    group is initialized from the environment variables (MASTER_ADDR,
+    MASTER_PORT, RANK, WORLD_SIZE), e.g. set by `torchrun`, unless it is
+    already initialized.
+
+    Usage:
+
+        $ torchrun --nproc_per_node=8 train.py
+
+        # train.py
+        trainer = DistributedTrainer(...)  # or: .from_config(...)
+        trainer.register_validation_hook(val_ds)
+        trainer.train(tr_ds, device='cpu')
+    """
+    def __init__(
+            self,
+            model: 'pt.Model',
+            storage_dir,
+            optimizer,
+            loss_weights=None,
+            summary_trigger=(1, 'epoch'),
+            checkpoint_trigger=(1, 'epoch'),
+            stop_trigger=(1, 'epoch'),
+            virtual_minibatch_size=1,
+            defer_scalar_sync=False,
+            mixed_precision=None,
+            monitor_resources=False,
+            async_checkpoint=False,
+            max_pending_checkpoints=1,
+            checkpoint_format='torch',
+            rank=None,
+            world_size=None,
+            backend='gloo',
+            bucket_cap_mb=25,
+    ):
+        """
+        See `Trainer.__init__` for the remaining arguments.
+
+        Args:
+            rank: The rank of this process. If None, it is obtained from the
+                process group, e.g. from the environment variable `RANK`
+                (see `torch.distributed.init_process_group`).
+            world_size: The number of processes. If None, it is obtained from
+                the process group, e.g. from `WORLD_SIZE`.
+            backend: The backend of `torch.distributed.init_process_group`
+            bucket_cap_mb: Maximum size of the gradients (in megabytes) that
+                are reduced with one `all_reduce` call
+        """
+        super().__init__(
+            model=model,
+            storage_dir=storage_dir,
+            optimizer=optimizer,
+            loss_weights=loss_weights,
+            summary_trigger=summary_trigger,
+            checkpoint_trigger=checkpoint_trigger,
+            stop_trigger=stop_trigger,
+            virtual_minibatch_size=virtual_minibatch_size,
+            defer_scalar_sync=defer_scalar_sync,
+            mixed_precision=mixed_precision,
+            monitor_resources=monitor_resources,
+            async_checkpoint=async_checkpoint,
+            max_pending_checkpoints=max_pending_checkpoints,
+            checkpoint_format=checkpoint_format,
+        )
+        self._rank = rank
+        self._world_size = world_size
+        self.backend = backend
+        self.bucket_cap_mb = bucket_cap_mb
+        self._rng_states = None
+
+    @property
+    def rank(self):
+        if self._rank is None:
+            return torch.distributed.get_rank()
+        return self._rank
+
+    @property
+    def world_size(self):
+        if self._world_size is None:
+            return torch.distributed.get_world_size()
+        return self._world_size
+
+    @property
+    def is_main_process(self):
+        return self.rank == 0
+
+    def init_process_group(self):
+        if not torch.distributed.is_initialized():
+            torch.distributed.init_process_group(
+                backend=self.backend,
+                rank=-1 if self._rank is None else self._rank,
+                world_size=-1 if self._world_size is None
+                else self._world_size,
+            )
+        assert self.rank == torch.distributed.get_rank(), (
+            self.rank, torch.distributed.get_rank())
+        assert self.world_size == torch.distributed.get_world_size(), (
+            self.world_size, torch.distributed.get_world_size())
+
+    def train(self, train_dataset, *, progress_bar=True, resume=False,
+              device='cpu'):
+        """
+        See `Trainer.train`. Multiple devices per process are not supported,
+        start one process per device instead. The progress bar is only shown
+        on rank 0.
+        """
+        assert not isinstance(device, (tuple, list)), device
+        self.init_process_group()
+        if not self.is_main_process:
+            self.writer_cls = _NullWriter
+        super().train(
+            _DistributedIterable(train_dataset, self.rank, self.world_size),
+            progress_bar=progress_bar and self.is_main_process,
+            resume=resume,
+            device=device,
+        )
+
+    def validate(self, validation_iterator):
+        shard = _shard_dataset(validation_iterator, self.rank, self.world_size)
+        if shard is None:
+            shard = itertools.islice(
+                validation_iterator, self.rank, None, self.world_size)
+        try:
+            yield from super().validate(shard)
+        except Exception:
+            # The other ranks wait in the all_gather of the validation
+            # summary, see SummaryHook._scalars_to_host_and_check.
+            self.any_rank_failed(True)
+            raise
+
+    def train_step(self, model, example, device):
+        try:
+            return super().train_step(model, example, device)
+        except Exception:
+            # The other ranks wait in the all_reduce of the gradients.
+            self.all_reduce_gradients(failed=True)
+            raise
+
+    def backward(self, loss):
+        try:
+            return super().backward(loss)
+        except Exception:
+            self.all_reduce_gradients(failed=True)
+            raise
+
+    def _failure_flag(self, failed):
+        if torch.distributed.get_backend() == 'nccl':
+            device = torch.cuda.current_device()
+        else:
+            device = 'cpu'
+        return torch.tensor([float(failed)], device=device)
+
+    def any_rank_failed(self, failed):
+        """
+        Returns True, if `failed` is True on any rank. Has to be called by all
+        ranks at the same point, e.g. before a rank raises an exception, so
+        that the other ranks can raise instead of waiting for it.
+        """
+        flag = self._failure_flag(failed)
+        torch.distributed.all_reduce(flag)
+        return flag.item() > 0
+
+    def all_gather_scalars(self, scalars: dict):
+        """
+        Concatenates the lists of host scalars of all ranks in the order of the
+        ranks.
+        """
+        gathered = [None] * self.world_size
+        torch.distributed.all_gather_object(gathered, dict(scalars))
+        out = {}
+        for rank_scalars in gathered:
+            for key, values in rank_scalars.items():
+                out.setdefault(key, []).extend(values)
+        return out
+
+    def all_reduce_gradients(self, failed=False):
+        """
+        Sums the gradients of all ranks.
+
+        The gradients are flattened into buckets of at most `bucket_cap_mb`
+        megabytes and the `all_reduce` of all buckets is started before
+        waiting for the first one. A missing gradient is reduced as zeros, so
+        that all ranks have the same buckets.
+
+        Args:
+            failed: Whether this rank failed in the current step. The flag is
+                reduced together with the gradients.
+
+        Returns:
+            True, if any rank failed in the current step.
+        """
+        parameters = [
+            p for p in self.model.parameters() if p.requires_grad]
+        for p in parameters:
+            if p.grad is None:
+                p.grad = torch.zeros_like(p)
+
+        bucket_cap = self.bucket_cap_mb * 1024 ** 2
+        buckets = []
+        for p in parameters:
+            grad = p.grad
+            if (
+                    len(buckets) == 0
+                    or buckets[-1][-1].dtype != grad.dtype
+                    or buckets[-1][-1].device != grad.device
+                    or sum(g.numel() * g.element_size()
+                           for g in buckets[-1]) >= bucket_cap
+            ):
+                buckets.append([])
+            buckets[-1].append(grad)
+
+        flag = self._failure_flag(failed)
+        flag_handle = torch.distributed.all_reduce(flag, async_op=True)
+        handles = []
+        for grads in buckets:
+            flat = torch._utils._flatten_dense_tensors(grads)
+            handles.append((flat, grads, torch.distributed.all_reduce(
+                flat, async_op=True)))
+        for flat, grads, handle in handles:
+            handle.wait()
+            for grad, reduced in zip(
+                    grads, torch._utils._unflatten_dense_tensors(flat, grads)):
+                grad.copy_(reduced)
+        flag_handle.wait()
+        return flag.item() > 0
+
+    def optimizer_step(self):
+        with self.train_timer['time_per_all_reduce']:
+            failed = self.all_reduce_gradients()
+        if failed:
+            raise RuntimeError(
+                f'Another rank failed in iteration {self.iteration}.')
+        return super().optimizer_step()
+
+    def to(self, device):
+        """
+        Moves the model and the optimizer to the device and copies the model
+        state of rank 0 to all ranks.
+        """
+        super().to(device)
+        for tensor in itertools.chain(
+                self.model.parameters(), self.model.buffers()):
+            torch.distributed.broadcast(tensor.data, src=0)
+        # Also prevents that rank 0 creates the checkpoint directory, before
+        # all ranks checked that it does not exist (see Trainer.train).
+        torch.distributed.barrier()
+
+    def state_dict(self):
+        state_dict = super().state_dict()
+        if self._rng_states is not None:
+            state_dict['rng_states'] = self._rng_states
+        return state_dict
+
+    def save_checkpoint(self, checkpoint_path=None):
+        self._rng_states = [None] * self.world_size
+        torch.distributed.all_gather_object(
+            self._rng_states, torch.get_rng_state())
+        try:
+            if self.is_main_process:
+                super().save_checkpoint(checkpoint_path)
+        finally:
+            self._rng_states = None
+        # Keep the ranks in step. Note: With async_checkpoint the file may
+        # not yet exist, see load_checkpoint.
+        torch.distributed.barrier()
+
+    def load_state_dict(self, state_dict):
+        rng_states = state_dict.pop('rng_states', None)
+        super().load_state_dict(state_dict)
+        if rng_states is not None and len(rng_states) == self.world_size:
+            torch.set_rng_state(rng_states[self.rank])
+
+    def load_checkpoint(self, map_location='cpu'):
+        # Wait until rank 0 has written the checkpoint and updated the
+        # ckpt_latest.pth symlink (e.g. for a back off).
+        self.init_process_group()
+        self.wait_for_checkpoints()
+        torch.distributed.barrier()
+        super().load_checkpoint(map_location=map_location)
+
+
+def _state_to_host(state, buffers=None):
+    """
+    Copies all tensors in the nested `state` to (pinned) host memory and all
+    other leaves with `copy.deepcopy`, so that the training can continue,
+    while the copy is written.
+
+    Args:
+        state: Nested state, e.g. `Trainer.state_dict()`
+        buffers: Dict with the host tensors of a previous call, that are
+            reused, if the shape and dtype match. New host tensors are added
+            to it. The caller has to ensure, that the previous copy is no
+            longer used.
+
+    Returns:
+        The copy and a `torch.cuda.Event` to wait for the non blocking copies
+        from the GPU (`None`, if there is no tensor on a GPU).
+
+    >>> buffers = {}
+    >>> host, _ = _state_to_host({'a': torch.ones(2), 'b': [3]}, buffers)
+    >>> host
+    {'a': tensor([1., 1.]), 'b': [3]}
+    >>> host2, _ = _state_to_host({'a': torch.zeros(2), 'b': [4]}, buffers)
+    >>> host2['a'] is host['a'], host
+    (True, {'a': tensor([0., 0.]), 'b': [3]})
+    """
+    copied = None
+    if buffers is None:
+        buffers = {}
+
+    def to_host(obj, path):
+        nonlocal copied
+        if torch.is_tensor(obj):
+            obj = obj.detach()
+            host = buffers.get(path)
+            if host is None or host.shape != obj.shape \
+                    or host.dtype != obj.dtype:
+                host = torch.empty(
+                    obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+                buffers[path] = host
+            host.copy_(obj, non_blocking=obj.is_cuda)
+            if obj.is_cuda:
+                copied = True
+            return host
+        elif isinstance(obj, dict):
+            out = {k: to_host(v, (*path, k)) for k, v in obj.items()}
+            if type(obj) is not dict:
+                try:
+                    out = type(obj)(out)
+                except TypeError:
+                    pass
+            return out
+        elif isinstance(obj, (tuple, list)) and not hasattr(obj, '_fields'):
+            return type(obj)(to_host(v, (*path, i)) for i, v in enumerate(obj))
+        else:
+            return copy.deepcopy(obj)
+
+    state = to_host(state, ())
+    if copied:
+        copied = torch.cuda.Event()
+        copied.record()
+    return state, copied
+
+
+def _shard_dataset(dataset, rank, world_size):
+    """
+    Returns every `world_size`-th example of `dataset`, starting at `rank`,
+    without loading the examples of the other ranks.
+
+    An indexable dataset is sliced. Of a lazy dataset with stages that are
+    not indexable (e.g. prefetch, reshuffle or filter), the deepest indexable
+    input dataset is sliced and the stages are applied on top of the slice,
+    i.e. the examples are sharded before they are loaded and batched.
+
+    Returns `None`, if the dataset cannot be sharded (e.g. an iterable
+    without a length).
+
+    >>> import lazy_dataset
+    >>> ds = lazy_dataset.new(list(range(10)))
+    >>> list(_shard_dataset(ds, 1, 3))
+    [1, 4, 7]
+    >>> ds = ds.shuffle(reshuffle=True).map(lambda x: 10 * x).batch(2)
+    >>> sorted(sum(_shard_dataset(ds, 1, 3), []))
+    [10, 40, 70]
+    >>> print(_shard_dataset(iter(range(10)), 1, 3))
+    None
+    """
+    if getattr(dataset, 'indexable', False):
+        return dataset[rank::world_size]
+    input_dataset = getattr(dataset, 'input_dataset', None)
+    if not isinstance(dataset, lazy_dataset.Dataset) or input_dataset is None:
+        return None
+    input_dataset = _shard_dataset(input_dataset, rank, world_size)
+    if input_dataset is None:
+        return None
+    if isinstance(dataset, lazy_dataset.core.ReShuffleDataset):
+        # The permutation depends on the length of the input dataset
+        return type(dataset)(input_dataset, rng=dataset.rng)
+    dataset = copy.copy(dataset)
+    dataset.input_dataset = input_dataset
+    return dataset
+
+
+class _DistributedIterable:
+    """
+    Yields every `world_size`-th example of `iterable`, starting at `rank`.
+    If possible, the iterable is sharded before the examples are loaded (see
+    `_shard_dataset`), otherwise each rank iterates over all examples and
+    skips the examples of the other ranks.
+
+    The iteration stops on all ranks, when one rank has no example left,
+    so that all ranks do the same number of steps and the `all_reduce` of
+    the gradients does not hang.
+    """
+    def __init__(self, iterable, rank, world_size):
+        shard = _shard_dataset(iterable, rank, world_size)
+        # Named like in lazy_dataset, so that ResourceMonitor.set_dataset
+        # finds the prefetch buffers of the pipeline.
+        self.input_dataset = iterable if shard is None else shard
+        self.sharded = shard is not None
+        self.rank = rank
+        self.world_size = world_size
+        self._iterable = iterable
+
+    def __len__(self):
+        return len(self._iterable) // self.world_size
+
+    def __iter__(self):
+        if self.sharded:
+            iterator = iter(self.input_dataset)
+        else:
+            iterator = itertools.islice(
+                self.input_dataset, self.rank, None, self.world_size)
+        end = object()
+        has_next = torch.ones(1, dtype=torch.int32)
+        while True:
+            example = next(iterator, end)
+            has_next.fill_(example is not end)
+            torch.distributed.all_reduce(
+                has_next, op=torch.distributed.ReduceOp.MIN)
+            if not has_next.item():
+                return
+            yield example
+
+
+class _NullWriter:
+    """
+    Drops all summaries. Used by the `DistributedTrainer` on all ranks except
+    rank 0.
+    """
+    def __init__(self, logdir=None):
+        pass
+
+    def __getattr__(self, item):
+        if item.startswith('add_') or item in ('flush', 'close'):
+            return lambda *args, **kwargs: None
+        raise AttributeError(item)
+
+
 class ContextTimerDict:
     """
     To be able to keep the measurements, we need to create the object before.
@@ -992,6 +1705,131 @@ class ContextTimerDict:
             pass
 
 
+class ResourceMonitor:
+    """
+    Samples the memory usage of the training process, e.g. to notice a
+    memory leak in the data pipeline or an activation memory, that grows with
+    the length of the examples, before the process is killed.
+
+    The Trainer calls `sample` after each iteration (see
+    `Trainer.monitor_resources`), the SummaryHook aggregates the samples of a
+    summary interval (see `SummaryHook.compute_resources`) and the
+    MemoryWatchdogHook checks the `last` sample against a budget.
+
+    The sampled values (in bytes, if not noted otherwise) are:
+     - rss: Resident set size of the process (only on Linux)
+     - max_rss: Peak resident set size of the process
+     - python_allocated_blocks: Number of memory blocks of the Python
+       allocator (`sys.getallocatedblocks`), a cheap proxy for the number of
+       living Python objects
+     - python_heap: Memory traced by `tracemalloc` (only when tracing, e.g.
+       with `PYTHONTRACEMALLOC=1`)
+     - device_memory_allocated/<device>, device_memory_reserved/<device> and
+       device_max_memory_allocated/<device>: Statistics of the CUDA caching
+       allocator. The peak is reset after each sample, i.e. it is the peak of
+       the iteration.
+     - data_queue_depth: Number of ready examples in the buffers of the
+       train dataset, i.e. of the datasets in the pipeline with a
+       `queue_depth` attribute (e.g. `padertorch.data.ProcessPrefetch`).
+       A value close to zero means the training waits for the data.
+
+    >>> monitor = ResourceMonitor()
+    >>> monitor.sample(['cpu'])
+    >>> monitor.sample(['cpu'])
+    >>> monitor.as_dict['python_allocated_blocks'].shape
+    (2,)
+    >>> monitor.clear()
+    >>> monitor.as_dict
+    {}
+    >>> monitor.baseline is monitor.last
+    True
+    """
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.last = {}
+        self.baseline = {}
+        self._datasets = []
+        self._page_size = None
+
+    def clear(self):
+        """Drops the samples and keeps the last sample as `baseline`."""
+        self.samples.clear()
+        self.baseline = self.last
+
+    def set_dataset(self, dataset):
+        """
+        Searches the pipeline of `dataset` (i.e. the `input_dataset`s) for
+        datasets with a `queue_depth` attribute.
+        """
+        self._datasets = []
+        stack = [dataset]
+        visited = set()
+        while stack:
+            dataset = stack.pop()
+            if id(dataset) in visited:
+                continue
+            visited.add(id(dataset))
+            if hasattr(dataset, 'queue_depth'):
+                self._datasets.append(dataset)
+            if hasattr(dataset, 'input_dataset'):
+                stack.append(dataset.input_dataset)
+            stack.extend(getattr(dataset, 'input_datasets', []))
+
+    def get_rss(self):
+        try:
+            with open('/proc/self/statm') as fd:
+                rss_pages = int(fd.read().split()[1])
+        except OSError:
+            return None
+        if self._page_size is None:
+            self._page_size = os.sysconf('SC_PAGE_SIZE')
+        return rss_pages * self._page_size
+
+    def sample(self, devices=()):
+        last = {}
+        rss = self.get_rss()
+        if rss is not None:
+            last['rss'] = rss
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Bytes on macOS and kilobytes on Linux
+            last['max_rss'] = max_rss if sys.platform == 'darwin' \
+                else max_rss * 1024
+        last['python_allocated_blocks'] = sys.getallocatedblocks()
+        if tracemalloc.is_tracing():
+            last['python_heap'] = tracemalloc.get_traced_memory()[0]
+
+        for device in devices:
+            device = torch.device(device)
+            if device.type != 'cuda':
+                continue
+            last[f'device_memory_allocated/{device}'] = \
+                torch.cuda.memory_allocated(device)
+            last[f'device_memory_reserved/{device}'] = \
+                torch.cuda.memory_reserved(device)
+            last[f'device_max_memory_allocated/{device}'] = \
+                torch.cuda.max_memory_allocated(device)
+            torch.cuda.reset_peak_memory_stats(device)
+
+        queue_depths = [
+            dataset.queue_depth for dataset in self._datasets
+            if dataset.queue_depth is not None
+        ]
+        if len(queue_depths) > 0:
+            last['data_queue_depth'] = sum(queue_depths)
+
+        for key, value in last.items():
+            self.samples[key].append(value)
+        self.last = last
+
+    @property
+    def as_dict(self):
+        return {k: np.array(v) for k, v in self.samples.items()}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: ' + repr(self.as_dict)
+
+
 class InteractiveTrainer(Trainer):
     def __init__(
             self,
@@ -1032,7 +1870,9 @@ class InteractiveWriter:
         self.scalars = collections.defaultdict(list)
 
     def add_scalar(self, tag, scalar_value, global_step, walltime=None):
-        if tag.split('/')[0] in ['training_timings', 'validation_timings']:
+        if tag.split('/')[0] in [
+            'training_timings', 'validation_timings', 'training_resources'
+        ]:
             return
         print(f'{global_step}, {tag}: {scalar_value}')
 
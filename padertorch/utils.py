@@ -1,4 +1,4 @@
-import collections
+import collections.abc
 
 import numpy as np
 import torch
@@ -61,13 +61,13 @@ def to_list(x, length=None):
     def to_list_helper(x_):
         return [x_] * (1 if length is None else length)
 
-    if isinstance(x, collections.Mapping):
+    if isinstance(x, collections.abc.Mapping):
         x = to_list_helper(x)
     elif isinstance(x, str):
         x = to_list_helper(x)
-    elif isinstance(x, collections.Sequence):
+    elif isinstance(x, collections.abc.Sequence):
         pass
-    elif isinstance(x, collections.Iterable):
+    elif isinstance(x, collections.abc.Iterable):
         x = list(x)
     else:
         x = to_list_helper(x)
@@ -0,0 +1,153 @@
+import itertools
+
+import numpy as np
+import pytest
+import torch
+
+from padertorch.contrib.je.modules.hmm_torch import (
+    LeftToRightTransitions, batch_forward_backward, batch_viterbi
+)
+
+
+def _log(x):
+    with np.errstate(divide='ignore'):
+        return np.log(x)
+
+
+def brute_force(log_startprob, log_transmat, framelogprob, paths):
+    """Posteriors, expected transitions and best path by enumeration."""
+    T, K = framelogprob.shape
+    scores = np.array([
+        log_startprob[p[0]] + framelogprob[0, p[0]] + sum(
+            log_transmat[p[t - 1], p[t]] + framelogprob[t, p[t]]
+            for t in range(1, T)
+        )
+        for p in paths
+    ])
+    probs = np.exp(scores - np.logaddexp.reduce(scores))
+    posteriors = np.zeros((T, K))
+    transitions = np.zeros((K, K))
+    for p, prob in zip(paths, probs):
+        posteriors[np.arange(T), p] += prob
+        np.add.at(transitions, (p[:-1], p[1:]), prob)
+    return posteriors, transitions, paths[np.argmax(scores)]
+
+
+def get_hmm(K=4, seed=0):
+    rng = np.random.RandomState(seed)
+    transitions = LeftToRightTransitions(
+        log_self=torch.tensor(_log(rng.uniform(.1, 1, K))),
+        log_next=torch.tensor(_log(rng.uniform(.1, 1, K) * (np.arange(K) % 2))),
+        log_exit=torch.tensor(_log(rng.uniform(.1, 1, K) * (np.arange(K) % 2))),
+        log_entry=torch.tensor(_log(rng.uniform(.1, 1, K) * (1 - np.arange(K) % 2))),
+    )
+    log_startprob = torch.tensor(_log(rng.dirichlet(np.ones(K))))
+    return log_startprob, transitions
+
+
+@pytest.mark.parametrize('structured', [True, False])
+def test_forward_backward_and_viterbi(structured):
+    K, T = 4, 5
+    log_startprob, transitions = get_hmm(K)
+    log_transmat = transitions.dense()
+    framelogprob = torch.randn(3, T, K, dtype=torch.float64)
+    seq_len = [5, 3, 4]
+    initial_state = [None, 0, None]
+    final_state = [None, None, 3]
+
+    posteriors, expected_transitions = batch_forward_backward(
+        log_startprob, transitions if structured else log_transmat,
+        framelogprob, seq_len=seq_len,
+        initial_state=initial_state, final_state=final_state,
+    )
+    alignment = batch_viterbi(
+        log_startprob, transitions if structured else log_transmat,
+        framelogprob, seq_len=seq_len,
+        initial_state=initial_state, final_state=final_state,
+    )
+    for b, length in enumerate(seq_len):
+        paths = np.array(list(itertools.product(range(K), repeat=length)))
+        if initial_state[b] is not None:
+            paths = paths[paths[:, 0] == initial_state[b]]
+        if final_state[b] is not None:
+            paths = paths[paths[:, -1] == final_state[b]]
+        frames = framelogprob[b, :length].numpy().copy()
+        if final_state[b] is not None:
+            frames[-1] = 0.
+        ref_posteriors, ref_transitions, ref_alignment = brute_force(
+            log_startprob.numpy(), log_transmat.numpy(), frames, paths)
+        np.testing.assert_allclose(
+            posteriors[b, :length].numpy(), ref_posteriors, atol=1e-10)
+        np.testing.assert_equal(posteriors[b, length:].numpy(), 0.)
+        np.testing.assert_allclose(
+            expected_transitions[b].numpy(), ref_transitions, atol=1e-10)
+        np.testing.assert_equal(alignment[b, :length].numpy(), ref_alignment)
+        np.testing.assert_equal(alignment[b, length:].numpy(), 0)
+
+
+def test_state_sequence():
+    K, T = 4, 5
+    log_startprob, transitions = get_hmm(K)
+    log_transmat = transitions.dense()
+    framelogprob = torch.randn(2, T, K, dtype=torch.float64)
+    seq_len = [5, 4]
+    state_sequence = [[0, 0, 1, 2], [2, 3]]
+
+    posteriors, expected_transitions = batch_forward_backward(
+        log_startprob, transitions, framelogprob, seq_len=seq_len,
+        state_sequence=state_sequence,
+    )
+    alignment = batch_viterbi(
+        log_startprob, transitions, framelogprob, seq_len=seq_len,
+        state_sequence=state_sequence,
+    )
+    for b, (length, states) in enumerate(zip(seq_len, state_sequence)):
+        states = np.array([
+            s for i, s in enumerate(states) if i == 0 or s != states[i - 1]
+        ])
+        # The paths through the observed states, where the emissions of the
+        # first and last frame are ignored
+        chain_paths = np.array([
+            p for p in itertools.product(range(len(states)), repeat=length)
+            if p[0] == 0 and p[-1] == len(states) - 1
+            and all(0 <= p[t] - p[t - 1] <= 1 for t in range(1, length))
+        ])
+        frames = framelogprob[b, :length].numpy().copy()
+        frames[0] = frames[-1] = 0.
+        ref_posteriors, ref_transitions, ref_alignment = brute_force(
+            log_startprob.numpy(), log_transmat.numpy(), frames,
+            states[chain_paths],
+        )
+        np.testing.assert_allclose(
+            posteriors[b, :length].numpy(), ref_posteriors, atol=1e-10)
+        np.testing.assert_allclose(
+            expected_transitions[b].numpy(), ref_transitions, atol=1e-10)
+        np.testing.assert_equal(alignment[b, :length].numpy(), ref_alignment)
+
+
+def test_hmm_module():
+    from padertorch.contrib.je.modules.hmm import HMM
+    import torch.distributions as D
+
+    hmm = HMM(2, 3, states_per_unit=2, covariance_type='diag')
+    dense = hmm.log_transitions.dense()
+    reference = hmm.log_transition_mat
+    assert (torch.isinf(dense) == torch.isinf(reference)).all()
+    finite = torch.isfinite(reference)
+    np.testing.assert_allclose(
+        dense[finite].detach().numpy(), reference[finite].detach().numpy(),
+        rtol=1e-6,
+    )
+
+    qz = D.Normal(loc=torch.randn(2, 7, 2), scale=torch.ones(2, 7, 2))
+    for training in [True, False]:
+        hmm.train(training)
+        posteriors, transitions, log_rho = hmm(qz, seq_len=[7, 5])
+        assert posteriors.shape == (2, 7, 6), posteriors.shape
+        assert transitions.shape == (2, 6, 6), transitions.shape
+        np.testing.assert_allclose(
+            posteriors.sum(-1).numpy(), [7 * [1.], 5 * [1.] + 2 * [0.]],
+            rtol=1e-5,
+        )
+        np.testing.assert_allclose(
+            transitions.sum((1, 2)).numpy(), [6., 4.], rtol=1e-5)
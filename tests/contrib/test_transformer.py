@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+import torch
+
+from padertorch.contrib.je.modules.transformer import (
+    MultiHeadAttention, TransformerBlock, TransformerStack
+)
+
+
+def get_stack(bidirectional=False):
+    torch.manual_seed(0)
+    stack = TransformerStack(
+        8, 12, num_layers=2, output_size=6, num_heads=3,
+        bidirectional=bidirectional, norm='batch',
+    )
+    # Normalization with running statistics, which is causal
+    with torch.no_grad():
+        stack(torch.randn(4, 20, 8))
+    return stack.eval()
+
+
+@pytest.mark.parametrize('chunks', [[1] * 11, [4, 1, 1, 3, 2], [11]])
+def test_incremental_decoding(chunks):
+    stack = get_stack()
+    x = torch.randn(2, sum(chunks), 8)
+    with torch.no_grad():
+        y_ref, _ = stack(x)
+        state = stack.init_state()
+        ys = []
+        for t, size in zip(np.cumsum([0] + chunks), chunks):
+            y, state = stack(x[:, t:t + size], state=state)
+            ys.append(y)
+    np.testing.assert_allclose(
+        torch.cat(ys, dim=1).numpy(), y_ref.numpy(), atol=1e-5)
+    assert [len(s) for s in state] == [x.shape[1], x.shape[1]]
+
+
+def test_continue_full_sequence_forward():
+    stack = get_stack()
+    x = torch.randn(2, 9, 8)
+    with torch.no_grad():
+        y_ref, _ = stack(x)
+        y, state = stack(x[:, :5])
+        for t in range(5, 9):
+            y_t, state = stack(x[:, t:t + 1], state=state)
+            y = torch.cat([y, y_t], dim=1)
+    np.testing.assert_allclose(y.numpy(), y_ref.numpy(), atol=1e-5)
+
+
+@pytest.mark.parametrize('chunks', [[1] * 9, [2, 3, 1, 3], [9]])
+def test_max_context(chunks):
+    torch.manual_seed(0)
+    max_context = 3
+    attn = MultiHeadAttention(4, 6, num_heads=2)
+    x = torch.randn(2, sum(chunks), 4)
+    with torch.no_grad():
+        # reference: each frame attends to the last max_context frames
+        y_ref = torch.cat([
+            attn(
+                x[:, t:t + 1],
+                x[:, max(t + 1 - max_context, 0):t + 1],
+                x[:, max(t + 1 - max_context, 0):t + 1],
+            )
+            for t in range(x.shape[1])
+        ], dim=1)
+        state = attn.init_state(max_context=max_context)
+        ys = []
+        for t, size in zip(np.cumsum([0] + chunks), chunks):
+            x_t = x[:, t:t + size]
+            ys.append(attn(x_t, x_t, x_t, state=state))
+    np.testing.assert_allclose(
+        torch.cat(ys, dim=1).numpy(), y_ref.numpy(), atol=1e-5)
+    assert len(state) == max_context
+    assert state.length == x.shape[1]
+    assert state.key.shape[-2] == max_context
+
+
+def test_past_inputs_as_state():
+    torch.manual_seed(0)
+    block = TransformerBlock(6, 6, num_heads=2, norm='batch').eval()
+    past = torch.randn(2, 5, 6)
+    x = torch.randn(2, 3, 6)
+    with torch.no_grad():
+        y_ref, _ = block(torch.cat([past, x], dim=1))
+        y, state = block(x, state=past)
+    np.testing.assert_allclose(y.numpy(), y_ref[:, -3:].numpy(), atol=1e-5)
+    assert len(state) == 8
+
+
+def test_bidirectional_state():
+    stack = get_stack(bidirectional=True)
+    x = torch.randn(2, 7, 8)
+    with torch.no_grad():
+        state = stack.init_state()
+        stack(x[:, :4], state=state)
+        y, _ = stack(x[:, 4:], state=state)
+        y_ref, _ = stack(
+            x[:, 4:], state=[x[:, :4], stack.stack[0](x[:, :4])[0]])
+    np.testing.assert_allclose(y.numpy(), y_ref.numpy(), atol=1e-5)
+
+
+def test_gradient_without_state():
+    stack = get_stack().train()
+    x = torch.randn(2, 5, 8, requires_grad=True)
+    y, _ = stack(x, seq_len_x=[5, 3])
+    y.sum().backward()
+    assert x.grad is not None
@@ -0,0 +1,77 @@
+import numpy as np
+
+import lazy_dataset
+import padertorch as pt
+
+
+def _get_dataset(num_examples=500, seed=0):
+    rng = np.random.RandomState(seed)
+    lengths = rng.randint(10, 1000, size=num_examples)
+    return lazy_dataset.new({
+        str(i): {'example_id': str(i), 'num_samples': int(length)}
+        for i, length in enumerate(lengths)
+    })
+
+
+def test_padding_rate():
+    assert pt.data.batch.padding_rate([]) == 0
+    assert pt.data.batch.padding_rate([4, 4]) == 0
+    np.testing.assert_allclose(pt.data.batch.padding_rate([8, 4, 2, 2]), .5)
+
+
+def test_padding_rate_of_bucket_batching():
+    dataset = _get_dataset()
+    batch_size = 8
+
+    def mean_padding_rate(batches):
+        return np.mean([
+            pt.data.batch.padding_rate([ex['num_samples'] for ex in batch])
+            for batch in batches
+        ])
+
+    bucket_batches = list(
+        dataset.shuffle().batch_dynamic_time_series_bucket(
+            batch_size=batch_size, len_key='num_samples',
+            max_padding_rate=0.1, expiration=100 * batch_size,
+        )
+    )
+    example_ids = [ex['example_id'] for b in bucket_batches for ex in b]
+    assert sorted(example_ids) == sorted(dataset.keys())
+    for batch in bucket_batches:
+        assert pt.data.batch.padding_rate(
+            [ex['num_samples'] for ex in batch]) <= 0.1
+
+    # Random batching of the same dataset has considerably more padding
+    random_batches = dataset.shuffle().batch(batch_size)
+    assert mean_padding_rate(bucket_batches) < mean_padding_rate(
+        random_batches) / 2
+
+
+def test_time_series_bucket_batcher_total_size():
+    dataset = _get_dataset()
+    max_total_size = 4000
+    batcher = pt.data.batch.TimeSeriesBucketBatcher(
+        batch_size=8, max_padding_rate=0.2, max_total_size=max_total_size,
+        expiration=800, sort_key='num_samples',
+    )
+    batches = list(dataset.shuffle().apply(batcher))
+    example_ids = [ex['example_id'] for b in batches for ex in b]
+    assert sorted(example_ids) == sorted(dataset.keys())
+    for batch in batches:
+        lengths = [ex['num_samples'] for ex in batch]
+        assert len(batch) <= 8
+        assert len(batch) * max(lengths) <= max_total_size
+        assert lengths == sorted(lengths, reverse=True)
+        assert pt.data.batch.padding_rate(lengths) <= 0.2
+
+
+def test_time_series_bucket_batcher_group_key():
+    dataset = _get_dataset().map(
+        lambda ex: {**ex, 'num_speakers': 2 + int(ex['example_id']) % 2}
+    )
+    batches = list(dataset.apply(pt.data.batch.TimeSeriesBucketBatcher(
+        batch_size=4, max_padding_rate=0.5, group_key='num_speakers',
+    )))
+    assert sum(len(batch) for batch in batches) == len(dataset)
+    for batch in batches:
+        assert len({ex['num_speakers'] for ex in batch}) == 1
@@ -0,0 +1,97 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import padertorch as pt
+
+
+class Transform:
+    def __init__(self, scale):
+        self.scale = scale
+        self.calls = 0
+
+    def __call__(self, example):
+        self.calls += 1
+        signal = np.load(example['audio_path']['observation'])
+        return {
+            **example,
+            'signal': self.scale * signal,
+            'stft': np.fft.rfft(signal.reshape(-1, 8)).T,
+            'num_samples': signal.shape[-1],
+        }
+
+
+def _get_examples(tmp_path, num_examples=4):
+    examples = []
+    for i in range(num_examples):
+        file = tmp_path / f'{i}.npy'
+        np.save(file, np.random.RandomState(i).randn(64))
+        examples.append({
+            'example_id': str(i),
+            'dataset': 'train',
+            'audio_path': {'observation': str(file)},
+        })
+    return examples
+
+
+def test_feature_cache(tmp_path: Path):
+    examples = _get_examples(tmp_path)
+    transform = Transform(2)
+    cache = pt.data.FeatureCache(
+        transform, tmp_path / 'cache', config={'scale': 2})
+
+    expected = [Transform(2)(ex) for ex in examples]
+    for _ in range(3):
+        for ex, ref in zip(examples, expected):
+            out = cache(ex)
+            assert out.keys() == ref.keys()
+            np.testing.assert_equal(out['signal'], ref['signal'])
+            np.testing.assert_equal(out['stft'], ref['stft'])
+            assert out['stft'].dtype == ref['stft'].dtype
+            assert out['num_samples'] == 64
+    assert transform.calls == len(examples)
+
+    # A changed config invalidates the cache
+    cache = pt.data.FeatureCache(
+        transform, tmp_path / 'cache', config={'scale': 3})
+    cache(examples[0])
+    assert transform.calls == len(examples) + 1
+
+    # A changed source file invalidates the cache
+    file = examples[1]['audio_path']['observation']
+    np.save(file, np.zeros(64))
+    os.utime(file, ns=(0, 0))
+    np.testing.assert_equal(cache(examples[1])['signal'], 0)
+    assert transform.calls == len(examples) + 2
+
+    # The config is required, the transform itself is no valid key
+    with pytest.raises(ValueError, match='config'):
+        pt.data.FeatureCache(Transform(2), tmp_path / 'cache2', config=None)
+
+
+def test_feature_cache_eviction(tmp_path: Path):
+    examples = _get_examples(tmp_path, 10)
+    transform = Transform(1)
+    cache = pt.data.FeatureCache(transform, tmp_path / 'cache', config={})
+    cache(examples[0])
+    entry_size = sum(
+        file.stat().st_size for file in (tmp_path / 'cache').glob('*/*'))
+
+    cache = pt.data.FeatureCache(
+        transform, tmp_path / 'cache', config={},
+        size_limit=int(4.5 * entry_size),
+    )
+    for ex in examples:
+        cache(ex)
+        # Example 0 is used most recently
+        cache(examples[0])
+    files = list((tmp_path / 'cache').glob('*/*.cache'))
+    assert len(files) == 4, files
+    calls = transform.calls
+    cache(examples[0])
+    cache(examples[-1])
+    assert transform.calls == calls
+    cache(examples[1])
+    assert transform.calls == calls + 1
@@ -0,0 +1,62 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import lazy_dataset
+import padertorch as pt
+
+
+def _get_dataset():
+    rng = np.random.RandomState(0)
+    return lazy_dataset.new([
+        {'x': (1000 + rng.randn(n, 5)).astype(np.float32)}
+        for n in rng.randint(1, 200, size=50)
+    ])
+
+
+@pytest.mark.parametrize('num_workers', [1, 3])
+def test_compute_moments(num_workers):
+    dataset = _get_dataset()
+    x = np.concatenate([ex['x'] for ex in dataset]).astype(np.float64)
+
+    moments = pt.data.compute_moments(
+        dataset, 'x', axis=0, num_workers=num_workers, chunk_size=4)
+    assert moments.count == len(x)
+    np.testing.assert_allclose(moments.mean[0], x.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(moments.var[0], x.var(axis=0), rtol=1e-9)
+
+    # The result does not depend on the number of workers
+    reference = pt.data.compute_moments(dataset, 'x', axis=0, chunk_size=4)
+    np.testing.assert_equal(moments.mean, reference.mean)
+    np.testing.assert_equal(moments.m2, reference.m2)
+
+
+def test_compute_moments_resume(tmp_path):
+    dataset = _get_dataset()
+    state_file = tmp_path / 'state.pkl'
+    reference = pt.data.compute_moments(dataset, 'x', axis=0, chunk_size=8)
+
+    def fail(example):
+        if fail.calls == 20:
+            raise RuntimeError('interrupted')
+        fail.calls += 1
+        return example['x']
+    fail.calls = 0
+
+    with pytest.raises(RuntimeError, match='interrupted'):
+        pt.data.compute_moments(
+            dataset, fail, axis=0, chunk_size=8, state_file=state_file)
+    with open(state_file, 'rb') as fd:
+        assert sorted(pickle.load(fd)['chunks']) == [0, 1]
+
+    def count(example):
+        count.calls += 1
+        return example['x']
+    count.calls = 0
+
+    moments = pt.data.compute_moments(
+        dataset, count, axis=0, chunk_size=8, state_file=state_file)
+    assert count.calls == len(dataset) - 16
+    np.testing.assert_equal(moments.mean, reference.mean)
+    np.testing.assert_equal(moments.m2, reference.m2)
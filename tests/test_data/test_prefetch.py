@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import lazy_dataset
+import padertorch as pt
+
+
+def _transform(index):
+    if index % 7 == 3:
+        raise lazy_dataset.FilterException()
+    return {
+        'index': index,
+        'x': np.full((index, 3), index, dtype=np.float32),
+        'noise': np.random.rand(),
+    }
+
+
+def test_process_prefetch_order_and_filter():
+    dataset = lazy_dataset.new(list(range(50))).map(_transform)
+    prefetcher = pt.data.ProcessPrefetch(
+        3, 6, catch_filter_exception=True, seed=0)
+    prefetched = dataset.shuffle(
+        reshuffle=True, rng=np.random.RandomState(0)).apply(prefetcher)
+
+    first = list(prefetched)
+    second = list(prefetched)
+    for examples in [first, second]:
+        assert sorted(ex['index'] for ex in examples) == [
+            i for i in range(50) if i % 7 != 3]
+        for ex in examples:
+            assert isinstance(ex['x'], np.ndarray)
+            assert ex['x'].dtype == np.float32
+            np.testing.assert_equal(ex['x'], ex['index'])
+    # Reshuffle is applied in each iteration
+    assert [ex['index'] for ex in first] != [ex['index'] for ex in second]
+
+    # Deterministic worker seeds
+    noise = [[ex['noise'] for ex in examples] for examples in [first, second]]
+    prefetcher = pt.data.ProcessPrefetch(
+        3, 6, catch_filter_exception=True, seed=0)
+    prefetched = dataset.shuffle(
+        reshuffle=True, rng=np.random.RandomState(0)).apply(prefetcher)
+    assert [[ex['noise'] for ex in list(prefetched)] for _ in range(2)] == noise
+
+
+def test_process_prefetch_exceptions():
+    dataset = lazy_dataset.new(list(range(10))).map(_transform)
+    with pytest.raises(lazy_dataset.FilterException):
+        list(dataset.apply(pt.data.ProcessPrefetch(2, 4)))
+
+    def fail(example):
+        if example == 5:
+            raise ValueError('example 5')
+        return example
+
+    with pytest.raises(ValueError, match='example 5'):
+        list(lazy_dataset.new(list(range(10))).map(fail).apply(
+            pt.data.ProcessPrefetch(2, 4)))
+
+
+def test_process_prefetch_stop_early():
+    dataset = lazy_dataset.new(list(range(100))).map(_transform)
+    prefetched = dataset.apply(
+        pt.data.ProcessPrefetch(2, 8, catch_filter_exception=True))
+    iterator = iter(prefetched)
+    assert [next(iterator)['index'] for _ in range(3)] == [0, 1, 2]
+    iterator.close()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+
+from padertorch.data.utils import pad_batch, pad_tensor, PadCollate
+
+
+def test_pad_tensor_keeps_dtype():
+    x = np.ones((2, 3), np.float32)
+    padded = pad_tensor(x, 5, axis=1)
+    assert padded.dtype == np.float32
+    np.testing.assert_equal(padded[:, :3], x)
+    np.testing.assert_equal(padded[:, 3:], 0)
+
+
+@pytest.mark.parametrize('to_tensor,share_memory', [
+    (False, False),
+    (True, False),
+    (True, True),
+])
+def test_pad_batch(to_tensor, share_memory):
+    rng = np.random.RandomState(0)
+    arrays = [
+        rng.randn(2, n).astype(np.float32) for n in [7, 3, 5]
+    ]
+    batch, sequence_lengths, mask = pad_batch(
+        arrays, pad_value=-1, to_tensor=to_tensor,
+        share_memory=share_memory, return_mask=True,
+    )
+    if to_tensor:
+        assert batch.dtype == torch.float32
+        assert batch.is_shared() == share_memory
+        batch = batch.numpy()
+        sequence_lengths = sequence_lengths.numpy()
+        mask = mask.numpy()
+    assert batch.dtype == np.float32
+    assert batch.shape == (3, 2, 7)
+
+    expected = np.stack([
+        np.pad(array, [(0, 0), (0, 7 - array.shape[-1])], constant_values=-1)
+        for array in arrays
+    ])
+    np.testing.assert_equal(batch, expected)
+    np.testing.assert_equal(sequence_lengths, [7, 3, 5])
+    np.testing.assert_equal(mask, np.arange(7) < np.array([[7], [3], [5]]))
+
+
+def test_pad_collate():
+    batch = [
+        {'example_id': str(i), 'x': np.ones((n, 4)), 'y': np.ones(n // 2)}
+        for i, n in enumerate([10, 6])
+    ]
+    batch = PadCollate(['x', 'y'], axis={'x': 0, 'y': -1}, to_tensor=True,
+                       return_mask=True)(batch)
+    assert batch['example_id'] == ['0', '1']
+    assert batch['x'].shape == (2, 10, 4)
+    assert batch['y'].shape == (2, 5)
+    assert batch['x_lengths'].tolist() == [10, 6]
+    assert batch['y_lengths'].tolist() == [5, 3]
+    assert batch['x_mask'].shape == (2, 10)
+    assert batch['y_mask'].tolist() == [[True] * 5, [True] * 3 + [False] * 2]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import torch
+
+from padertorch.modules.convnet import ConvNet
+
+
+def get_convnet(norm='cLN', causal=True):
+    torch.manual_seed(0)
+    convnet = ConvNet(
+        num_blocks=4, num_repeats=2, in_channels=8, hidden_channels=16,
+        kernel_size=3, norm=norm, causal=causal,
+    )
+    if norm == 'BN':
+        # Non trivial running statistics
+        convnet.train()
+        with torch.no_grad():
+            convnet(torch.randn(4, 100, 8))
+    return convnet.eval().double()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+@pytest.mark.parametrize('norm', ['cLN', 'BN'])
+def test_streaming_equals_offline(norm, chunk_size):
+    convnet = get_convnet(norm)
+    x = torch.randn(3, 100, 8, dtype=torch.float64)
+    with torch.no_grad():
+        expected = convnet(x)
+
+        state = convnet.init_state(batch_size=3)
+        # left context of each block: (kernel_size - 1) * dilation
+        assert [s.shape[-1] for s in state] == 2 * [2, 4, 8, 16], state
+        chunks = []
+        for t in range(0, x.shape[1], chunk_size):
+            y, state = convnet(x[:, t:t + chunk_size], state=state)
+            chunks.append(y)
+
+    np.testing.assert_allclose(
+        torch.cat(chunks, dim=1).numpy(), expected.numpy(), atol=1e-10)
+
+
+def test_causal():
+    convnet = get_convnet()
+    x = torch.randn(1, 50, 8, dtype=torch.float64)
+    with torch.no_grad():
+        y = convnet(x)
+        x[:, 30:] = 0
+        y_truncated = convnet(x)
+    np.testing.assert_allclose(y[:, :30].numpy(), y_truncated[:, :30].numpy())
+
+
+@pytest.mark.parametrize('norm,causal', [('cLN', False), ('gLN', True)])
+def test_streaming_unsupported(norm, causal):
+    convnet = get_convnet(norm, causal)
+    with pytest.raises(ValueError, match='streaming mode'):
+        convnet.init_state()
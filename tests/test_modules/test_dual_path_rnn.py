@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+import paderbox as pb
+from padertorch.contrib.jensheit.norm import GlobalChannelLayerNorm
+from padertorch.modules.dual_path_rnn import (
+    segment, overlap_add, apply_examplewise
+)
+
+
+def segment_ref(signal, hop_size, window_size):
+    padding = window_size - hop_size
+    signal = F.pad(signal, [0, 0, padding, padding])
+    segmented = pb.array.segment_axis(
+        signal, window_size, hop_size, axis=-2, end='pad')
+    return segmented.permute(0, 3, 2, 1)
+
+
+def overlap_add_ref(signal, hop_size):
+    B, N, K, S = signal.shape
+    out = signal.new_zeros(B, S * hop_size + K - hop_size, N)
+    signal = signal.permute(0, 2, 1, 3)
+    for i in range(S):
+        out[:, i * hop_size:i * hop_size + K, :] += signal[..., :, :, i]
+    return out
+
+
+@pytest.mark.parametrize('hop_size,window_size', [
+    (1, 4), (2, 4), (3, 4), (10, 20), (7, 20), (6, 20), (16, 100),
+])
+@pytest.mark.parametrize('length', [1, 5, 37, 100])
+def test_segment_and_overlap_add(hop_size, window_size, length):
+    signal = torch.randn(2, length, 3, dtype=torch.float64,
+                         requires_grad=True)
+
+    segmented, _ = segment(signal, hop_size, window_size)
+    segmented_ref = segment_ref(signal, hop_size, window_size)
+    np.testing.assert_equal(
+        segmented.detach().numpy(), segmented_ref.detach().numpy())
+
+    # Bit exact, because the summation order is the same
+    weight = torch.randn_like(segmented)
+    out = overlap_add(segmented * weight, hop_size, unpad=False)
+    out_ref = overlap_add_ref(segmented_ref * weight, hop_size)
+    np.testing.assert_equal(out.detach().numpy(), out_ref.detach().numpy())
+
+    grad, = torch.autograd.grad(out.sum(), signal)
+    grad_ref, = torch.autograd.grad(out_ref.sum(), signal)
+    np.testing.assert_allclose(grad.numpy(), grad_ref.numpy())
+
+
+def apply_examplewise_ref(fn, x, sequence_lengths, time_axis=1):
+    selector = [slice(None)] * (time_axis - 1)
+    out = torch.zeros_like(x)
+    for b, l in enumerate(sequence_lengths):
+        s = (b, *selector, slice(l))
+        out[s] = fn(x[s][None, ...])[0]
+    return out
+
+
+@pytest.mark.parametrize('fn,shape,time_axis', [
+    (torch.nn.LayerNorm(3), (4, 7, 3), 1),
+    (torch.nn.LayerNorm((5, 3)), (4, 7, 5, 3), 1),
+    (torch.nn.Linear(3, 3), (4, 7, 3), 1),
+    (GlobalChannelLayerNorm(3), (4, 3, 7), 2),
+    (torch.nn.Conv1d(3, 3, 3, padding=1), (4, 3, 7), 2),
+])
+@pytest.mark.parametrize('framewise', [None, False])
+def test_apply_examplewise(fn, shape, time_axis, framewise):
+    x = torch.randn(*shape, dtype=torch.float64, requires_grad=True)
+    fn = fn.double()
+    sequence_lengths = torch.tensor([7, 3, 7, 1])
+
+    out = apply_examplewise(
+        fn, x, sequence_lengths, time_axis, framewise=framewise)
+    out_ref = apply_examplewise_ref(fn, x, sequence_lengths, time_axis)
+    np.testing.assert_allclose(
+        out.detach().numpy(), out_ref.detach().numpy(), atol=1e-10)
+
+    grad, = torch.autograd.grad(out.sum(), x)
+    grad_ref, = torch.autograd.grad(out_ref.sum(), x)
+    np.testing.assert_allclose(grad.numpy(), grad_ref.numpy(), atol=1e-10)
+
+
+@pytest.mark.parametrize('time_axis', [1, 2])
+@pytest.mark.parametrize('sequence_lengths', [[7, 3, 7, 1], [7, 7, 7, 7]])
+def test_apply_examplewise_global_layer_norm(time_axis, sequence_lengths):
+    norm = GlobalChannelLayerNorm(3).double()
+    with torch.no_grad():
+        norm.gamma.normal_()
+        norm.beta.normal_()
+    shape = (4, 7, 3) if time_axis == 1 else (4, 3, 7)
+    x = torch.randn(*shape, dtype=torch.float64, requires_grad=True)
+
+    if time_axis == 1:
+        # The gLN expects the features before the time axis
+        def fn(x):
+            return norm(x.transpose(1, 2)).transpose(1, 2)
+    else:
+        fn = norm
+
+    out = apply_examplewise(
+        norm, x, torch.tensor(sequence_lengths), time_axis)
+    out_ref = apply_examplewise_ref(fn, x, sequence_lengths, time_axis)
+    np.testing.assert_allclose(
+        out.detach().numpy(), out_ref.detach().numpy(), atol=1e-10)
+
+    grad, = torch.autograd.grad(out.sum(), x)
+    grad_ref, = torch.autograd.grad(out_ref.sum(), x)
+    np.testing.assert_allclose(grad.numpy(), grad_ref.numpy(), atol=1e-10)
@@ -68,3 +68,59 @@ def test_outputs_and_grads():
             tc.assert_array_almost_equal(x.grad.numpy(), x_ref.grad.numpy(), decimal=4)
             tc.assert_array_almost_equal(gamma.grad.numpy(), gamma_ref.grad.numpy(), decimal=4)
             tc.assert_array_almost_equal(beta.grad.numpy(), beta_ref.grad.numpy(), decimal=4)
+
+
+def test_initialize_running_stats():
+    import numpy as np
+    from padertorch.modules.normalization import InputNormalization
+
+    rng = np.random.RandomState(0)
+    dataset = [
+        rng.randn(3, n).astype(np.float32) + np.arange(3)[:, None]
+        for n in rng.randint(5, 20, size=10)
+    ]
+    x = np.concatenate(dataset, axis=-1)
+
+    norm = InputNormalization(
+        data_format='bct', shape=(None, 3, None), statistics_axis='bt',
+        momentum=None,
+    )
+    norm.initialize_running_stats(dataset)
+    tc.assert_allclose(norm.num_tracked_values.flatten(), x.shape[-1])
+    tc.assert_allclose(norm.running_mean.flatten(), x.mean(-1), rtol=1e-5)
+    tc.assert_allclose(
+        norm.running_var.flatten(), x.var(-1, ddof=1) + norm.eps, rtol=1e-5)
+
+    # Training continues the cumulative average
+    batch = torch.from_numpy(rng.randn(2, 3, 7).astype(np.float32))
+    norm(batch)
+    x = np.concatenate([x, *batch.numpy()], axis=-1)
+    tc.assert_allclose(norm.running_mean.flatten(), x.mean(-1), rtol=1e-5)
+
+
+def test_statistics_axis_and_padding():
+    for statistics_axis, seq_len in [
+        ([0, 2], None),
+        ([0, 2], [5, 5]),
+        ([2], [5, 3]),
+        ([2], [1, 3]),
+        ([0, 1, 2], [4, 3]),
+    ]:
+        x = torch.randn((2, 3, 5), requires_grad=True)
+        x_ref = x.clone().detach()
+        x_ref.requires_grad = True
+        gamma = torch.randn((1, 3, 1))
+        beta = torch.randn((1, 3, 1))
+
+        outs = normalize(
+            x, gamma, beta, statistics_axis, 0, 2, seq_len, True, True, 1e-3)
+        outs_ref = normalize_ref(
+            x_ref, gamma, beta, statistics_axis, 0, 2, seq_len, True, True,
+            1e-3)
+        outs[0].sum().backward()
+        outs_ref[0].sum().backward()
+        for out, out_ref in zip(outs, outs_ref):
+            tc.assert_array_almost_equal(
+                out.detach().numpy(), out_ref.detach().numpy(), decimal=5)
+        tc.assert_array_almost_equal(
+            x.grad.numpy(), x_ref.grad.numpy(), decimal=4)
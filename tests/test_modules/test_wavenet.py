@@ -0,0 +1,47 @@
+import numpy as np
+import torch
+
+from padertorch.modules.wavenet import WaveNet
+from padertorch.modules.wavenet.fast_wavenet import FastWaveNet
+
+
+def get_wavenet(n_layers=6, max_dilation=8):
+    torch.manual_seed(0)
+    wavenet = WaveNet(
+        n_cond_channels=5, upsamp_window=8, upsamp_stride=4,
+        n_in_channels=32, n_layers=n_layers, max_dilation=max_dilation,
+        n_residual_channels=8, n_skip_channels=16, n_out_channels=32,
+    )
+    return wavenet.eval()
+
+
+def test_fast_wavenet_teacher_forced_equivalence():
+    wavenet = get_wavenet()
+    features = torch.randn(3, 5, 20)
+    with torch.no_grad():
+        cond_input = wavenet.get_cond_input(features)
+        samples, logits = FastWaveNet(**wavenet.export_weights()).infer(
+            cond_input, return_logits=True)
+
+        # The generated samples are the inputs for the following steps,
+        # the first input is silence.
+        quantized = torch.cat([
+            torch.full_like(samples[:, :1], wavenet.n_out_channels // 2),
+            samples[:, :-1]
+        ], dim=1)
+        cond_acts = cond_input.permute(1, 2, 0, 3)
+        expected = wavenet._logits(quantized, cond_acts)
+
+    assert samples.shape == (3, 80), samples.shape
+    assert samples.dtype == torch.long, samples.dtype
+    np.testing.assert_allclose(
+        logits.numpy(), expected.numpy(), rtol=1e-5, atol=1e-5)
+
+
+def test_infer_cpu_chunks():
+    wavenet = get_wavenet()
+    features = torch.randn(2, 5, 30)
+    audio = wavenet.infer(features, chunk_length=40, chunk_overlap=8)
+    pad_width = wavenet.upsamp_window - wavenet.upsamp_stride
+    assert audio.shape == (2, 30 * 4 - pad_width), audio.shape
+    assert audio.abs().max() <= 1, audio.abs().max()
@@ -150,6 +150,138 @@ class TestPermutationInvariantTrainingLoss(unittest.TestCase):
         self.check_toy_example([[[0], [1]]], [[[0], [1]]], 0)
 
 
+class TestBatchedPermutationInvariantTrainingLoss(unittest.TestCase):
+    loss_functions = [
+        pt.ops.losses.mse_loss,
+        pt.ops.losses.log_mse_loss,
+        pt.ops.losses.log1p_mse_loss,
+        pt.ops.losses.sdr_loss,
+        pt.ops.losses.si_sdr_loss,
+        torch.nn.functional.mse_loss,
+    ]
+
+    shape = (4, 3, 100)  # (B, K, T)
+    sequence_lengths = [100, 80, 53, 100]
+
+    def setUp(self):
+        B, K = self.shape[:2]
+        rng = np.random.RandomState(0)
+        self.target = torch.tensor(rng.randn(*self.shape))
+        # Permuted and noisy target as estimate
+        self.estimate = torch.stack([
+            t[list(rng.permutation(K))] for t in self.target
+        ]) + 0.3 * torch.tensor(rng.randn(*self.shape))
+
+    def reference(self, loss_fn, sequence_lengths):
+        losses, permutations = [], []
+        for estimate, target, seq_len in zip(
+                self.estimate, self.target, sequence_lengths
+        ):
+            loss, permutation = pt.ops.losses.pit_loss(
+                estimate[:, :seq_len], target[:, :seq_len],
+                axis=0, loss_fn=loss_fn, return_permutation=True,
+            )
+            losses.append(loss)
+            permutations.append(permutation)
+        return torch.stack(losses), np.array(permutations)
+
+    def check(self, loss_fn, sequence_lengths=None, **kwargs):
+        loss, permutation = pt.ops.losses.batched_pit_loss(
+            self.estimate, self.target, loss_fn=loss_fn,
+            sequence_lengths=sequence_lengths,
+            reduction=None, return_permutation=True, **kwargs
+        )
+        if sequence_lengths is None:
+            sequence_lengths = [self.target.shape[2]] * len(self.target)
+        reference_loss, reference_permutation = self.reference(
+            loss_fn, sequence_lengths)
+        np.testing.assert_allclose(loss, reference_loss, rtol=1e-7)
+        np.testing.assert_equal(permutation.numpy(), reference_permutation)
+
+    def test_fused_losses(self):
+        self.assertEqual(
+            set(self.loss_functions),
+            set(pt.ops.losses.source_separation._ROWWISE_LOSSES),
+        )
+        for loss_fn in self.loss_functions:
+            with self.subTest(loss_fn=loss_fn.__name__):
+                self.check(loss_fn)
+
+    def test_fused_losses_with_sequence_lengths(self):
+        for loss_fn in self.loss_functions:
+            with self.subTest(loss_fn=loss_fn.__name__):
+                self.check(loss_fn, self.sequence_lengths)
+
+    def test_hungarian(self):
+        self.check(pt.ops.losses.sdr_loss, algorithm='hungarian')
+
+    def test_generic_loss(self):
+        def l1_loss(estimate, target, reduction='sum'):
+            return pt.ops.losses.regression._reduce(
+                torch.abs(estimate - target).mean(dim=-1),
+                reduction=reduction,
+            )
+        self.check(l1_loss)
+        if self.target.dim() == 3:
+            # The padding of the reduced axis cannot be masked
+            with self.assertRaises(ValueError):
+                self.check(l1_loss, self.sequence_lengths)
+        else:
+            self.check(l1_loss, self.sequence_lengths)
+
+    def test_many_speakers(self):
+        B, K, T = 2, 9, 50
+        target = torch.randn(B, K, T)
+        estimate = target[:, torch.randperm(K)]
+        loss, permutation = pt.ops.losses.batched_pit_loss(
+            estimate, target, return_permutation=True)
+        np.testing.assert_allclose(loss, 0, atol=1e-5)
+        for e, t, p in zip(estimate, target, permutation):
+            np.testing.assert_allclose(e[p], t)
+
+    def test_gradient(self):
+        estimate = self.estimate.clone().requires_grad_()
+        loss = pt.ops.losses.batched_pit_loss(
+            estimate, self.target, pt.ops.losses.si_sdr_loss,
+            sequence_lengths=self.sequence_lengths,
+        )
+        loss.backward()
+        reference = self.estimate.clone().requires_grad_()
+        torch.mean(torch.stack([
+            pt.ops.losses.pit_loss(
+                e[:, :l], t[:, :l], axis=0,
+                loss_fn=pt.ops.losses.si_sdr_loss,
+            )
+            for e, t, l in zip(reference, self.target, self.sequence_lengths)
+        ])).backward()
+        np.testing.assert_allclose(estimate.grad, reference.grad, atol=1e-8)
+
+    def test_float32_precision(self):
+        # The loss matrix has a low precision for good estimates in float32,
+        # the returned loss not.
+        target = self.target.float()
+        estimate = target[:, (2, 0, 1)] + 1e-5 * torch.randn(target.shape)
+        for loss_fn in [pt.ops.losses.sdr_loss, pt.ops.losses.si_sdr_loss]:
+            with self.subTest(loss_fn=loss_fn.__name__):
+                loss = pt.ops.losses.batched_pit_loss(
+                    estimate, target, loss_fn, reduction=None)
+                reference = torch.stack([
+                    pt.ops.losses.pit_loss(e, t, axis=0, loss_fn=loss_fn)
+                    for e, t in zip(estimate, target)
+                ])
+                np.testing.assert_allclose(loss, reference, rtol=1e-6)
+
+
+class TestBatchedPitLossMultipleSignalAxes(
+        TestBatchedPermutationInvariantTrainingLoss
+):
+    # The loss functions reduce only the last axis (F), the other signal
+    # axes (T) are reduced like the speaker axis. si_sdr_loss in pit_loss
+    # requires T < 10.
+    shape = (4, 3, 8, 50)  # (B, K, T, F)
+    sequence_lengths = [8, 6, 3, 8]
+
+
 class TestKLLoss(unittest.TestCase):
     def test_against_multivariate_multivariate(self):
         B = 500
@@ -63,3 +63,109 @@ class TestPackModule(unittest.TestCase):
         actual = pts.ops.pack_padded_sequence(self.padded, self.lengths)
         assert isinstance(actual, type(self.packed))
         np.testing.assert_equal(actual.data.numpy(), self.packed.data.numpy())
+
+
+class TestSequenceMask(unittest.TestCase):
+    def test_matches_compute_mask(self):
+        x = torch.randn(3, 4, 6, 2)
+        for sequence_lengths in [[6, 2, 4], np.array([1, 6, 6]),
+                                 torch.tensor([3, 3, 5])]:
+            for batch_axis, sequence_axis in [(0, 2), (0, -2), (1, 2)]:
+                if batch_axis == 1:
+                    x_ = x.transpose(0, 1)
+                else:
+                    x_ = x
+                mask = pts.ops.compute_sequence_mask(
+                    x_, sequence_lengths, batch_axis, sequence_axis)
+                self.assertEqual(mask.dtype, torch.bool)
+                self.assertEqual(mask.dim(), x_.dim())
+                np.testing.assert_equal(
+                    mask.expand(x_.shape).float().numpy(),
+                    pts.ops.compute_mask(
+                        x_, sequence_lengths, batch_axis, sequence_axis
+                    ).numpy()
+                )
+
+    def test_no_padding(self):
+        x = torch.randn(3, 6)
+        self.assertIsNone(pts.ops.compute_sequence_mask(x, None))
+        self.assertIsNone(pts.ops.compute_sequence_mask(x, [6, 6, 6]))
+        np.testing.assert_equal(
+            pts.ops.compute_mask(x, [6, 6, 6]).numpy(), np.ones((3, 6)))
+
+    def test_cache(self):
+        x = torch.randn(3, 6)
+        lengths = torch.tensor([1, 2, 6])
+        with pts.ops.mask_cache():
+            mask = pts.ops.compute_sequence_mask(x, lengths)
+            with pts.ops.mask_cache():
+                self.assertIs(pts.ops.compute_sequence_mask(x, lengths), mask)
+            self.assertIs(pts.ops.compute_sequence_mask(x, lengths), mask)
+            # Different lengths, sequence size or axes
+            self.assertIsNot(
+                pts.ops.compute_sequence_mask(x, torch.tensor([1, 2, 6])),
+                mask)
+            self.assertIsNot(
+                pts.ops.compute_sequence_mask(x[:, :5], lengths), mask)
+            self.assertIsNot(
+                pts.ops.compute_sequence_mask(x[..., None], lengths), mask)
+            self.assertIs(
+                pts.ops.compute_sequence_mask(x, [1, 2, 5]),
+                pts.ops.compute_sequence_mask(x, np.array([1, 2, 5])),
+            )
+        self.assertIsNot(pts.ops.compute_sequence_mask(x, lengths), mask)
+
+
+class TestSequenceReduction(unittest.TestCase):
+    def setUp(self):
+        self.lengths = [4, 7, 1, 5]
+        self.sequence = [torch.randn(length, 3, 2) for length in self.lengths]
+        self.packed = torch.nn.utils.rnn.pack_sequence(
+            self.sequence, enforce_sorted=False)
+
+    def test_packed_batch_sizes_to_sequence_lengths(self):
+        packed = torch.nn.utils.rnn.pack_sequence(
+            self.sequence, enforce_sorted=False)
+        self.assertEqual(
+            pts.ops.packed_batch_sizes_to_sequence_lengths(
+                packed.batch_sizes),
+            sorted(self.lengths, reverse=True),
+        )
+
+    def test_reduction_over_time(self):
+        for function in [torch.sum, torch.mean, torch.amax, torch.amin]:
+            for axis, keepdims in [((0,), False), ((0, 3), False),
+                                   ((0, 2, 3), True), ((0, 3), True)]:
+                actual = pts.ops.sequence_reduction(
+                    function, self.packed, axis=axis, keepdims=keepdims)
+                data_axis = [a - 1 if a > 0 else 0 for a in axis]
+                expected = [
+                    function(s, dim=data_axis, keepdim=keepdims)
+                    for s in self.sequence
+                ]
+                if keepdims:
+                    assert isinstance(
+                        actual, torch.nn.utils.rnn.PackedSequence)
+                    # Each sequence has a single frame
+                    actual = torch.cat(pts.ops.unpack_sequence(actual))
+                    expected = torch.cat(expected)
+                else:
+                    expected = torch.stack(expected)
+                np.testing.assert_allclose(
+                    actual.numpy(), expected.numpy(), rtol=1e-6, atol=1e-6,
+                    err_msg=f'{function} {axis} {keepdims}'
+                )
+
+    def test_generic_reduction_over_time(self):
+        actual = pts.ops.sequence_reduction(
+            torch.std, self.packed, axis=(0, 2))
+        expected = torch.stack([torch.std(s, dim=(0, 1)) for s in self.sequence])
+        np.testing.assert_allclose(actual.numpy(), expected.numpy(), rtol=1e-6)
+
+    def test_gradient(self):
+        data = self.packed.data.clone().requires_grad_()
+        packed = self.packed._replace(data=data)
+        pts.ops.sequence_reduction(torch.amax, packed, axis=(0, 2, 3)).sum(
+            ).backward()
+        # One maximum per sequence
+        self.assertEqual(int(data.grad.sum()), len(self.lengths))
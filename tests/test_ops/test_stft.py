@@ -1,12 +1,17 @@
 import unittest
 
+import pytest
+
 import numpy as np
 import paderbox.testing as tc
 import torch
 from paderbox.io import load_audio
 from paderbox.testing.testfile_fetcher import get_file_path
 from paderbox.transform import stft, istft
-from padertorch.ops import STFT
+from paderbox.transform.module_stft import (
+    _biorthogonal_window_fastest as pb_biorthogonal_window
+)
+from padertorch.ops import STFT, StreamingSTFT, StreamingISTFT
 
 
 class TestSTFTMethods(unittest.TestCase):
@@ -131,3 +136,85 @@ class TestSmallerSTFTMethods(TestSTFTMethods):
         x = torch.rand(size=[1021])
         X = stft(x)
         tc.assert_equal(X.shape, (53, self.fbins * 2))
+
+
+@pytest.mark.parametrize('fading', ['full', 'half', False])
+@pytest.mark.parametrize('pad', [True, False])
+@pytest.mark.parametrize('complex_representation', ['concat', 'stacked'])
+@pytest.mark.parametrize('shift,window_length', [(256, 1024), (160, 400)])
+@pytest.mark.parametrize('backend', ['conv', 'fft'])
+def test_streaming_stft(fading, pad, complex_representation, shift,
+                        window_length, backend):
+    stft = STFT(
+        512 if window_length <= 512 else 1024, shift,
+        window_length=window_length, fading=fading, pad=pad,
+        complex_representation=complex_representation, backend=backend,
+    )
+    signal = torch.randn(2, 3, 5123, dtype=torch.float64)
+    rng = np.random.RandomState(0)
+    chunks = torch.split(
+        signal, list(np.diff([0, *sorted(rng.choice(5123, 20)), 5123])),
+        dim=-1
+    )
+
+    stream = StreamingSTFT(stft)
+    frames = torch.cat(
+        [stream(c) for c in chunks] + [stream.flush()],
+        dim=-3 if complex_representation == 'stacked' else -2
+    )
+    np.testing.assert_allclose(frames, stft(signal), atol=1e-10)
+
+    frame_axis = -3 if complex_representation == 'stacked' else -2
+    num_frames = frames.shape[frame_axis]
+    sizes = np.diff([0, *sorted(rng.choice(num_frames, 5)), num_frames])
+    stream = StreamingISTFT(stft)
+    time_signal = torch.cat([
+        stream(f) for f in torch.split(frames, list(sizes), frame_axis)
+    ] + [stream.flush()], dim=-1)
+    np.testing.assert_allclose(time_signal, stft.inverse(frames), atol=1e-10)
+
+
+@pytest.mark.parametrize('size,shift,window_length', [
+    (512, 128, 512), (1024, 256, 1024), (512, 160, 400), (4096, 1024, 4096),
+])
+@pytest.mark.parametrize('complex_representation', ['concat', 'stacked'])
+def test_fft_backend(size, shift, window_length, complex_representation):
+    kwargs = dict(
+        window_length=window_length,
+        complex_representation=complex_representation,
+    )
+    stft_conv = STFT(size, shift, backend='conv', **kwargs)
+    stft_fft = STFT(size, shift, backend='fft', **kwargs)
+
+    signal = torch.randn(2, 3, 8000, dtype=torch.float64)
+    X = stft_fft(signal)
+    np.testing.assert_allclose(X, stft_conv(signal), atol=1e-8)
+    np.testing.assert_allclose(
+        stft_fft.inverse(X), stft_conv.inverse(X), atol=1e-10)
+
+    X_np = stft(signal.numpy(), size, shift, window_length=window_length)
+    if complex_representation == 'concat':
+        X_np = np.concatenate([X_np.real, X_np.imag], axis=-1)
+    else:
+        X_np = np.stack([X_np.real, X_np.imag], axis=-1)
+    np.testing.assert_allclose(X, X_np, atol=1e-8)
+
+
+def test_kernel_construction():
+    from padertorch.ops._stft import get_stft_kernel, get_istft_kernel
+    size, shift, length = 16, 4, 12
+    window = np.random.rand(length)
+
+    kernel = get_stft_kernel(size, window).numpy()[:, 0]
+    n, k = np.arange(size // 2 + 1)[:, None], np.arange(length)
+    dft = np.exp(-2j * np.pi / size * n * k) * window
+    np.testing.assert_allclose(
+        kernel, np.concatenate([dft.real, dft.imag]), atol=1e-12)
+
+    kernel_real, kernel_imag = get_istft_kernel(size, shift, window)
+    synthesis_window = pb_biorthogonal_window(window, shift) / size
+    f = np.arange(size)[:, None]
+    idft = np.exp(2j * np.pi / size * f * k) * synthesis_window
+    np.testing.assert_allclose(kernel_real.numpy()[:, 0], idft.real, atol=1e-12)
+    np.testing.assert_allclose(
+        kernel_imag.numpy()[:, 0], -idft.imag, atol=1e-12)
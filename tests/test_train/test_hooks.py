@@ -297,19 +297,23 @@ def test_validation_hook_create_snapshot_flag():
     assert model.validation_create_snapshot_log == [True, False] * 11
 
 
-def test_backoff():
+@pytest.mark.parametrize('async_checkpoint', [False, True])
+def test_backoff(async_checkpoint):
     ds = [0]
     with tempfile.TemporaryDirectory() as tmp_dir:
         optimizer = pt.optimizer.Adam()
         model = DummyModel([3, 2, 1, 0, 1, 1, 1, 1, 1, 1], tmp_dir, optimizer)
         trainer = pt.Trainer(
-            model, tmp_dir, optimizer, stop_trigger=(10, 'epoch')
+            model, tmp_dir, optimizer, stop_trigger=(10, 'epoch'),
+            async_checkpoint=async_checkpoint,
         )
         trainer.register_validation_hook(
             ds, max_checkpoints=None,
             n_back_off=1, back_off_patience=2, early_stopping_patience=2
         )
         trainer.train(ds)
+        # The background thread of the async checkpoints is stopped
+        assert trainer._checkpoint_executor is None
     assert model.ckpt_log == [
         [],
         ['ckpt_0.pth', 'ckpt_best_loss.pth', 'ckpt_latest.pth'],
@@ -448,3 +452,282 @@ def test_LRSchedulerHook():
         hook.pre_step(trainer)
     assert lr_scheduler.calls_iteration == [0, 2, 4, 6, 8, 10]
     assert lr_scheduler.calls_epoch == [0, 0, 1, 2, 2, 3]
+
+
+def test_summary_hook_deferred_scalars():
+    hook = pt.train.hooks.SummaryHook((1, 'iteration'))
+
+    hook.update_summary({'scalars': {'a': torch.tensor(1.), 'b': 2}})
+    hook.update_summary({'scalars': {
+        'a': torch.tensor([2., 3.])[1], 'b': torch.tensor([3, 4])
+    }})
+
+    # Tensors stay tensors until the summary is finalized
+    assert all(map(torch.is_tensor, hook.summary['scalars']['a']))
+    assert hook.summary['scalars']['a'][1]._base is None
+
+    class DummyTrainer:
+        iteration = 2
+        train_timer = pt.trainer.ContextTimerDict()
+
+        class Model(pt.Model):
+            def forward(self, inputs): pass
+            def review(self, inputs, outputs): pass
+
+            def modify_summary(self, summary):
+                return summary
+        model = Model()
+
+    hook.finalize_summary(DummyTrainer())
+    assert hook.summary['scalars']['a'] == [1., 3.]
+    assert hook.summary['scalars']['b'] == [2, 3, 4]
+
+
+@pytest.mark.parametrize('defer_scalar_sync', [True, False])
+def test_non_finite_loss(defer_scalar_sync):
+    class Model(DummyModel):
+        def review(self, inputs, outputs):
+            # Finite gradient, but infinite loss.
+            return {'loss': self.lin.weight.sum() + float('inf')}
+
+    ds = [0., 1., 2.]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        model = Model([], tmp_dir, optimizer)
+        trainer = pt.Trainer(
+            model, tmp_dir, optimizer, stop_trigger=(2, 'epoch'),
+            summary_trigger=(1, 'epoch'), defer_scalar_sync=defer_scalar_sync,
+        )
+        with pytest.raises(RuntimeError, match='not finite'):
+            trainer.train(ds)
+        assert list(Path(tmp_dir).glob('log/error_state_*.pth'))
+        # The first step failed
+        review = torch.load(Path(tmp_dir) / 'log/error_state_review.pth')
+        assert not np.isfinite(review['scalars']['loss'])
+
+
+@pytest.mark.parametrize('defer_scalar_sync', [True, False])
+def test_non_finite_gradient(defer_scalar_sync):
+    class Model(DummyModel):
+        def review(self, inputs, outputs):
+            # Finite loss, but non finite gradient.
+            w = self.lin.weight
+            return {'loss': torch.sqrt((w - w.detach()).abs()).sum()}
+
+    ds = [0., 1., 2.]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        model = Model([], tmp_dir, optimizer)
+        trainer = pt.Trainer(
+            model, tmp_dir, optimizer, stop_trigger=(2, 'epoch'),
+            summary_trigger=(1, 'epoch'), defer_scalar_sync=defer_scalar_sync,
+        )
+        with pytest.raises(RuntimeError, match='grad_norm.* is not finite'):
+            trainer.train(ds)
+        assert list(Path(tmp_dir).glob('log/error_state_*.pth'))
+        if defer_scalar_sync:
+            review = torch.load(Path(tmp_dir) / 'log/error_state_review.pth')
+            assert not np.isfinite(review['scalars']['grad_norm'])
+        # The optimizer skipped the updates with a non finite gradient
+        assert torch.isfinite(model.lin.weight).all()
+
+
+def test_summary_hook_deferred_histogram():
+    hook = pt.train.hooks.SummaryHook((1, 'iteration'))
+    hook.update_summary({'histograms': {
+        'a': torch.tensor([1.]), 'b': torch.tensor([1., 2.]),
+    }})
+    hook.update_summary({'histograms': {'a': torch.tensor([2.])}})
+    assert all(map(torch.is_tensor, hook.summary['histograms']['a']))
+    assert hook.summary['histograms']['b'] == [1., 2.]
+    hook._scalars_to_host_and_check(None)
+    assert hook.summary['histograms']['a'] == [1., 2.]
+
+
+def test_summary_hook_skipped_steps_with_loss_scaler():
+    hook = pt.train.hooks.SummaryHook((1, 'iteration'))
+    for grad_norm in [1., float('inf'), 3.]:
+        hook.update_summary({
+            'scalars': {
+                'loss': torch.tensor(1.),
+                'grad_norm': torch.tensor(grad_norm),
+                'grad_norm/param_group_0': torch.tensor(grad_norm),
+            },
+            'histograms': {'grad_norm_': torch.tensor([grad_norm])},
+        })
+    hook.update_summary({'scalars': {'enc_grad_norm': float('nan')}})
+    trainer = types.SimpleNamespace(loss_scaler=pt.optimizer.LossScaler())
+    hook._scalars_to_host_and_check(trainer)
+    scalars = hook.summary['scalars']
+    assert scalars['grad_norm'] == [1., 3.]
+    assert scalars['grad_norm/param_group_0'] == [1., 3.]
+    assert 'enc_grad_norm' not in scalars
+    assert scalars['loss'] == [1., 1., 1.]
+    assert hook.summary['histograms']['grad_norm_'] == [1., 3.]
+
+
+def test_async_checkpoint_snapshot():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        model = DummyModel([], tmp_dir, optimizer)
+        trainer = pt.Trainer(
+            model, tmp_dir, optimizer,
+            async_checkpoint=True, max_pending_checkpoints=2,
+        )
+        trainer.iteration = 0
+        trainer.checkpoint_dir.mkdir()
+
+        expected = {k: v.clone() for k, v in model.state_dict().items()}
+        trainer.save_checkpoint()
+        # The training continues while the checkpoint is written
+        with torch.no_grad():
+            model.lin.weight.add_(1)
+        trainer.wait_for_checkpoints()
+
+        state_dict = torch.load(trainer.checkpoint_dir / 'ckpt_latest.pth')
+        for key, value in expected.items():
+            np.testing.assert_equal(
+                state_dict['model'][key].numpy(), value.numpy())
+
+
+def test_async_checkpoint_reuses_host_buffers():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        model = DummyModel([], tmp_dir, optimizer)
+        trainer = pt.Trainer(model, tmp_dir, optimizer, async_checkpoint=True)
+        trainer.checkpoint_dir.mkdir()
+
+        trainer.iteration = 0
+        trainer.save_checkpoint()
+        trainer.wait_for_checkpoints()
+        buffers, = trainer._host_buffers
+        weight = buffers[('model', 'lin.weight')]
+
+        trainer.iteration = 1
+        with torch.no_grad():
+            model.lin.weight.add_(1)
+        trainer.save_checkpoint()
+        trainer.wait_for_checkpoints()
+        assert trainer._host_buffers[0][('model', 'lin.weight')] is weight
+
+        state_dict = torch.load(trainer.checkpoint_dir / 'ckpt_1.pth')
+        np.testing.assert_equal(
+            state_dict['model']['lin.weight'].numpy(),
+            model.lin.weight.detach().numpy(),
+        )
+
+
+def test_profiler_hook():
+    class Model(pt.Model):
+        def __init__(self):
+            super().__init__()
+            self.encoder = torch.nn.Sequential(
+                torch.nn.Linear(10, 32), torch.nn.ReLU())
+            self.decoder = torch.nn.Linear(32, 10)
+
+        def forward(self, inputs):
+            return self.decoder(self.encoder(torch.as_tensor(inputs)))
+
+        def review(self, inputs, outputs):
+            return {'loss': outputs.pow(2).mean()}
+
+    ds = [np.random.randn(4, 10).astype(np.float32) for _ in range(10)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        trainer = pt.Trainer(
+            Model(), tmp_dir, pt.optimizer.Adam(),
+            stop_trigger=(10, 'iteration'),
+        )
+        writer = MagicMock()
+        trainer.writer_cls = lambda *args, **kwargs: writer
+        trainer.register_hook(pt.train.hooks.ProfilerHook(
+            (6, 'iteration'), num_steps=3, warmup_steps=1))
+        trainer.train(ds, progress_bar=False, device='cpu')
+
+        profiler_dir = tmp_dir / 'profiler'
+        assert sorted(p.name for p in profiler_dir.glob('*')) == [
+            'modules_1.txt', 'modules_7.txt', 'operators_1.txt',
+            'operators_7.txt', 'trace_1.json', 'trace_7.json',
+        ]
+        trace = pb.io.load_json(profiler_dir / 'trace_1.json')
+        names = {event.get('name') for event in trace['traceEvents']}
+        assert {'module::encoder', 'module::encoder.0', 'module::decoder',
+                'aten::addmm'} <= names, names
+        assert 'encoder.0' in (profiler_dir / 'modules_1.txt').read_text()
+        assert 'aten::addmm' in (profiler_dir / 'operators_1.txt').read_text()
+
+        # The hooks of the modules are removed
+        assert not hasattr(trainer.model.encoder, '_profiler_hook_name')
+        assert len(trainer.model.encoder._forward_hooks) == 0
+
+        tags = {call[0][0] for call in writer.add_scalar.call_args_list}
+        assert {
+            'profiler/time_per_step',
+            'profiler/time_per_step/encoder',
+            'profiler/time_per_step/encoder.0',
+            'profiler/memory_per_step/decoder',
+        } <= tags, tags
+
+
+def test_resource_monitor():
+    import lazy_dataset
+    from padertorch.data import ProcessPrefetch
+
+    ds = lazy_dataset.new([np.full(3, i, dtype=np.float32) for i in range(8)])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        trainer = pt.Trainer(
+            DummyModel([], tmp_dir, optimizer), tmp_dir, optimizer,
+            stop_trigger=(8, 'iteration'), summary_trigger=(4, 'iteration'),
+            monitor_resources=True,
+        )
+        writer = MagicMock()
+        trainer.writer_cls = lambda *args, **kwargs: writer
+        trainer.train(
+            ds.apply(ProcessPrefetch(num_workers=2, buffer_size=4)),
+            progress_bar=False, device='cpu',
+        )
+
+        scalars = {}
+        for call in writer.add_scalar.call_args_list:
+            tag, value, iteration = call[0]
+            scalars.setdefault(tag, []).append(value)
+        for tag in [
+            'training_resources/max_rss',
+            'training_resources/python_allocated_blocks',
+            'training_resources/python_allocated_blocks_growth',
+            'training_resources/data_queue_depth',
+        ]:
+            assert len(scalars[tag]) == 2, (tag, scalars)
+        assert all(v > 0 for v in scalars['training_resources/max_rss'])
+        assert all(
+            0 <= v <= 4 for v in scalars['training_resources/data_queue_depth'])
+        assert len(trainer.resource_monitor.samples) == 0
+
+
+@pytest.mark.parametrize('action', ['warn', 'stop'])
+def test_memory_watchdog_hook(action):
+    ds = [0., 1., 2., 3.]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        optimizer = pt.optimizer.Adam()
+        trainer = pt.Trainer(
+            DummyModel([], tmp_dir, optimizer), tmp_dir, optimizer,
+            stop_trigger=(2, 'epoch'), monitor_resources=True,
+        )
+        trainer.writer_cls = lambda *args, **kwargs: MagicMock()
+        trainer.register_hook(pt.train.hooks.MemoryWatchdogHook(
+            max_rss=1, action=action))
+        if action == 'warn':
+            with pytest.warns(UserWarning, match='exceeds the budget') as w:
+                trainer.train(ds, progress_bar=False, device='cpu')
+            # Only one warning, while the usage stays above the budget
+            assert len(w) == 1, [str(m.message) for m in w]
+            assert trainer.iteration == 8, trainer.iteration
+        else:
+            trainer.train(ds, progress_bar=False, device='cpu')
+            # Stopped before the second iteration with a final checkpoint
+            assert trainer.iteration == 1, trainer.iteration
+            assert (trainer.checkpoint_dir / 'ckpt_1.pth').exists()
+
+    with pytest.raises(ValueError, match='action'):
+        pt.train.hooks.MemoryWatchdogHook(max_rss=1, action='raise')
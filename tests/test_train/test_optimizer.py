@@ -1,6 +1,9 @@
-import padertorch as pt
+import numpy as np
+import pytest
 import torch
 
+import padertorch as pt
+
 
 def test_frad_norm():
     lin = torch.nn.Linear(16, 8)
@@ -15,3 +18,113 @@ def test_frad_norm():
     )
     assert grad_norm == grad_norm_ref and grad_norm_ref > 0., \
         (grad_norm, grad_norm_ref)
+
+
+def get_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(
+        torch.nn.Linear(16, 8), torch.nn.ReLU(), torch.nn.Linear(8, 4)
+    )
+
+
+def backward(model):
+    model(torch.randn(5, 16)).pow(2).sum().backward()
+
+
+@pytest.mark.parametrize('fused', [None, False])
+@pytest.mark.parametrize('optimizer', [pt.optimizer.Adam, pt.optimizer.SGD])
+def test_clip_grad_and_step(optimizer, fused):
+    model = get_model()
+    model_ref = get_model()
+    opti = optimizer(gradient_clipping=0.1, fused=fused)
+    opti.set_parameters(model.parameters())
+    opti_ref = optimizer.optimizer_cls(
+        model_ref.parameters(), **{
+            k: v for k, v in opti.optimizer_kwargs.items() if k != 'fused'
+        }
+    )
+    for _ in range(3):
+        torch.manual_seed(1)
+        backward(model)
+        torch.manual_seed(1)
+        backward(model_ref)
+
+        grad_norm = opti.clip_grad()
+        grad_norm_ref = torch.nn.utils.clip_grad_norm_(
+            model_ref.parameters(), 0.1)
+        np.testing.assert_allclose(grad_norm, grad_norm_ref, rtol=1e-6)
+        for p, p_ref in zip(model.parameters(), model_ref.parameters()):
+            np.testing.assert_allclose(p.grad, p_ref.grad, rtol=1e-5)
+
+        opti.step()
+        opti_ref.step()
+        opti.zero_grad()
+        opti_ref.zero_grad()
+    for p, p_ref in zip(model.parameters(), model_ref.parameters()):
+        np.testing.assert_allclose(
+            p.detach(), p_ref.detach(), rtol=1e-5, atol=1e-7)
+
+
+def test_param_group_grad_norms():
+    model = get_model()
+    opti = pt.optimizer.Adam(gradient_clipping=None)
+    opti.set_parameters(model.parameters())
+    opti.optimizer.add_param_group({'params': []})
+    backward(model)
+    grad_norm = opti.clip_grad()
+    assert len(opti.param_group_grad_norms) == 2
+    np.testing.assert_allclose(opti.param_group_grad_norms[0], grad_norm)
+    assert opti.param_group_grad_norms[1] == 0
+    # Without clipping the gradients are not changed
+    np.testing.assert_allclose(
+        grad_norm, torch.nn.utils.clip_grad_norm_(model.parameters(), 1e10))
+
+
+@pytest.mark.parametrize('fused', [None, False])
+def test_skip_non_finite_step(fused):
+    model = get_model()
+    opti = pt.optimizer.Adam(gradient_clipping=1., fused=fused)
+    opti.set_parameters(model.parameters())
+    params = [p.detach().clone() for p in model.parameters()]
+
+    backward(model)
+    model[0].weight.grad[0, 0] = float('nan')
+    assert not torch.isfinite(opti.clip_grad())
+    opti.step()
+    opti.zero_grad()
+    for p, p_ref in zip(model.parameters(), params):
+        assert torch.equal(p, p_ref)
+
+    backward(model)
+    assert torch.isfinite(opti.clip_grad())
+    opti.step()
+    for p, p_ref in zip(model.parameters(), params):
+        assert not torch.equal(p, p_ref)
+    assert opti.optimizer.state[model[0].weight]['step'] == 1
+
+
+@pytest.mark.parametrize('optimizer', [pt.optimizer.Adam, pt.optimizer.SGD])
+def test_not_fused_by_default(optimizer):
+    opti = optimizer()
+    opti.set_parameters(get_model().parameters())
+    assert not any(
+        param_group.get('fused') for param_group in opti.optimizer.param_groups
+    )
+
+
+def test_load_non_fused_state_dict():
+    # Checkpoints of the default torch Adam have `fused=None` in the param
+    # groups, which overwrites the fused setting of the optimizer.
+    model = get_model()
+    opti_ref = torch.optim.Adam(model.parameters())
+    backward(model)
+    opti_ref.step()
+    opti_ref.zero_grad()
+
+    opti = pt.optimizer.Adam(gradient_clipping=1.)
+    opti.set_parameters(model.parameters())
+    opti.load_state_dict(opti_ref.state_dict())
+    backward(model)
+    assert torch.isfinite(opti.clip_grad())
+    opti.step()
+    assert opti.optimizer.state[model[0].weight]['step'] == 2
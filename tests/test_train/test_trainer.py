@@ -664,3 +664,409 @@ def test_released_tensors():
         )
         t.register_hook(ReleaseTestHook())  # This hook will do the tests
         t.train(tr_dataset)
+
+
+class LinearModel(pt.Model):
+    def __init__(self):
+        super().__init__()
+        self.l = torch.nn.Linear(3, 1)
+
+    def forward(self, inputs):
+        return self.l(torch.as_tensor(inputs))
+
+    def review(self, inputs, output):
+        return {'loss': (output ** 2).sum()}
+
+
+def _train_distributed(rank, world_size, storage_dir, dataset):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = '29512'
+
+    torch.manual_seed(rank)  # Different init, rank 0 is broadcast
+    t = pt.DistributedTrainer(
+        LinearModel(),
+        optimizer=pt.optimizer.SGD(lr=0.1),
+        storage_dir=storage_dir,
+        stop_trigger=(2, 'epoch'),
+        summary_trigger=(1, 'epoch'),
+        checkpoint_trigger=(1, 'epoch'),
+        rank=rank,
+        world_size=world_size,
+    )
+    t.register_validation_hook(dataset)
+    t.train(dataset, progress_bar=False)
+    torch.save(t.model.state_dict(), Path(storage_dir) / f'rank_{rank}.pth')
+
+
+def test_distributed_trainer():
+    world_size = 2
+    dataset = [np.random.randn(3).astype(np.float32) for _ in range(5)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        torch.multiprocessing.spawn(
+            _train_distributed,
+            args=(world_size, str(tmp_dir / 'distributed'), dataset),
+            nprocs=world_size,
+        )
+        state_dicts = [
+            torch.load(tmp_dir / 'distributed' / f'rank_{rank}.pth')
+            for rank in range(world_size)
+        ]
+
+        # The gradients of the ranks are summed, i.e. the same as a virtual
+        # minibatch. The last example is dropped, because rank 1 has no
+        # example for it.
+        torch.manual_seed(0)
+        t = pt.Trainer(
+            LinearModel(),
+            optimizer=pt.optimizer.SGD(lr=0.1),
+            storage_dir=str(tmp_dir / 'single'),
+            stop_trigger=(2, 'epoch'),
+            virtual_minibatch_size=world_size,
+        )
+        t.train(dataset[:4], progress_bar=False, device='cpu')
+
+        for state_dict in state_dicts:
+            for key, value in t.model.state_dict().items():
+                np.testing.assert_allclose(
+                    state_dict[key].numpy(), value.numpy(), rtol=1e-5)
+
+        # Only rank 0 writes summaries and checkpoints
+        storage_dir = tmp_dir / 'distributed'
+        assert len(list(storage_dir.glob('*tfevents*'))) == 1
+        assert (storage_dir / 'checkpoints' / 'ckpt_latest.pth').exists()
+        assert 'rng_states' in torch.load(
+            storage_dir / 'checkpoints' / 'ckpt_latest.pth')
+
+
+def test_shard_dataset(monkeypatch):
+    import lazy_dataset
+    from padertorch.train.trainer import _shard_dataset
+
+    # Required by the prefetch of lazy_dataset
+    monkeypatch.setenv('OMP_NUM_THREADS', '1')
+    monkeypatch.setenv('MKL_NUM_THREADS', '1')
+    world_size = 3
+    loaded = []
+
+    def load(example):
+        loaded.append(example)
+        return example
+
+    dataset = lazy_dataset.new(list(range(20))).shuffle(reshuffle=True)
+    dataset = dataset.map(load).prefetch(2, 4, backend='t').batch(2)
+    assert not dataset.indexable
+
+    examples = []
+    for rank in range(world_size):
+        loaded.clear()
+        shard = _shard_dataset(dataset, rank, world_size)
+        shard_examples = [e for batch in shard for e in batch]
+        # Each rank only loads its own examples
+        assert sorted(loaded) == sorted(shard_examples)
+        assert sorted(shard_examples) == list(range(rank, 20, world_size))
+        examples.extend(shard_examples)
+    assert sorted(examples) == list(range(20))
+
+    # Fallback for iterables without a length: skip the other examples
+    assert _shard_dataset(iter(range(20)), 0, world_size) is None
+
+
+class FailingModel(LinearModel):
+    def __init__(self, failure=None):
+        super().__init__()
+        self.failure = failure
+        self.num_reviews = 0
+
+    def review(self, inputs, output):
+        self.num_reviews += 1
+        loss = (output ** 2).sum()
+        if self.num_reviews == 3:
+            if self.failure == 'exception':
+                raise ValueError('Failure of the model')
+            elif self.failure == 'inf':
+                loss = loss + float('inf')
+        return {'loss': loss}
+
+
+def _train_distributed_failure(
+        rank, world_size, storage_dir, port, failure, defer_scalar_sync,
+):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+
+    t = pt.DistributedTrainer(
+        FailingModel(failure if rank == 1 else None),
+        optimizer=pt.optimizer.SGD(lr=0.1),
+        storage_dir=storage_dir,
+        stop_trigger=(2, 'epoch'),
+        summary_trigger=(1, 'epoch'),
+        defer_scalar_sync=defer_scalar_sync,
+        rank=rank,
+        world_size=world_size,
+    )
+    dataset = [np.ones(3, dtype=np.float32)] * 8
+    try:
+        t.train(dataset, progress_bar=False)
+    except Exception as e:
+        (Path(storage_dir) / f'error_{rank}.txt').write_text(str(e))
+
+
+@pytest.mark.parametrize('port,failure,defer_scalar_sync', [
+    (29513, 'exception', True),
+    (29514, 'inf', True),
+    (29515, 'inf', False),
+])
+def test_distributed_trainer_failure(port, failure, defer_scalar_sync):
+    # When rank 1 fails, rank 0 has to raise instead of waiting for rank 1.
+    world_size = 2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        context = torch.multiprocessing.spawn(
+            _train_distributed_failure,
+            args=(world_size, tmp_dir, port, failure, defer_scalar_sync),
+            nprocs=world_size,
+            join=False,
+        )
+        for _ in range(120):
+            if context.join(timeout=1):
+                break
+        else:
+            for process in context.processes:
+                process.kill()
+            raise AssertionError('The ranks hang after a failure of rank 1')
+
+        errors = [
+            (Path(tmp_dir) / f'error_{rank}.txt').read_text()
+            for rank in range(world_size)
+        ]
+        assert 'Another rank' in errors[0] \
+            or 'on another rank' in errors[0], errors
+        if failure == 'exception':
+            assert 'Failure of the model' in errors[1], errors
+        else:
+            assert 'loss' in errors[1] and 'not finite' in errors[1], errors
+
+
+def test_mmap_checkpoint():
+    dataset = [np.random.randn(3).astype(np.float32) for _ in range(4)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+
+        def get_trainer(stop_trigger):
+            t = pt.Trainer(
+                LinearModel(),
+                optimizer=pt.optimizer.Adam(),
+                storage_dir=str(tmp_dir),
+                stop_trigger=stop_trigger,
+                checkpoint_format='mmap',
+            )
+            return t
+
+        t = get_trainer((1, 'epoch'))
+        t.train(dataset, progress_bar=False, device='cpu')
+        ckpt = tmp_dir / 'checkpoints' / 'ckpt_latest.pth'
+        assert pt.io.is_mmap_checkpoint(ckpt)
+
+        # Resume
+        t = get_trainer((2, 'epoch'))
+        t.train(dataset, progress_bar=False, device='cpu', resume=True)
+        assert t.iteration == 8, t.iteration
+
+        model = LinearModel().load_checkpoint(ckpt)
+        for key, value in t.model.state_dict().items():
+            np.testing.assert_equal(
+                model.state_dict()[key].numpy(), value.numpy())
+
+        checkpoint = pt.io.load_mmap_checkpoint(ckpt)
+        assert checkpoint['iteration'] == 8
+        assert set(checkpoint['optimizer']['state']) == {0, 1}
+
+
+def test_mmap_checkpoint_shared_storage():
+    weight = torch.randn(64, 32)
+    state = {
+        'encoder.weight': weight,
+        'decoder.weight': weight.detach(),  # tied weights
+        'transposed': weight.t(),
+        'row': weight[1],
+        'bfloat16': torch.arange(6, dtype=torch.bfloat16).view(2, 3)[:, 1:],
+        'empty': torch.zeros(0),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ckpt = Path(tmp_dir) / 'ckpt.pth'
+        pt.io.save_mmap_checkpoint(state, ckpt)
+        # The storage of the weight is written once
+        copies = Path(tmp_dir) / 'copies.pth'
+        pt.io.save_mmap_checkpoint(
+            {k: v.clone() for k, v in state.items()}, copies)
+        weight_size = weight.numel() * weight.element_size()
+        assert ckpt.stat().st_size < copies.stat().st_size - 2 * weight_size
+
+        loaded = pt.io.load_mmap_checkpoint(ckpt)
+        assert loaded.keys() == state.keys()
+        for key, value in state.items():
+            assert loaded[key].dtype == value.dtype, key
+            np.testing.assert_equal(
+                loaded[key].float().numpy(), value.float().numpy())
+        assert loaded['encoder.weight'].untyped_storage().data_ptr() \
+            == loaded['decoder.weight'].untyped_storage().data_ptr()
+        assert loaded['row'].untyped_storage().data_ptr() \
+            == loaded['transposed'].untyped_storage().data_ptr()
+
+
+class RegressionModel(pt.Model):
+    def __init__(self):
+        super().__init__()
+        self.net = torch.nn.Sequential(
+            torch.nn.Linear(8, 32), torch.nn.Tanh(), torch.nn.Linear(32, 1)
+        )
+        self.output_dtypes = set()
+
+    def forward(self, inputs):
+        output = self.net(torch.as_tensor(inputs['x']))
+        self.output_dtypes.add(output.dtype)
+        return output
+
+    def review(self, inputs, output):
+        target = torch.as_tensor(inputs['y'])
+        return {'loss': torch.nn.functional.mse_loss(output, target)}
+
+
+def get_regression_dataset(num_examples=64, batch_size=16):
+    rng = np.random.RandomState(0)
+    w = rng.randn(8, 1).astype(np.float32)
+    dataset = []
+    for _ in range(num_examples):
+        x = rng.randn(batch_size, 8).astype(np.float32)
+        dataset.append({'x': x, 'y': np.tanh(x @ w)})
+    return dataset
+
+
+def regression_loss(model, dataset):
+    with torch.no_grad():
+        return np.mean([
+            model.review(example, model(example))['loss'].item()
+            for example in dataset
+        ])
+
+
+@pytest.mark.parametrize('mixed_precision', [None, 'bfloat16', 'float16'])
+def test_mixed_precision(mixed_precision):
+    dataset = get_regression_dataset()
+    torch.manual_seed(0)
+    model = RegressionModel()
+    initial_loss = regression_loss(model, dataset)
+    model.output_dtypes.clear()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trainer = pt.Trainer(
+            model, tmp_dir, pt.optimizer.Adam(lr=1e-2),
+            stop_trigger=(5, 'epoch'), mixed_precision=mixed_precision,
+        )
+        trainer.train(dataset, progress_bar=False, device='cpu')
+
+        if mixed_precision is None:
+            assert trainer.model.output_dtypes == {torch.float32}
+        else:
+            assert trainer.model.output_dtypes == {
+                getattr(torch, mixed_precision)}
+        # The master weights stay in float32
+        for parameter in trainer.model.parameters():
+            assert parameter.dtype == torch.float32
+        assert regression_loss(trainer.model, dataset) < 0.2 * initial_loss
+
+        # The checkpoint can be loaded without mixed precision
+        ckpt = Path(tmp_dir) / 'checkpoints' / 'ckpt_latest.pth'
+        loaded = RegressionModel().load_checkpoint(ckpt)
+        for key, value in trainer.model.state_dict().items():
+            np.testing.assert_equal(
+                loaded.state_dict()[key].numpy(), value.numpy())
+
+        # Resume
+        trainer = pt.Trainer(
+            RegressionModel(), tmp_dir, pt.optimizer.Adam(lr=1e-2),
+            stop_trigger=(6, 'epoch'), mixed_precision=mixed_precision,
+        )
+        trainer.train(dataset, progress_bar=False, device='cpu', resume=True)
+        assert trainer.iteration == 6 * len(dataset), trainer.iteration
+        if mixed_precision == 'float16':
+            assert trainer.loss_scaler.scale == 2. ** 16
+
+
+def test_mixed_precision_loss_scaling():
+    dataset = get_regression_dataset(num_examples=4)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        torch.manual_seed(0)
+        trainer = pt.Trainer(
+            RegressionModel(), tmp_dir, pt.optimizer.Adam(),
+            stop_trigger=(1, 'epoch'), mixed_precision='float16',
+        )
+        # The scaled gradients overflow in the first steps, the steps are
+        # skipped and the scale is reduced.
+        trainer.loss_scaler.scale = torch.tensor(2. ** 127)
+        parameters = copy.deepcopy(trainer.model.state_dict())
+        trainer.train(dataset[:2], progress_bar=False, device='cpu')
+        assert trainer.loss_scaler.scale < 2. ** 127
+        for key, value in trainer.model.state_dict().items():
+            assert torch.isfinite(value).all()
+            if trainer.loss_scaler.scale == 2. ** 125:
+                np.testing.assert_equal(
+                    value.numpy(), parameters[key].numpy())
+
+    with pytest.raises(ValueError, match='mixed_precision'):
+        pt.Trainer(
+            RegressionModel(), tmp_dir, pt.optimizer.Adam(),
+            mixed_precision='float32',
+        )
+
+
+def test_mixed_precision_config():
+    config = pt.Trainer.get_config({
+        'model': {'factory': RegressionModel},
+        'storage_dir': 'dummy',
+        'mixed_precision': 'bfloat16',
+    })
+    assert config['mixed_precision'] == 'bfloat16'
+    trainer = pt.Trainer.from_config(config)
+    assert trainer.mixed_precision == 'bfloat16'
+    assert trainer.loss_scaler is None
+
+
+@pytest.mark.parametrize('key,value', [
+    ('defer_scalar_sync', True),
+    ('monitor_resources', True),
+    ('async_checkpoint', True),
+    ('max_pending_checkpoints', 2),
+    ('checkpoint_format', 'mmap'),
+])
+def test_config_arguments(key, value):
+    config = pt.Trainer.get_config({
+        'model': {'factory': RegressionModel},
+        'storage_dir': 'dummy',
+        key: value,
+    })
+    assert config[key] == value
+    trainer = pt.Trainer.from_config(config)
+    assert getattr(trainer, key) == value
+
+
+def test_distributed_config_arguments():
+    # Only the DistributedTrainer knows the rank and the world size
+    config = pt.Trainer.get_config({
+        'model': {'factory': RegressionModel},
+        'storage_dir': 'dummy',
+    })
+    assert 'rank' not in config and 'world_size' not in config
+    assert pt.Trainer.from_config(config).is_main_process
+
+    config = pt.DistributedTrainer.get_config({
+        'model': {'factory': RegressionModel},
+        'storage_dir': 'dummy',
+        'rank': 1,
+        'world_size': 2,
+    })
+    trainer = pt.DistributedTrainer.from_config(config)
+    assert (trainer.rank, trainer.world_size) == (1, 2)
+    assert not trainer.is_main_process